@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+""" Micro-benchmark for InterestingStringCollector over a corpus of real-world statements.
+
+    Reports the time per statement for parsing, visiting and parsing + visiting
+    (getInterestingStrings). Use it to check changes to the visitor for performance
+    regressions.
+
+    Usage: python benchmarks/bench_collector.py [--repeat 20] [--stdlib 50]
+"""
+
+import argparse
+import ast
+import glob
+import os
+import sys
+import sysconfig
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from string_extractor import StringExtractor
+from string_extractor.string_collector import InterestingStringCollector
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "statements.txt")
+
+
+def load_corpus():
+    statements = []
+    with open(CORPUS_FILE) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.endswith(":"):
+                line = line[2:] if line.startswith("elif") else line
+                line += "\n  pass"
+            statements.append(line)
+    return statements
+
+
+def load_stdlib_statements(number_of_modules):
+    """Returns the source code of all statements in the first modules of the standard library."""
+    statements = []
+    paths = sorted(glob.glob(os.path.join(sysconfig.get_paths()["stdlib"], "*.py")))
+    for path in paths[:number_of_modules]:
+        with open(path, encoding="utf-8", errors="replace") as file:
+            source = file.read()
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            continue
+        lines = source.split("\n")
+        for node in ast.walk(tree):
+            if isinstance(node, ast.stmt) and not hasattr(node, "body"):
+                end_lineno = getattr(node, "end_lineno", node.lineno)
+                statements.append("\n".join(lines[node.lineno - 1:end_lineno]).strip())
+    return [ statement for statement in statements if _is_parsable(statement) ]
+
+
+def _is_parsable(statement):
+    try:
+        ast.parse(statement)
+        return True
+    except SyntaxError:
+        return False
+
+
+def measure(function, items, repeat):
+    """Returns the best time per item (in microseconds) over a number of runs."""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1e6
+
+
+def visit(tree):
+    collector = InterestingStringCollector()
+    collector.visit(tree)
+    return collector.getCollectedStrings()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=20, help="number of runs (best run is reported)")
+    parser.add_argument("--stdlib", type=int, default=0,
+                        help="also benchmark statements from this number of standard library modules")
+    args = parser.parse_args()
+
+    corpora = [ ("corpus", load_corpus()) ]
+    if args.stdlib > 0:
+        corpora.append( ("stdlib", load_stdlib_statements(args.stdlib)) )
+
+    extractor = StringExtractor(False)
+    print("{:>8} {:>10} {:>12} {:>12} {:>14}".format("corpus", "statements", "parse us", "visit us",
+                                                        "extract us"))
+    for name, statements in corpora:
+        trees = [ ast.parse(statement) for statement in statements ]
+        parse_time = measure(ast.parse, statements, args.repeat)
+        visit_time = measure(visit, trees, args.repeat)
+        extract_time = measure(extractor.getInterestingStrings, statements, args.repeat)
+        print("{:>8} {:>10} {:>12.2f} {:>12.2f} {:>14.2f}".format(name, len(statements), parse_time,
+                                                                 visit_time, extract_time))
+
+
+if __name__ == '__main__':
+    main()
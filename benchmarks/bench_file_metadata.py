@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+""" Benchmark for processing a trace that covers a large module line by line.
+
+    Shows the time per traced line for modules of increasing length. Reading the
+    whole file for every line (the way line counts used to be determined) makes
+    the time per line grow with the file length; with the file metadata cache it
+    should stay roughly constant.
+
+    Usage: python benchmarks/bench_file_metadata.py [--sizes 2500,5000,10000,20000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from string_extractor import StringExtractor
+
+
+class LegacyLineCountExtractor(StringExtractor):
+    """Extractor that reads the whole file to count its lines for every processed line."""
+
+    def _preprocessLine(self, filename, lineNumber):
+        with open(filename, 'r') as file:
+            for count, line in enumerate(file):
+                pass
+        return super()._preprocessLine(filename, lineNumber)
+
+
+def generate_module(path, number_of_lines):
+    with open(path, "w") as file:
+        for i in range(number_of_lines // 2):
+            file.write("if value == \"string{}\":\n".format(i))
+            file.write("    result = {}\n".format(i))
+
+
+def time_trace(extractor, filename, line_numbers):
+    lines = [ (filename, line_number) for line_number in line_numbers ]
+    start = time.perf_counter()
+    extractor.get_batch(lines)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="2500,5000,10000,20000",
+                        help="comma-separated list of module lengths (in lines)")
+    parser.add_argument("--legacy-sample", type=int, default=500,
+                        help="number of lines to trace with the legacy line count (0 to disable)")
+    args = parser.parse_args()
+
+    print("{:>8} {:>12} {:>16} {:>16}".format("lines", "total (s)", "us/line", "legacy us/line"))
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [ int(size) for size in args.sizes.split(",") ]:
+            filename = os.path.join(directory, "module_{}.py".format(size))
+            generate_module(filename, size)
+
+            total = time_trace(StringExtractor(False), filename, range(1, size + 1))
+            legacy = ""
+            if args.legacy_sample > 0:
+                sample = range(1, min(size, args.legacy_sample) + 1)
+                legacy_total = time_trace(LegacyLineCountExtractor(False), filename, sample)
+                legacy = "{:.1f}".format(legacy_total / len(sample) * 1e6)
+
+            print("{:>8} {:>12.3f} {:>16.1f} {:>16}".format(size, total, total / size * 1e6, legacy))
+
+
+if __name__ == '__main__':
+    main()
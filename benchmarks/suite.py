@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+""" Benchmark suite and regression check for the extraction pipeline.
+
+    Each scenario runs in a separate process, so that it starts with cold caches and
+    its peak memory use can be measured. For each scenario, the suite reports the
+    throughput (lines per second), the median (p50) and 99th percentile (p99) latency
+    per line, and the peak resident set size of the process.
+
+    Scenarios:
+      large_module      : cold cache, a trace of every line of a large generated module
+      multiline         : cold cache, generated statements that span many lines
+      loop_trace        : a loop-heavy trace with few distinct lines
+      loop_collapsed    : the loop-heavy trace with collapsed output (get_batch)
+      warm_cache        : the trace of large_module, processed a second time
+      stdlib            : cold cache, every line of a set of standard library modules
+      preprocess        : _preprocessLine for every line of the standard library modules
+      collector         : getInterestingStrings for the statements in corpus/statements.txt
+      pickle_cache      : saving and loading a pickle persistent cache
+      sqlite_cache      : storing in and looking up from an SQLite persistent cache
+
+    The standard library modules are those of the Python version that runs the suite, so
+    results should only be compared between runs with the same Python version.
+
+    Usage:
+      python benchmarks/suite.py [--scenarios large_module,stdlib] [--repeat 3] [--quick]
+      python benchmarks/suite.py --save-baseline baseline.json
+      python benchmarks/suite.py --check baseline.json [--tolerance 0.25]
+
+    With --check, the suite exits with status 1 if the throughput of a scenario is lower
+    than in the baseline, or its latency or peak memory use is higher, by more than
+    the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from string_extractor import StringExtractor
+from string_extractor.cache_backends import SQLiteCacheBackend
+
+# The collector scenario uses the same statements as the collector micro-benchmark
+from bench_collector import load_corpus
+
+BASELINE_FORMAT_VERSION = 1
+STDLIB_MODULES = [ "argparse.py", "tarfile.py", "email/_header_value_parser.py", "json/decoder.py",
+                   "http/cookies.py", "configparser.py", "optparse.py", "shlex.py" ]
+
+# Metrics, and whether higher values are better
+METRICS = { "lines_per_second" : True,
+            "p50_us"           : False,
+            "p99_us"           : False,
+            "peak_rss_kb"      : False }
+# Latencies below this value (in microseconds) are dominated by timer overhead, and
+# aren't compared with the baseline
+LATENCY_NOISE_US = 1.0
+
+
+def generate_large_module(path, number_of_lines):
+    with open(path, "w") as file:
+        for i in range(number_of_lines // 4):
+            file.write("if value == \"string{}\" or value.startswith(\"prefix{}\"):\n".format(i, i))
+            file.write("    result = {}\n".format(i))
+            file.write("elif \"fragment{}\" in value:\n".format(i))
+            file.write("    result = compute(value, {})\n".format(i))
+
+
+def generate_multiline_module(path, number_of_statements, statement_length = 15):
+    with open(path, "w") as file:
+        for i in range(number_of_statements):
+            file.write("if (value == \"first{}\" or\n".format(i))
+            for j in range(statement_length - 2):
+                file.write("        value.endswith(\"suffix{}_{}\") or\n".format(i, j))
+            file.write("        value in [\"last{}\", other]):\n".format(i))
+            file.write("    result = call(value,\n")
+            file.write("                  \"argument{}\")\n".format(i))
+
+
+def stdlib_files():
+    directory = sysconfig.get_paths()["stdlib"]
+    return [ os.path.join(directory, name) for name in STDLIB_MODULES
+             if os.path.exists(os.path.join(directory, name)) ]
+
+
+def file_trace(filenames):
+    """Returns a trace with every line of each file."""
+    lines = []
+    for filename in filenames:
+        with open(filename, encoding="utf-8", errors="replace") as file:
+            number_of_lines = sum(1 for line in file)
+        lines.extend( [ (filename, line_number) for line_number in range(1, number_of_lines + 1) ] )
+    return lines
+
+
+def timed_lines(results):
+    """Consumes an iterable of per-line results, and returns the latency of each line."""
+    latencies = []
+    iterator = iter(results)
+    while True:
+        start = time.perf_counter()
+        try:
+            next(iterator)
+        except StopIteration:
+            return latencies
+        latencies.append(time.perf_counter() - start)
+
+
+def timed_calls(function, items):
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+class Scenarios:
+    """Scenarios, as methods that return the latency of each processed line in a single
+       run, or a 2-tuple (number of lines, total time) if latencies aren't measured."""
+
+    def __init__(self, directory, quick):
+        self.directory = directory
+        self.scale = 10 if quick else 1
+
+    def large_module(self):
+        path = os.path.join(self.directory, "large_module.py")
+        generate_large_module(path, 20000 // self.scale)
+        return timed_lines(StringExtractor().iter_batch(file_trace( [ path ] )))
+
+    def multiline(self):
+        path = os.path.join(self.directory, "multiline.py")
+        generate_multiline_module(path, 500 // self.scale)
+        return timed_lines(StringExtractor().iter_batch(file_trace( [ path ] )))
+
+    def loop_trace(self):
+        return timed_lines(StringExtractor().iter_batch(self._loopTrace()))
+
+    def loop_collapsed(self):
+        lines = self._loopTrace()
+        start = time.perf_counter()
+        StringExtractor().get_batch(lines, True)
+        return (len(lines), time.perf_counter() - start)
+
+    def warm_cache(self):
+        path = os.path.join(self.directory, "large_module.py")
+        generate_large_module(path, 20000 // self.scale)
+        lines = file_trace( [ path ] )
+        extractor = StringExtractor()
+        for result in extractor.iter_batch(lines):
+            pass
+        return timed_lines(extractor.iter_batch(lines))
+
+    def stdlib(self):
+        return timed_lines(StringExtractor().iter_batch(self._stdlibTrace()))
+
+    def preprocess(self):
+        extractor = StringExtractor(False)
+        return timed_calls(lambda line: extractor._preprocessLine(line[0], line[1]), self._stdlibTrace())
+
+    def collector(self):
+        extractor = StringExtractor(False)
+        return timed_calls(extractor.getInterestingStrings, load_corpus() * (100 // self.scale))
+
+    def pickle_cache(self):
+        cache_file = os.path.join(self.directory, "cache.dat")
+        lines = self._stdlibTrace()
+        extractor = StringExtractor(True, cache_file)
+        for result in extractor.iter_batch(lines):
+            pass
+        start = time.perf_counter()
+        extractor.save()
+        StringExtractor(True, cache_file)
+        return (len(lines), time.perf_counter() - start)
+
+    def sqlite_cache(self):
+        cache_file = os.path.join(self.directory, "cache.sqlite")
+        lines = self._stdlibTrace()
+        results = list(StringExtractor().iter_batch(lines))
+        extractor = StringExtractor(False)
+        digests = { filename : extractor._getFileDigest(filename) for (filename, line_number) in lines }
+
+        start = time.perf_counter()
+        backend = SQLiteCacheBackend(cache_file)
+        for (filename, line_number, result) in results:
+            backend.store(filename, digests[filename], line_number, result)
+        backend.save()
+        backend.close()
+        backend = SQLiteCacheBackend(cache_file)
+        for (filename, line_number) in lines:
+            backend.lookup(digests[filename], line_number)
+        backend.close()
+        return (len(lines), time.perf_counter() - start)
+
+    def _loopTrace(self):
+        path = os.path.join(self.directory, "loop_module.py")
+        generate_large_module(path, 200)
+        lines = file_trace( [ path ] )
+        return lines * (500 // self.scale)
+
+    def _stdlibTrace(self):
+        lines = file_trace(stdlib_files())
+        return lines[:len(lines) // self.scale]
+
+
+SCENARIOS = [ "large_module", "multiline", "loop_trace", "loop_collapsed", "warm_cache",
+              "stdlib", "preprocess", "collector", "pickle_cache", "sqlite_cache" ]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(name, repeat, quick):
+    """Runs a scenario in the current process, and returns its metrics of the run with
+       the highest throughput."""
+    best = None
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(repeat):
+            measurement = getattr(Scenarios(directory, quick), name)()
+            if isinstance(measurement, tuple):
+                (number_of_lines, total_time) = measurement
+                metrics = { "lines" : number_of_lines, "p50_us" : None, "p99_us" : None }
+            else:
+                latencies = sorted(measurement)
+                number_of_lines = len(latencies)
+                total_time = sum(latencies)
+                metrics = { "lines"  : number_of_lines,
+                            "p50_us" : percentile(latencies, 0.50) * 1e6,
+                            "p99_us" : percentile(latencies, 0.99) * 1e6 }
+            metrics["lines_per_second"] = number_of_lines / total_time if total_time > 0 else 0.0
+            if best is None or metrics["lines_per_second"] > best["lines_per_second"]:
+                best = metrics
+    best["peak_rss_kb"] = peak_rss_kb()
+    return best
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, and in kilobytes on Linux
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_suite(scenarios, repeat, quick):
+    """Runs each scenario in a separate process. Returns the results in baseline format."""
+    results = { "format"    : BASELINE_FORMAT_VERSION,
+                "python"    : platform.python_version(),
+                "platform"  : platform.platform(),
+                "quick"     : quick,
+                "scenarios" : {} }
+    for name in scenarios:
+        command = [ sys.executable, os.path.abspath(__file__), "--run-scenario", name,
+                    "--repeat", str(repeat) ] + ( [ "--quick" ] if quick else [] )
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+        results["scenarios"][name] = json.loads(output)
+    return results
+
+
+def check_regressions(results, baseline, tolerance):
+    """Compares results with a baseline. Returns a list of regressions."""
+    regressions = []
+    if baseline.get("format") != BASELINE_FORMAT_VERSION:
+        return [ "unsupported baseline format: {}".format(baseline.get("format")) ]
+    if baseline.get("python") != results["python"] or baseline.get("quick") != results["quick"]:
+        print("Warning: baseline was created with Python {}{}".format(
+              baseline.get("python"), " (quick)" if baseline.get("quick") else ""), file=sys.stderr)
+    for name, metrics in results["scenarios"].items():
+        baseline_metrics = baseline["scenarios"].get(name)
+        if baseline_metrics is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value = metrics.get(metric)
+            baseline_value = baseline_metrics.get(metric)
+            if value is None or not baseline_value:
+                continue
+            if metric.endswith("_us") and max(value, baseline_value) < LATENCY_NOISE_US:
+                continue
+            if higher_is_better:
+                regressed = value < baseline_value * (1 - tolerance)
+            else:
+                regressed = value > baseline_value * (1 + tolerance)
+            if regressed:
+                regressions.append("{} {}: {:.1f} (baseline {:.1f})".format(name, metric, value,
+                                                                            baseline_value))
+    return regressions
+
+
+def print_results(results):
+    print("{:>16} {:>8} {:>12} {:>10} {:>10} {:>12}".format("scenario", "lines", "lines/s",
+                                                           "p50 us", "p99 us", "peak RSS KB"))
+    for name, metrics in results["scenarios"].items():
+        print("{:>16} {:>8} {:>12.0f} {:>10} {:>10} {:>12}".format(
+              name, metrics["lines"], metrics["lines_per_second"],
+              _format(metrics["p50_us"]), _format(metrics["p99_us"]), _format(metrics["peak_rss_kb"])))
+
+
+def _format(value):
+    if value is None:
+        return "-"
+    return "{:.1f}".format(value) if isinstance(value, float) else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated list of scenarios (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs (best run is reported)")
+    parser.add_argument("--quick", action="store_true", help="use smaller inputs")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--check", metavar="FILE", help="compare the results with a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative difference with the baseline (default: 0.25)")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args.run_scenario, args.repeat, args.quick)))
+        return
+
+    scenarios = args.scenarios.split(",")
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario: {}".format(name))
+
+    results = run_suite(scenarios, args.repeat, args.quick)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+    if args.check:
+        with open(args.check) as file:
+            regressions = check_regressions(results, json.load(file), args.tolerance)
+        if regressions:
+            print("Performance regressions:", file=sys.stderr)
+            for regression in regressions:
+                print("  " + regression, file=sys.stderr)
+            sys.exit(1)
+        print("No performance regressions", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
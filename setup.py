@@ -4,6 +4,15 @@ setup(
     author="Sietse Snel",
     author_email="s.t.snel@uu.nl",
     description=('Extracts strings relevant to control flow from python code'),
+    entry_points={
+        'console_scripts': [
+            'string-extractor=string_extractor.cli:main',
+            'string-extractor-server=string_extractor.server:main',
+        ],
+    },
+    extras_require={
+        'vectorized': ['numpy'],
+    },
     install_requires=[],
     name='string_extractor',
     packages=['string_extractor'],
@@ -1,33 +1,247 @@
 #!/usr/bin/env python3
 
 import ast
-import linecache
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import importlib.util
 import os
-import pickle
 import re
-
+import threading
+import time
+
+from string_extractor.aggregation import ContextStringAggregator, StringSetCollector
+from string_extractor.bytecode_extractor import CodeObjectExtractor
+from string_extractor.compact import CompactResultTable
+from string_extractor.file_analyzer import FileAnalyzer
+from string_extractor.file_metadata import FileMetadataCache
+from string_extractor.instrumentation import ExtractionStatistics
+from string_extractor.cache_backends import PickleCacheBackend
+from string_extractor.memory_cache import BoundedCache
+from string_extractor.prefilter import LinePrefilter
 from string_extractor.string_collector import InterestingStringCollector
+from string_extractor.trace import count_lines
+from string_extractor.watcher import FileWatcher
 
 class StringExtractor:
 
-    def __init__(self, use_cache = True, persistent_cache_file = None):
+    def __init__(self, use_cache = True, persistent_cache_file = None, analyze_files = False,
+                 cache_backend = None, workers = 1, prefilter = False, memory_cache = None,
+                 source_cache = None, thread_safe = False, bytecode = False,
+                 statistics = False, statistics_callback = None, compact_results = False):
+        """ Arguments:
+             - use_cache: cache extracted strings per line
+             - persistent_cache_file: file name for loading and saving the cache (as a pickle file)
+             - analyze_files: parse each source file as a whole on first use, and look up
+                 lines in the resulting index. Files that can't be parsed as a whole
+                 are processed line by line.
+             - cache_backend: storage backend for the persistent cache (see cache_backends),
+                 instead of a pickle file. Extracted strings are passed to the backend as soon
+                 as they have been extracted.
+             - workers: number of worker processes for extracting strings. If more than one,
+                 get_batch extracts strings from lines that aren't cached in a process pool,
+                 grouped by file. Call close() to shut down the worker processes.
+             - prefilter: don't parse or visit statements that can't contain interesting
+                 strings, based on a map of the lines with quotes and relevant operators
+                 in each file. Lines that are skipped yield an empty list of strings.
+             - memory_cache: mapping to use as in-memory cache, instead of an unbounded
+                 dictionary. See memory_cache.BoundedCache for a cache with a maximum number
+                 of entries or size, and expiry of entries.
+             - source_cache: FileMetadataCache for the source text of files, e.g. to change
+                 the maximum number of files or bytes of source text kept in memory.
+             - thread_safe: allow the extractor to be used by multiple threads at the same
+                 time, e.g. from the request handlers of a threaded web server. Lines are
+                 processed one at a time, so a line that is requested by multiple threads
+                 is only extracted once.
+             - bytecode: extract strings from code objects instead of parsing source code,
+                 if the code of a line is available (see bytecode_extractor). This also
+                 supports modules without source files, such as modules in zip files and
+                 frozen modules. Other lines are processed as usual.
+             - statistics: collect counters and timers per stage of extracting strings, and
+                 the outcomes per file (see get_statistics). Statistics are only collected in
+                 the main process, not in worker processes.
+             - statistics_callback: function that is called with the name and duration (in
+                 seconds) of each completed stage (see instrumentation). Implies statistics.
+             - compact_results: keep cached results in a compact representation, with each
+                 distinct string stored once (see compact). Results are converted back
+                 to lists of 2-tuples when they are retrieved from the cache. Strings
+                 are removed from the table when no cache entry uses them anymore; this
+                 requires a dict or BoundedCache as memory_cache.
+        """
         self.cache_file = persistent_cache_file
         self.use_cache = use_cache
+        self.analyze_files = analyze_files
+        self.file_metadata = source_cache if source_cache != None else FileMetadataCache()
+        self.file_analyzer = FileAnalyzer()
+        self.file_analyses = {}
+        self.prefilter = LinePrefilter() if prefilter else None
+        self.code_extractor = CodeObjectExtractor(self.file_metadata) if bytecode else None
+        self.statistics = None
+        if statistics or statistics_callback != None:
+            self.statistics = ExtractionStatistics(statistics_callback)
+            self.statistics.instrument(self)
+        self.result_table = CompactResultTable() if compact_results else None
+        self.persistent_cache = None
+        # The settings that change the extracted strings, which are part of the keys of
+        # the persistent cache (see _getCacheDigest), so that extractors with different
+        # settings that share a cache file don't use each other's results
+        self.cache_namespace = ",".join( [ name for (name, enabled) in
+                                           [ ("analyze_files", analyze_files),
+                                             ("prefilter", prefilter),
+                                             ("bytecode", bytecode) ] if enabled ] )
+        self.workers = workers
+        # Strings of the lines processed in each log context
+        self.context_strings = ContextStringAggregator()
+        self.lock = threading.RLock() if thread_safe else None
+        # Thread for get_batch_async, if the extractor isn't thread-safe
+        self.async_executor = None
+        # Thread for index_in_background
+        self.index_executor = None
+        # FileWatcher of watch_files
+        self.file_watcher = None
+        self.executor = None
+        self.cache_statistics = { "hits"             : 0,
+                                  "persistent_hits"  : 0,
+                                  "misses"           : 0,
+                                  "invalidations"    : 0 }
         if use_cache:
-            if persistent_cache_file == None or not os.path.exists(persistent_cache_file):
-                self.cache = {}
-            else:
-                with open(persistent_cache_file,"rb") as cache_file:
-                    self.cache = pickle.load(cache_file)
+            self.cache = memory_cache if memory_cache != None else {}
+            # Keys of entries in self.cache that are already in the persistent cache
+            self.persisted_keys = set()
+            # Files of the entries that have been added to self.cache since they were last
+            # invalidated, e.g. for watching these files (see watcher.FileWatcher)
+            self.cached_files = {}
+            if isinstance(self.cache, BoundedCache):
+                # Callbacks that were passed to the cache are still called
+                self.cache.on_evict = _chainCallbacks(self.persisted_keys.discard,
+                                                      self.cache.on_evict)
+                if self.result_table != None:
+                    # Entries that are evicted, expired, invalidated or replaced no
+                    # longer reference their strings in the table
+                    self.cache.on_remove = _chainCallbacks(self._releaseResult,
+                                                           self.cache.on_remove)
+            if cache_backend != None:
+                self.persistent_cache = cache_backend
+            elif persistent_cache_file != None:
+                start = time.perf_counter()
+                self.persistent_cache = PickleCacheBackend(persistent_cache_file)
+                if self.statistics != None:
+                    self.statistics.record("load", time.perf_counter() - start)
+            if self.persistent_cache != None:
+                # Caches in the original format aren't keyed by file contents,
+                # so their entries are used as they are. These were extracted line
+                # by line, so they are only used if no other settings are enabled.
+                if not self.cache_namespace:
+                    for key, result in getattr(self.persistent_cache, "legacy_entries", {}).items():
+                        self._setCacheEntry(key, result)
 
 
     def save(self):
         """Saves the cache to file, if persistent cache is enabled."""
-        if self.use_cache and self.cache_file != None:
-            with open(self.cache_file, "wb") as cache_file:
-                pickle.dump(self.cache, cache_file)
+        if self.use_cache and self.persistent_cache != None:
+            with self._locked():
+                # BoundedCache.items returns a snapshot, without expiring entries
+                # or changing the order of eviction
+                for key, result in list(self.cache.items()):
+                    if key not in self.persisted_keys:
+                        self._storePersistentCache(key[0], key[1], self._decodeResult(result))
+                self.persistent_cache.save()
+
+    def get_cache_statistics(self):
+        """ Returns a dictionary with cache statistics:
+             - hits: number of lines retrieved from the cache
+             - persistent_hits: number of hits that were loaded from the persistent cache
+             - misses: number of lines that weren't cached
+             - invalidations: number of files that were modified since their entries
+                 were saved in the persistent cache
+        """
+        with self._locked():
+            return dict(self.cache_statistics)
+
+    def get_statistics(self):
+        """ Returns a dictionary with all statistics of the extractor:
+             - cache: see get_cache_statistics
+             - cache_hit_ratio: fraction of processed lines that was retrieved from the cache
+             - prefilter: see get_prefilter_statistics
+             - memory: see get_memory_statistics
+             - stages, parse_attempts_per_statement, files: statistics per stage and per
+                 file, if statistics are enabled (see instrumentation.ExtractionStatistics)
+        """
+        with self._locked():
+            cache_statistics = self.get_cache_statistics()
+            lookups = cache_statistics["hits"] + cache_statistics["misses"]
+            statistics = { "cache"           : cache_statistics,
+                           "cache_hit_ratio" : cache_statistics["hits"] / lookups if lookups > 0 else 0.0,
+                           "prefilter"       : self.get_prefilter_statistics(),
+                           "memory"          : self.get_memory_statistics() }
+            if self.statistics != None:
+                statistics.update(self.statistics.getStatistics())
+            return statistics
+
+    def get_prefilter_statistics(self):
+        """ Returns a dictionary with prefilter statistics, or None if the prefilter isn't enabled:
+             - checked: number of lines checked by the prefilter
+             - skipped_parse: number of lines that weren't parsed
+             - skipped_visit: number of lines that were parsed, but not visited
+             - skip_rate: fraction of checked lines that was skipped
+        """
+        if self.prefilter == None:
+            return None
+        return self.prefilter.getStatistics()
+
+    def invalidate(self, filename):
+        """ Removes all cached data of a file from memory: extracted strings, source
+            text and analysis results. Entries in the persistent cache are kept, since
+            these are only used if the contents of the file match."""
+        with self._locked():
+            self._invalidate(filename)
+
+    def _invalidate(self, filename):
+        if self.use_cache:
+            if isinstance(self.cache, BoundedCache):
+                self.cache.invalidate(filename)
+            else:
+                for key in [ key for key in self.cache if key[0] == filename ]:
+                    self._releaseResult(key, self.cache.pop(key))
+            for key in [ key for key in self.persisted_keys if key[0] == filename ]:
+                self.persisted_keys.discard(key)
+            self.cached_files.pop(filename, None)
+        self.file_metadata.invalidate(filename)
+        self.file_analyses.pop(filename, None)
+        if self.prefilter != None:
+            self.prefilter.line_maps.pop(filename, None)
+        if self.code_extractor != None:
+            self.code_extractor.invalidate(filename)
+
+    def get_memory_statistics(self):
+        """ Returns a dictionary with statistics on data kept in memory:
+             - cache: number of cached lines, and for a BoundedCache the estimated size
+                 and number of evicted entries (see BoundedCache.getStatistics)
+             - source: number of files and characters of source text
+             - analyzed_files: number of files with whole file analysis results
+             - compact_results: number of distinct strings and results in the compact
+                 representation, if enabled
+        """
+        statistics = { "cache"          : None,
+                       "source"         : { "files" : len(self.file_metadata.entries),
+                                            "bytes" : self.file_metadata.total_bytes,
+                                            "max_files" : self.file_metadata.max_files,
+                                            "max_bytes" : self.file_metadata.max_bytes },
+                       "analyzed_files" : len(self.file_analyses) }
+        if self.use_cache:
+            if isinstance(self.cache, BoundedCache):
+                statistics["cache"] = self.cache.getStatistics()
+            else:
+                statistics["cache"] = { "entries" : len(self.cache) }
+        if self.result_table != None:
+            statistics["compact_results"] = self.result_table.getStatistics()
+        return statistics
 
-    def get_batch(self, lines, collapse_output = False):
+    def get_batch(self, lines, collapse_output = False, count_occurrences = False,
+                  log_context = None):
         """ Gets a list of interesting string fragments.
             Arguments:
              - lines: a list of 2-tuples (file name + line number)
@@ -39,49 +253,409 @@ class StringExtractor:
                         "ERROR"
                         "IGNORE"
                         a list of 2-tuples with interesting strings for this line
+             - count_occurrences: only applies to non-collapsed output. If true, outputs
+                 a 4-tuple (file name, line number, output, number of occurrences) for
+                 each distinct line, in order of first occurrence.
+             - log_context: if set, the strings of the lines are also added to this log
+                 context in context_strings (a ContextStringAggregator), which keeps the
+                 strings of all lines processed in each context, and can determine which
+                 strings are new since a checkpoint.
+            Repeated lines are only processed once if output is collapsed or occurrences
+            are counted.
         """
-        output = []
-
-        for (filename, line_number) in lines:
-            if self.use_cache and (filename, line_number) in self.cache:
-                 output.append( (filename, line_number, self.cache[(filename, line_number)]) )
-                 continue
-
-            pp_line = self._preprocessLine(filename, line_number)
-
-            if pp_line[0] in ["ERROR", "IGNORE"]:
-                result = pp_line[0]
-            elif pp_line[0] == "OK":
-                result = self.getInterestingStrings(pp_line[1])
-
-            output.append( (filename, line_number, result) )
-
+        if collapse_output or count_occurrences:
+            counts = count_lines(lines)
             if self.use_cache:
-                self.cache[(filename, line_number)] = result
-
-        if collapse_output:
-            return self._collapse_batch_output(output)
+                # Repeated lines would have been retrieved from the cache
+                with self._locked():
+                    self.cache_statistics["hits"] += sum(counts.values()) - len(counts)
+            if collapse_output:
+                return self.collect_batch(counts.keys(), None, log_context = log_context).get_strings()
+            else:
+                return [ (filename, line_number, result, counts[(filename, line_number)])
+                         for (filename, line_number, result)
+                         in self.iter_batch(counts.keys(), None, log_context) ]
         else:
-            return output
-
-    def _collapse_batch_output(self, output):
-        result = { "FULL"       : {},
-                   "PREFIX"     : {},
-                   "SUFFIX"     : {},
-                   "FRAGMENT"   : {} }
+            return list(self.iter_batch(lines, None, log_context))
 
-        for (filename, line_number, line_data) in output:
-            if line_data in ["ERROR", "IGNORE"]:
+    async def get_batch_async(self, lines, collapse_output = False, count_occurrences = False,
+                              executor = None):
+        """ Coroutine version of get_batch, for use in asyncio applications. Strings are
+            extracted in an executor, so that the event loop isn't blocked.
+            Arguments:
+             - lines, collapse_output, count_occurrences: see get_batch
+             - executor: concurrent.futures executor for extracting strings. By default, the
+                 default executor of the event loop is used if the extractor is thread-safe.
+                 Otherwise, batches are processed one at a time on a separate thread.
+        """
+        if executor == None and self.lock == None:
+            if self.async_executor == None:
+                self.async_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+            executor = self.async_executor
+        # asyncio.get_running_loop was added in Python 3.7
+        loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)()
+        return await loop.run_in_executor(executor,
+                                          functools.partial(self.get_batch, lines,
+                                                            collapse_output, count_occurrences))
+
+    def iter_batch(self, lines, chunk_size = 10000, log_context = None):
+        """ Generator version of get_batch with non-collapsed output. Accepts any iterable
+            of 2-tuples (file name + line number), and yields a 3-tuple (file name, line
+            number, output) for each line.
+            If multiple worker processes are used, lines are processed in chunks of
+            chunk_size lines (or all at once if chunk_size is None).
+            If log_context is set, the strings of the lines are added to this log context
+            in context_strings.
+        """
+        if log_context != None:
+            for line in self.iter_batch(lines, chunk_size):
+                with self._locked():
+                    self.context_strings.add(line[2], log_context)
+                yield line
+        elif self.workers > 1:
+            for chunk in _iterChunks(lines, chunk_size):
+                with self._locked():
+                    results = self._getResultsParallel(chunk)
+                for (filename, line_number) in chunk:
+                    yield (filename, line_number, results[(filename, line_number)])
+        else:
+            # Consecutive repetitions of a line (e.g. in loops) reuse its result, without
+            # looking it up again. They are counted as cache hits, as in get_batch.
+            previous_line = None
+            repetitions = 0
+            for line in lines:
+                if line != previous_line:
+                    if repetitions > 0 and self.use_cache:
+                        with self._locked():
+                            self.cache_statistics["hits"] += repetitions
+                    repetitions = 0
+                    previous_line = line
+                    result = self._getResult(line[0], line[1])
+                else:
+                    repetitions += 1
+                yield (line[0], line[1], result)
+            if repetitions > 0 and self.use_cache:
+                with self._locked():
+                    self.cache_statistics["hits"] += repetitions
+
+    def collect_batch(self, lines, chunk_size = 10000, collector = None, log_context = None):
+        """ Processes an iterable of lines, and adds their interesting strings to a
+            StringSetCollector (a new one if collector is None). Returns the collector.
+            The collapsed output of get_batch can be retrieved using its get_strings()
+            function. If log_context is set, the strings are also added to this log context
+            in context_strings.
+        """
+        if collector == None:
+            collector = StringSetCollector()
+        for (filename, line_number, line_data) in self.iter_batch(lines, chunk_size, log_context):
+            collector.add(line_data)
+        return collector
+
+    def index_files(self, filenames, chunk_size = 10000):
+        """ Extracts strings from all lines of source files ahead of time, and stores them
+            in the cache (and persistent cache, if enabled), so that lines of these files
+            are retrieved from the cache when they are processed later. Returns the number
+            of lines that have been indexed."""
+        if not self.use_cache:
+            raise ValueError("Indexing requires a cache")
+        number_of_lines = 0
+        for filename in filenames:
+            try:
+                with self._locked():
+                    lines = [ (filename, line_number) for line_number
+                              in range(1, self._getNumberOfLines(filename) + 1) ]
+            except OSError:
                 continue
-            for (stringtype, stringdata) in line_data:
-                result[stringtype][stringdata] = 1
-
-        result_as_list = []
-        for stringtype, typedata in result.items():
-            for string in typedata:
-                result_as_list.append( (stringtype, string) )
+            for line in self.iter_batch(lines, chunk_size):
+                number_of_lines += 1
+        return number_of_lines
+
+    def index_packages(self, packages, chunk_size = 10000):
+        """ Indexes all Python source files of packages (see index_files). Packages can be
+            given as names of importable packages or modules, or as directories. Returns
+            the number of lines that have been indexed."""
+        filenames = []
+        for package in packages:
+            filenames.extend(_findPackageFiles(package))
+        return self.index_files(filenames, chunk_size)
+
+    def index_in_background(self, packages = None, filenames = None):
+        """ Indexes packages and files (see index_packages and index_files) on a background
+            thread. The extractor must be thread-safe. Returns a concurrent.futures.Future
+            with the number of lines that have been indexed."""
+        if self.lock == None:
+            raise ValueError("Indexing in the background requires a thread-safe extractor")
+        if self.index_executor == None:
+            self.index_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+        def _index():
+            filenames_to_index = list(filenames or [])
+            for package in (packages or []):
+                filenames_to_index.extend(_findPackageFiles(package))
+            return self.index_files(filenames_to_index)
+        return self.index_executor.submit(_index)
+
+    def watch_files(self, filenames = None, interval = 1.0, reindex = True):
+        """ Watches the source files of cached lines, and additional files, for modifications
+            on a background thread (see watcher.FileWatcher). The cached results of modified
+            files are invalidated, and the files are indexed again if reindex is set. The
+            extractor must be thread-safe. Returns the FileWatcher; the files are watched
+            until close() is called."""
+        if self.file_watcher == None:
+            file_watcher = FileWatcher(self, interval = interval, reindex = reindex)
+            file_watcher.start()
+            self.file_watcher = file_watcher
+        self.file_watcher.watch(filenames or [])
+        return self.file_watcher
+
+    def missing_lines(self, lines):
+        """ Checks whether the strings of the lines of a trace are cached, e.g. after
+            indexing. Returns the distinct lines that aren't in the cache or persistent
+            cache, in order of first occurrence. Cache statistics aren't affected."""
+        missing = []
+        with self._locked():
+            for line in count_lines(lines):
+                if self.use_cache and self.cache.get(line) is not None:
+                    continue
+                if self.use_cache and self.persistent_cache != None:
+                    digest = self._getCacheDigest(line[0])
+                    if digest is not None and self.persistent_cache.lookup(digest, line[1]) is not None:
+                        continue
+                missing.append(line)
+        return missing
+
+    def close(self):
+        """Shuts down the worker processes and the threads of get_batch_async,
+           index_in_background and watch_files, if any, and closes the persistent cache
+           backend. Backends that store results as they are extracted (such as
+           SQLiteCacheBackend) commit them; for the pickle and shard backends,
+           call save() first."""
+        if self.executor != None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.async_executor != None:
+            self.async_executor.shutdown()
+            self.async_executor = None
+        if self.index_executor != None:
+            self.index_executor.shutdown()
+            self.index_executor = None
+        if self.file_watcher != None:
+            self.file_watcher.close()
+            self.file_watcher = None
+        if self.persistent_cache != None:
+            with self._locked():
+                self.persistent_cache.close()
+                self.persistent_cache = None
+
+    def _locked(self):
+        """Returns a context manager that holds the lock of a thread-safe extractor."""
+        if self.lock != None:
+            return self.lock
+        return _unlocked()
+
+    def _getResultsParallel(self, lines):
+        """ Gets the results for a list of lines, extracting strings from lines that
+            aren't cached in worker processes. Each file is processed by a single worker.
+            Returns a dictionary with the result of every distinct line."""
+        counts = count_lines(lines)
+
+        results = {}
+        missing_lines = collections.OrderedDict()
+        for (filename, line_number), count in counts.items():
+            if self.use_cache:
+                result = self._lookupCache(filename, line_number)
+                # Repeated lines are cache hits, like when processing lines one by one.
+                self.cache_statistics["hits"] += count - 1
+                if result is not None:
+                    results[(filename, line_number)] = result
+                    continue
+                self.cache_statistics["misses"] += 1
+            missing_lines.setdefault(filename, []).append(line_number)
+
+        if len(missing_lines) > 1:
+            if self.executor == None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(max_workers = self.workers)
+            options = (self.analyze_files, self.prefilter != None, self.code_extractor != None)
+            files_results = self.executor.map(_extractLinesInWorker, [ options ] * len(missing_lines),
+                                              missing_lines.keys(), missing_lines.values())
+        else:
+            files_results = [ [ self._extractLine(filename, line_number) for line_number in line_numbers ]
+                              for filename, line_numbers in missing_lines.items() ]
+
+        for (filename, line_numbers), file_results in zip(missing_lines.items(), files_results):
+            for line_number, result in zip(line_numbers, file_results):
+                results[(filename, line_number)] = result
+                if self.use_cache:
+                    self._storeCache(filename, line_number, result)
+
+        return results
+
+    def _getResult(self, filename, lineNumber):
+        """ Gets the result for a line from the cache, or extracts it."""
+        if self.lock != None:
+            # Concurrent requests for the same line wait for the first one, and
+            # then retrieve its result from the cache.
+            with self.lock:
+                return self._getResultUnlocked(filename, lineNumber)
+        return self._getResultUnlocked(filename, lineNumber)
+
+    def _getResultUnlocked(self, filename, lineNumber):
+        result = None
+        if self.use_cache:
+            result = self._lookupCache(filename, lineNumber)
+            if result is None:
+                self.cache_statistics["misses"] += 1
+
+        if result is None:
+            result = self._extractLine(filename, lineNumber)
+            if self.use_cache:
+                self._storeCache(filename, lineNumber, result)
+
+        return result
+
+    def _lookupCache(self, filename, lineNumber):
+        """ Looks up a line in the cache and, if it isn't in memory, in the persistent cache.
+            Returns None if the line isn't cached."""
+        result = self.cache.get( (filename, lineNumber) )
+        if result is not None:
+            self.cache_statistics["hits"] += 1
+            return self._decodeResult(result)
+        elif self.persistent_cache != None:
+            result = self._lookupPersistentCache(filename, lineNumber)
+            if result is not None:
+                self.cache_statistics["hits"] += 1
+                self.cache_statistics["persistent_hits"] += 1
+                compact_result = self._setCacheEntry( (filename, lineNumber), result )
+                self.persisted_keys.add( (filename, lineNumber) )
+                return self._decodeResult(compact_result)
+            return result
+        return None
+
+    def _storeCache(self, filename, lineNumber, result):
+        compact_result = self._setCacheEntry( (filename, lineNumber), result )
+        if self.persistent_cache != None:
+            # Decoded results share their 2-tuples, so each string is saved once
+            self._storePersistentCache(filename, lineNumber, self._decodeResult(compact_result))
+
+    def _setCacheEntry(self, key, result):
+        """Adds the result of a line to the cache, and returns the representation in the cache."""
+        compact_result = self._encodeResult(result)
+        if self.result_table != None and not isinstance(self.cache, BoundedCache):
+            # BoundedCache releases replaced entries itself (see _releaseResult)
+            previous = self.cache.get(key)
+            if previous is not None:
+                self._releaseResult(key, previous)
+        self.cache[key] = compact_result
+        self.cached_files[key[0]] = None
+        return compact_result
+
+    def _releaseResult(self, key, result):
+        """Called for each entry that is removed from the cache, so that the compact result
+           table can remove the strings that are no longer in any entry."""
+        if self.result_table != None:
+            self.result_table.release(result)
+
+    def _encodeResult(self, result):
+        """Converts a result to the representation in the cache."""
+        if self.result_table != None:
+            return self.result_table.encode(result)
+        return result
+
+    def _decodeResult(self, result):
+        """Converts a result from the representation in the cache."""
+        if self.result_table != None:
+            return self.result_table.decode(result)
+        return result
+
+    def _lookupPersistentCache(self, filename, lineNumber):
+        """ Looks up a line in the persistent cache, using the current contents
+            of the file. Returns None if the line isn't cached."""
+        digest = self._getCacheDigest(filename)
+        if digest is None:
+            return None
+        if self.persistent_cache.updateFile(filename, digest):
+            self.cache_statistics["invalidations"] += 1
+        return self.persistent_cache.lookup(digest, lineNumber)
+
+    def _storePersistentCache(self, filename, lineNumber, result):
+        digest = self._getCacheDigest(filename)
+        if digest is not None:
+            self.persistent_cache.store(filename, digest, lineNumber, result)
+            self.persisted_keys.add( (filename, lineNumber) )
+
+    def _getCacheDigest(self, filename):
+        """ Returns the digest under which the lines of a file are kept in the persistent
+            cache: the digest of the contents of the file, combined with the settings of
+            the extractor if any are enabled. Returns None if the file can't be read."""
+        digest = self._getFileDigest(filename)
+        if digest is None or not self.cache_namespace:
+            return digest
+        return hashlib.sha1( "{}:{}".format(digest, self.cache_namespace).encode("ascii") ).hexdigest()
+
+    def _getFileDigest(self, filename):
+        """ Returns the digest of the contents of a file, or None if the file
+            can't be read."""
+        try:
+            return self.file_metadata.get(filename).digest
+        except OSError:
+            return None
+
+    def _extractLine(self, filename, lineNumber):
+        """ Extracts interesting strings from a line. Uses the code objects of the file
+            if bytecode extraction is enabled and the line has code, or the index of the file
+            if whole file analysis is enabled and the line is the first line of a statement.
+            Otherwise preprocesses the line and parses the resulting statement."""
+        if self.code_extractor != None:
+            result = self.code_extractor.getResult(filename, lineNumber)
+            if result is not None:
+                return result
+            if not os.path.isfile(filename):
+                # Lines without code in files without source, e.g. in zip files
+                return "ERROR"
+
+        if self.analyze_files:
+            analysis = self._getFileAnalysis(filename)
+            if analysis is not None:
+                result = analysis.getResult(lineNumber)
+                if result is not None:
+                    return result
+
+        pp_line = self._preprocessLine(filename, lineNumber)
+
+        if pp_line[0] in ["ERROR", "IGNORE"]:
+            return pp_line[0]
+        elif pp_line[0] == "SKIP":
+            return []
+        elif pp_line[0] == "OK":
+            if self.prefilter != None and self.prefilter.canSkipStatement(pp_line[1]):
+                return []
+            return self.getInterestingStrings(pp_line[1])
+
+    def _getFileAnalysis(self, filename):
+        """ Returns the analysis of a file, or None if the file can't be
+            analyzed as a whole."""
+        if filename.endswith(".j2") or filename.endswith(".html"):
+            return None
+
+        # Analyses are kept as long as the metadata of the file is cached and
+        # up to date, so that modified files are analyzed again.
+        metadata = self.file_metadata.get(filename)
+        if filename in self.file_analyses:
+            (analyzed_metadata, analysis) = self.file_analyses[filename]
+            if analyzed_metadata is metadata:
+                return analysis
+
+        analysis = self.file_analyzer.analyzeSource(metadata.source)
+        self.file_analyses[filename] = (metadata, analysis)
+        if len(self.file_analyses) > len(self.file_metadata.entries):
+            # Drop analyses of files that have been evicted from the metadata cache
+            self.file_analyses = { name : entry for name, entry in self.file_analyses.items()
+                                   if name in self.file_metadata.entries }
+        return analysis
 
-        return result_as_list
+    def _collapse_batch_output(self, output):
+        collector = StringSetCollector()
+        collector.add_output(output)
+        return collector.get_strings()
 
 
     def _preprocessLine(self, filename, lineNumber):
@@ -100,14 +674,18 @@ class StringExtractor:
                              parsable form. This could happen for long multiline statements (length
                              more than maxMultilineLength), or for language constructs that aren't
                              recognized by the preprocessor.
+              SKIP         : the prefilter determined that the statement on this line can't
+                             contain any interesting strings, so it hasn't been parsed.
             """
         maxMultilineLength= 20
-        numberOfLines = self._getNumberOfLines(filename)
-        line = linecache.getline(filename, lineNumber).strip()
 
         if filename.endswith(".j2") or filename.endswith(".html"):
             return ("IGNORE","")
 
+        metadata = self.file_metadata.get(filename)
+        numberOfLines = metadata.number_of_lines
+        line = metadata.getLine(lineNumber)
+
         # Ignore annotations
         if line.startswith("@"):
             return ("IGNORE", "")
@@ -123,6 +701,17 @@ class StringExtractor:
         if re.match( "^elif\s", line):
             line = line[2:]
 
+        # Skip statements that can't contain interesting strings without parsing them. This
+        # considers all lines that could be part of the statement, including explicit line
+        # continuations beyond maxMultilineLength (see below).
+        if self.prefilter != None:
+            lastLineNumber = lineNumber + min(maxMultilineLength, numberOfLines - lineNumber - 1)
+            while ( lastLineNumber < numberOfLines - 1 and
+                    metadata.getLine(lastLineNumber).rstrip().endswith("\\") ):
+                lastLineNumber += 1
+            if self.prefilter.canSkipLines(metadata, lineNumber, max(lineNumber, lastLineNumber)):
+                return ("SKIP", "")
+
         # Check whether we are dealing with a relevant compound statement
         compoundStatement = False
         for keyword in ["for", "if", "while"]:
@@ -137,7 +726,7 @@ class StringExtractor:
             if offset == 0:
                 thisLine = line
             else:
-                thisLine = linecache.getline(filename, thisLineNumber).strip()
+                thisLine = metadata.getLine(thisLineNumber)
 
             statement = " ".join([statement, thisLine ]).strip()
 
@@ -172,14 +761,80 @@ class StringExtractor:
 
 
     def _getNumberOfLines(self, filename):
-        with open(filename, 'r') as file:
-            for count, line in enumerate(file):
-                pass
-        return count + 1
+        return self.file_metadata.get(filename).number_of_lines
 
     def getInterestingStrings(self, statement):
-        tree = ast.parse(statement)
+        return self._collectStrings(self._parseStatement(statement))
+
+    def _parseStatement(self, statement):
+        return ast.parse(statement)
+
+    def _collectStrings(self, tree):
         collector = InterestingStringCollector()
         collector.visit(tree)
         return collector.getCollectedStrings()
 
+
+@contextlib.contextmanager
+def _unlocked():
+    """No-op context manager for extractors that aren't thread-safe (like
+       contextlib.nullcontext, which was added in Python 3.7)."""
+    yield
+
+def _chainCallbacks(callback, other_callback):
+    """Returns a function that calls callback and then other_callback (if not None)
+       with the same arguments."""
+    if other_callback is None:
+        return callback
+    def chained_callback(*args):
+        callback(*args)
+        other_callback(*args)
+    return chained_callback
+
+def _iterChunks(lines, chunk_size):
+    """Splits an iterable of lines into lists of chunk_size lines."""
+    if chunk_size == None:
+        yield list(lines)
+        return
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _findPackageFiles(package):
+    """Returns the Python source files of a package or module, given as a name or
+       as a directory."""
+    if os.path.isdir(package):
+        directories = [ package ]
+    else:
+        spec = importlib.util.find_spec(package)
+        if spec == None:
+            raise ImportError("Package not found: {}".format(package))
+        if spec.submodule_search_locations == None:
+            return [ spec.origin ] if spec.origin != None and spec.origin.endswith(".py") else []
+        directories = list(spec.submodule_search_locations)
+
+    filenames = []
+    for directory in directories:
+        for dirpath, dirnames, files in os.walk(directory):
+            dirnames.sort()
+            filenames.extend( [ os.path.join(dirpath, name) for name in sorted(files)
+                                if name.endswith(".py") ] )
+    return filenames
+
+def _extractLinesInWorker(options, filename, line_numbers):
+    """Extracts strings from lines of a file in a worker process. Options is a
+       3-tuple with the analyze_files, prefilter and bytecode settings of the extractor."""
+    extractor = _worker_extractors.get(options)
+    if extractor == None:
+        (analyze_files, prefilter, bytecode) = options
+        extractor = StringExtractor(False, None, analyze_files, prefilter = prefilter, bytecode = bytecode)
+        _worker_extractors[options] = extractor
+    return [ extractor._extractLine(filename, line_number) for line_number in line_numbers ]
+
+# Extractors of the current worker process, by options
+_worker_extractors = {}
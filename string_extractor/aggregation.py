@@ -0,0 +1,129 @@
+""" Classes for aggregating interesting strings from multiple lines."""
+
+class StringSetCollector:
+    """Running aggregate of the interesting strings of processed lines, in the
+       format of the collapsed output of StringExtractor.get_batch. Memory use
+       depends on the number of distinct strings, not on the number of lines
+       that have been added."""
+
+    def __init__(self):
+        self.strings = { "FULL"       : {},
+                         "PREFIX"     : {},
+                         "SUFFIX"     : {},
+                         "FRAGMENT"   : {} }
+
+    def add(self, line_data):
+        """Adds the result of a line ("ERROR", "IGNORE" or a list of 2-tuples
+           with interesting strings)."""
+        if line_data in ["ERROR", "IGNORE"]:
+            return
+        for (stringtype, stringdata) in line_data:
+            self.strings[stringtype][stringdata] = 1
+
+    def add_output(self, output):
+        """Adds all lines of (non-collapsed) get_batch or iter_batch output."""
+        for (filename, line_number, line_data) in output:
+            self.add(line_data)
+
+    def get_strings(self):
+        """Returns the collected strings as a list of 2-tuples (string type, string)."""
+        result_as_list = []
+        for stringtype, typedata in self.strings.items():
+            for string in typedata:
+                result_as_list.append( (stringtype, string) )
+
+        return result_as_list
+
+    def __len__(self):
+        return sum( [ len(typedata) for typedata in self.strings.values() ] )
+
+
+class ContextStringAggregator:
+    """Incremental aggregate of the interesting strings of processed lines, per log
+       context and for all contexts together.
+
+       Each distinct string is stored once, in a table that is shared by all contexts.
+       Strings get an index in this table in order of first occurrence, and each context
+       keeps the indexes of its strings in order of first occurrence in that context.
+       A checkpoint is the number of strings at some point in time, so the strings that
+       are new since a checkpoint can be retrieved in time proportional to their number.
+
+       Example:
+
+           aggregator = ContextStringAggregator()
+           aggregator.add_output(first_output, "test_1")
+           checkpoint = aggregator.checkpoint()
+           aggregator.add_output(second_output, "test_2")
+           new_strings = aggregator.new_since(checkpoint)
+    """
+
+    _stringTypeOrder = { "FULL" : 0, "PREFIX" : 1, "SUFFIX" : 2, "FRAGMENT" : 3 }
+
+    def __init__(self):
+        # Distinct 2-tuples (string type, string), and their index in that list
+        self.strings = []
+        self.indexes = {}
+        # Per context: indexes of its strings, as a set and in order of first occurrence
+        self.contexts = {}
+
+    def add(self, line_data, context = None):
+        """Adds the result of a line ("ERROR", "IGNORE" or a list of 2-tuples
+           with interesting strings) to a context. If context is None, the strings
+           are only added to the strings of all contexts."""
+        if line_data in ["ERROR", "IGNORE"]:
+            return
+        (context_indexes, context_order) = self._getContext(context)
+        for item in line_data:
+            index = self.indexes.get(item)
+            if index is None:
+                index = len(self.strings)
+                self.strings.append(item)
+                self.indexes[item] = index
+            if context_indexes is not None and index not in context_indexes:
+                context_indexes.add(index)
+                context_order.append(index)
+
+    def add_output(self, output, context = None):
+        """Adds all lines of (non-collapsed) get_batch or iter_batch output to a context."""
+        for line in output:
+            self.add(line[2], context)
+
+    def checkpoint(self, context = None):
+        """Returns a checkpoint for new_since: the number of distinct strings of a
+           context, or of all contexts if context is None."""
+        if context == None:
+            return len(self.strings)
+        return len(self.contexts[context][1]) if context in self.contexts else 0
+
+    def new_since(self, checkpoint, context = None):
+        """Returns the strings that have been added to a context (or to any context if
+           context is None) since a checkpoint, as a list of 2-tuples (string type, string)
+           in order of first occurrence."""
+        if context == None:
+            return self.strings[checkpoint:]
+        if context not in self.contexts:
+            return []
+        return [ self.strings[index] for index in self.contexts[context][1][checkpoint:] ]
+
+    def get_strings(self, context = None):
+        """Returns the strings of a context (or of all contexts if context is None), in
+           the format of the collapsed output of StringExtractor.get_batch."""
+        strings = self.new_since(0, context)
+        # Sorting is stable, so strings of the same type stay in order of first occurrence
+        return sorted(strings, key = lambda item: self._stringTypeOrder[item[0]])
+
+    def get_contexts(self):
+        """Returns the contexts that strings have been added to."""
+        return list(self.contexts)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def _getContext(self, context):
+        if context == None:
+            return (None, None)
+        entry = self.contexts.get(context)
+        if entry is None:
+            entry = (set(), [])
+            self.contexts[context] = entry
+        return entry
@@ -0,0 +1,286 @@
+""" Extraction of interesting strings from code objects instead of source code, for
+    modules without readable source (e.g. modules in zip files, frozen modules and
+    deployments with only .pyc files), and to avoid parsing source code of modules
+    whose code objects are already available.
+
+    The instructions of a code object are interpreted with a simplified model of the
+    value stack, which only keeps track of constants, attribute names and the elements
+    of tuples, lists and sets. Comparisons, "in" tests and calls of the startswith,
+    endswith, find and index methods yield strings in the same way as the
+    InterestingStringCollector, for the line of the instruction that performs the
+    comparison or call. Results are precomputed for all lines of a code object and the
+    code objects nested in it.
+
+    Unlike the source-based extraction, control flow statements such as try and except
+    aren't recognized, so lines with such statements yield an empty list of strings if
+    they have any instructions."""
+
+import dis
+import importlib.machinery
+import os
+import sys
+
+from string_extractor.string_collector import InterestingStringCollector
+
+# Values on the simplified stack are None (unknown value) or 2-tuples (kind, data)
+_NULL = ("NULL", None)
+
+# Instructions that only pop and push unknown values: (number of popped values,
+# number of pushed values)
+_simpleInstructions = {
+    "NOP" : (0, 0), "RESUME" : (0, 0), "CACHE" : (0, 0), "EXTENDED_ARG" : (0, 0),
+    "PRECALL" : (0, 0), "NOT_TAKEN" : (0, 0), "JUMP_FORWARD" : (0, 0),
+    "JUMP_ABSOLUTE" : (0, 0), "JUMP_BACKWARD" : (0, 0),
+    "JUMP_BACKWARD_NO_INTERRUPT" : (0, 0), "JUMP" : (0, 0), "JUMP_NO_INTERRUPT" : (0, 0),
+    "SETUP_LOOP" : (0, 0), "POP_BLOCK" : (0, 0), "RETURN_CONST" : (0, 0),
+    "POP_TOP" : (1, 0), "RETURN_VALUE" : (1, 0), "POP_JUMP_IF_FALSE" : (1, 0),
+    "POP_JUMP_IF_TRUE" : (1, 0), "POP_JUMP_IF_NONE" : (1, 0), "POP_JUMP_IF_NOT_NONE" : (1, 0),
+    "POP_JUMP_FORWARD_IF_FALSE" : (1, 0), "POP_JUMP_FORWARD_IF_TRUE" : (1, 0),
+    "POP_JUMP_FORWARD_IF_NONE" : (1, 0), "POP_JUMP_FORWARD_IF_NOT_NONE" : (1, 0),
+    "POP_JUMP_BACKWARD_IF_FALSE" : (1, 0), "POP_JUMP_BACKWARD_IF_TRUE" : (1, 0),
+    "POP_JUMP_BACKWARD_IF_NONE" : (1, 0), "POP_JUMP_BACKWARD_IF_NOT_NONE" : (1, 0),
+    "JUMP_IF_FALSE_OR_POP" : (1, 0), "JUMP_IF_TRUE_OR_POP" : (1, 0),
+    "STORE_FAST" : (1, 0), "STORE_NAME" : (1, 0), "STORE_GLOBAL" : (1, 0),
+    "STORE_DEREF" : (1, 0), "STORE_ATTR" : (2, 0), "STORE_SUBSCR" : (3, 0),
+    "LOAD_FAST" : (0, 1), "LOAD_FAST_CHECK" : (0, 1), "LOAD_FAST_AND_CLEAR" : (0, 1),
+    "LOAD_FAST_BORROW" : (0, 1), "LOAD_NAME" : (0, 1), "LOAD_DEREF" : (0, 1),
+    "LOAD_CLOSURE" : (0, 1), "LOAD_CLASSDEREF" : (0, 1), "LOAD_BUILD_CLASS" : (0, 1),
+    "LOAD_ASSERTION_ERROR" : (0, 1), "LOAD_FAST_LOAD_FAST" : (0, 2),
+    "LOAD_FAST_BORROW_LOAD_FAST_BORROW" : (0, 2),
+    "TO_BOOL" : (1, 1), "UNARY_NOT" : (1, 1), "UNARY_NEGATIVE" : (1, 1),
+    "UNARY_POSITIVE" : (1, 1), "UNARY_INVERT" : (1, 1), "FORMAT_SIMPLE" : (1, 1),
+    "BINARY_OP" : (2, 1), "BINARY_SUBSCR" : (2, 1), "IS_OP" : (2, 1),
+    "BINARY_ADD" : (2, 1), "BINARY_SUBTRACT" : (2, 1), "BINARY_MULTIPLY" : (2, 1),
+    "BINARY_TRUE_DIVIDE" : (2, 1), "BINARY_FLOOR_DIVIDE" : (2, 1), "BINARY_MODULO" : (2, 1),
+    "BINARY_AND" : (2, 1), "BINARY_OR" : (2, 1), "BINARY_XOR" : (2, 1),
+}
+
+class CodeObjectExtractor:
+    """Extracts interesting strings from code objects, and keeps them per file and line.
+
+       Code objects can be added explicitly with addCode (e.g. the code objects of traced
+       functions). If a line of a file that hasn't been added is requested, the code of
+       its module is retrieved once, from the loader of an imported module, from a frozen
+       module, from a .pyc file or by compiling the source of the file.
+    """
+
+    def __init__(self, file_metadata = None):
+        """ Arguments:
+             - file_metadata: FileMetadataCache for reading source files that aren't
+                 available as code objects. If None, source files aren't compiled.
+        """
+        self.file_metadata = file_metadata
+        # Per file name: InterestingStringCollector with the strings of each line number
+        self.files = {}
+        # Files of which the code of the module has been retrieved (or couldn't be retrieved)
+        self.loaded_files = set()
+        self.analyzed_codes = set()
+
+    def getResult(self, filename, lineNumber):
+        """Returns the strings of a line as a list of 2-tuples (string type, string), or
+           None if no code of the line is available."""
+        lines = self.files.get(filename)
+        if ( lines is None or lineNumber not in lines ) and filename not in self.loaded_files:
+            self.loaded_files.add(filename)
+            code = self.getModuleCode(filename)
+            if code is not None:
+                self.addCode(code, filename)
+            lines = self.files.get(filename)
+        if lines is not None and lineNumber in lines:
+            return lines[lineNumber].getCollectedStrings()
+        return None
+
+    def addCode(self, code, filename = None):
+        """Extracts strings from a code object and the code objects nested in it. They are
+           stored under the file name of the code object, unless filename is set."""
+        if filename == None:
+            filename = code.co_filename
+        lines = self.files.setdefault(filename, {})
+        pending = [ code ]
+        while pending:
+            code = pending.pop()
+            if (filename, code) in self.analyzed_codes:
+                continue
+            self.analyzed_codes.add( (filename, code) )
+            self._analyzeCode(code, lines)
+            pending.extend( [ const for const in code.co_consts if type(const) is type(code) ] )
+
+    def invalidate(self, filename):
+        """Removes the strings of a file, so that its code is retrieved again."""
+        self.files.pop(filename, None)
+        self.loaded_files.discard(filename)
+        self.analyzed_codes = set( [ entry for entry in self.analyzed_codes if entry[0] != filename ] )
+
+    def getModuleCode(self, filename):
+        """Returns the code object of the module of a file, or None if it isn't available."""
+        path = os.path.abspath(filename)
+        for module in list(sys.modules.values()):
+            if getattr(module, "__file__", None) in [ filename, path ]:
+                loader = getattr(module, "__loader__", None)
+                if loader is not None and hasattr(loader, "get_code"):
+                    try:
+                        code = loader.get_code(module.__name__)
+                    except (ImportError, OSError, SyntaxError):
+                        continue
+                    if code is not None:
+                        return code
+
+        if filename.startswith("<frozen ") and filename.endswith(">"):
+            try:
+                return importlib.machinery.FrozenImporter.get_code(filename[len("<frozen "):-1])
+            except ImportError:
+                return None
+
+        try:
+            if filename.endswith(".pyc"):
+                # The loader checks the magic number and skips the header, whose size
+                # depends on the Python version
+                name = os.path.splitext(os.path.basename(filename))[0]
+                return importlib.machinery.SourcelessFileLoader(name, filename).get_code(name)
+            elif self.file_metadata is not None:
+                return compile(self.file_metadata.get(filename).source, filename, "exec",
+                               dont_inherit=True)
+        except (ImportError, OSError, SyntaxError, ValueError, EOFError):
+            return None
+        return None
+
+    def _analyzeCode(self, code, lines):
+        stack = []
+        kwNames = ()
+        lineNumber = None
+        for instruction in dis.get_instructions(code):
+            # Python 3.13 and later have line_number, earlier versions starts_line
+            line = getattr(instruction, "line_number", instruction.starts_line)
+            if line is not None:
+                lineNumber = line
+            if lineNumber is None:
+                continue
+            if lineNumber not in lines:
+                lines[lineNumber] = InterestingStringCollector()
+            if instruction.is_jump_target:
+                # The stack may depend on the path to this instruction
+                stack = []
+
+            opname = instruction.opname
+            simple = _simpleInstructions.get(opname)
+            if simple is not None:
+                _pop(stack, simple[0])
+                stack.extend( [ None ] * simple[1] )
+            elif opname == "LOAD_CONST":
+                stack.append( ("CONST", instruction.argval) )
+            elif opname == "LOAD_GLOBAL":
+                if sys.version_info >= (3, 11) and instruction.arg & 1:
+                    stack.append(_NULL)
+                stack.append(None)
+            elif opname == "PUSH_NULL":
+                stack.append(_NULL)
+            elif opname == "LOAD_ATTR":
+                _pop(stack, 1)
+                stack.append( ("ATTR", instruction.argval) )
+                if sys.version_info >= (3, 12) and instruction.arg & 1:
+                    # Method call: pushes the method and self
+                    stack.append(None)
+            elif opname == "LOAD_METHOD":
+                _pop(stack, 1)
+                stack.extend( [ ("ATTR", instruction.argval), None ] )
+            elif opname in [ "BUILD_TUPLE", "BUILD_LIST", "BUILD_SET" ]:
+                elements = _pop(stack, instruction.arg)
+                stack.append( (opname[len("BUILD_"):], elements) )
+            elif opname in [ "LIST_EXTEND", "SET_UPDATE" ] and instruction.arg == 1:
+                (sequence, value) = _pop(stack, 2)
+                if sequence is not None and sequence[0] in [ "LIST", "SET" ]:
+                    stack.append( (sequence[0], sequence[1] + _getElements(value)) )
+                else:
+                    stack.append(None)
+            elif opname == "COPY":
+                stack.append(stack[-instruction.arg] if len(stack) >= instruction.arg else None)
+            elif opname == "SWAP":
+                if len(stack) >= instruction.arg:
+                    stack[-1], stack[-instruction.arg] = stack[-instruction.arg], stack[-1]
+            elif opname == "DUP_TOP":
+                stack.append(stack[-1] if stack else None)
+            elif opname == "ROT_TWO":
+                if len(stack) >= 2:
+                    stack[-1], stack[-2] = stack[-2], stack[-1]
+            elif opname == "COMPARE_OP":
+                (left, right) = _pop(stack, 2)
+                operator = instruction.argval
+                if operator in [ "==", "!=" ]:
+                    self._addComparison(lines[lineNumber], left, right)
+                elif operator == "in":
+                    self._addContainment(lines[lineNumber], left, right)
+                stack.append(None)
+            elif opname == "CONTAINS_OP":
+                (left, right) = _pop(stack, 2)
+                if instruction.arg == 0:
+                    self._addContainment(lines[lineNumber], left, right)
+                stack.append(None)
+            elif opname == "KW_NAMES":
+                kwNames = code.co_consts[instruction.arg]
+            elif opname in [ "CALL", "CALL_KW", "CALL_METHOD", "CALL_FUNCTION", "CALL_FUNCTION_KW" ]:
+                if opname == "CALL_KW" or opname == "CALL_FUNCTION_KW":
+                    names = _pop(stack, 1)[0]
+                    kwNames = names[1] if names is not None and names[0] == "CONST" else ()
+                args = _pop(stack, instruction.arg)
+                args = args[:len(args) - len(kwNames)]
+                kwNames = ()
+                callables = _pop(stack, 1 if opname in [ "CALL_FUNCTION", "CALL_FUNCTION_KW" ] else 2)
+                for value in callables:
+                    if value is not None and value[0] == "ATTR":
+                        self._addCall(lines[lineNumber], value[1], args)
+                stack.append(None)
+            else:
+                # Unsupported instruction: the contents of the stack are unknown
+                stack = []
+
+    def _addComparison(self, strings, left, right):
+        if _isString(left) and not _isString(right):
+            strings.fullStrings.add(left[1])
+        elif (not _isString(left)) and _isString(right):
+            strings.fullStrings.add(right[1])
+
+    def _addContainment(self, strings, left, right):
+        if _isString(left):
+            strings.fragments.add(left[1])
+        else:
+            for element in _getElements(right):
+                if _isString(element):
+                    strings.fullStrings.add(element[1])
+
+    def _addCall(self, strings, attr, args):
+        if not args:
+            return
+        if attr == "startswith" or attr == "endswith":
+            target = strings.prefixes if attr == "startswith" else strings.suffixes
+            for arg in args:
+                if _isString(arg):
+                    target.add(arg[1])
+                elif arg is not None and ( arg[0] == "TUPLE" or
+                                           ( arg[0] == "CONST" and type(arg[1]) is tuple ) ):
+                    target.update( [ element[1] for element in _getElements(arg)
+                                     if element is not None and element[0] == "CONST" ] )
+        elif attr in [ "index", "find" ] and _isString(args[0]):
+            strings.fragments.add(args[0][1])
+
+
+def _pop(stack, count):
+    """Pops count values from the stack, and returns them in stack order. Values
+       that aren't on the simplified stack are unknown."""
+    if count == 0:
+        return []
+    values = stack[-count:]
+    del stack[-count:]
+    return [ None ] * (count - len(values)) + values
+
+def _isString(value):
+    return value is not None and value[0] == "CONST" and type(value[1]) is str
+
+def _getElements(value):
+    """Returns the elements of a tuple, list or set value."""
+    if value is None:
+        return []
+    if value[0] == "CONST" and type(value[1]) in [ tuple, frozenset ]:
+        return [ ("CONST", element) for element in value[1] ]
+    if value[0] in [ "TUPLE", "LIST", "SET" ]:
+        return value[1]
+    return []
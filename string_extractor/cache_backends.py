@@ -0,0 +1,178 @@
+""" Storage backends for the persistent cache of extracted strings.
+
+    Entries are keyed by the SHA-1 digest of the contents of the source file
+    and the line number, so that entries remain valid if a file is moved
+    (e.g. when a virtualenv is relocated), and modified files are processed
+    again. The cache also records the last known digest of each file name,
+    so that modified files can be detected.
+
+    A backend implements the following methods:
+      lookup(digest, lineNumber)                 : returns a cached result, or None
+      store(filename, digest, lineNumber, result): adds a result to the cache
+      updateFile(filename, digest)               : records the digest of a file, returns
+                                                   True if the file has been modified
+      save()                                     : makes all stored results persistent
+      close()                                    : releases any resources of the backend
+    Backends can also have a legacy_entries attribute with entries that are keyed
+    by (file name, line number), for caches in the original format."""
+
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+
+CACHE_FORMAT_VERSION = 2
+
+class PickleCacheBackend:
+    """Keeps the whole cache in memory, and writes it to a pickle file on save.
+       This backend is not suitable for sharing a cache file between processes
+       that run at the same time."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.files = {}
+        # Entries of caches saved in the original format, keyed by
+        # (file name, line number). These can't be validated.
+        self.legacy_entries = {}
+
+        if os.path.exists(filename):
+            with open(filename, "rb") as cache_file:
+                data = pickle.load(cache_file)
+            if data.get("version") == CACHE_FORMAT_VERSION:
+                self.entries = data["entries"]
+                self.files = data["files"]
+            else:
+                self.legacy_entries = data
+
+    def lookup(self, digest, lineNumber):
+        """Returns the cached result for a line in a file with a particular
+           digest, or None if the line isn't cached."""
+        return self.entries.get( (digest, lineNumber) )
+
+    def store(self, filename, digest, lineNumber, result):
+        self.entries[(digest, lineNumber)] = result
+        self.files[filename] = digest
+
+    def updateFile(self, filename, digest):
+        """Records the current digest of a file. Returns True if a different
+           digest was recorded for the file before, i.e. the file has been
+           modified since its entries were cached."""
+        previous_digest = self.files.get(filename)
+        self.files[filename] = digest
+        return previous_digest is not None and previous_digest != digest
+
+    def save(self):
+        """Writes the cache to file. Entries of files that are no longer present under
+           any file name are removed. The file is replaced atomically, so that
+           the previous version is kept if writing fails."""
+        digests = set(self.files.values())
+        self.entries = { key : result for key, result in self.entries.items()
+                         if key[0] in digests }
+        data = { "version" : CACHE_FORMAT_VERSION,
+                 "entries" : self.entries,
+                 "files"   : self.files }
+
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        (handle, temp_filename) = tempfile.mkstemp(dir=directory, prefix=".cache-")
+        try:
+            with os.fdopen(handle, "wb") as cache_file:
+                pickle.dump(data, cache_file)
+            os.replace(temp_filename, self.filename)
+        except BaseException:
+            os.unlink(temp_filename)
+            raise
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend:
+    """Stores the cache in an SQLite database. Entries are loaded when they are
+       looked up, and stored entries are committed in batches of commit_interval
+       entries, so that the time needed for loading and saving depends on the
+       number of lines that are processed rather than on the size of the cache,
+       and results of earlier batches are kept if the process crashes.
+       The database can be shared by multiple processes."""
+
+    def __init__(self, filename, commit_interval = 1000, timeout = 30.0):
+        self.filename = filename
+        self.commit_interval = commit_interval
+        self.legacy_entries = {}
+        self.pending_entries = []
+        self.pending_files = {}
+        self.file_digests = {}
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, timeout=timeout, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                                    " digest TEXT NOT NULL, line INTEGER NOT NULL, result BLOB NOT NULL,"
+                                    " PRIMARY KEY (digest, line) ) WITHOUT ROWID")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                    " filename TEXT PRIMARY KEY, digest TEXT NOT NULL )")
+            self.connection.commit()
+
+    def lookup(self, digest, lineNumber):
+        with self.lock:
+            row = self.connection.execute("SELECT result FROM entries WHERE digest = ? AND line = ?",
+                                          (digest, lineNumber) ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0])
+
+    def store(self, filename, digest, lineNumber, result):
+        with self.lock:
+            self.pending_entries.append( (digest, lineNumber,
+                                          pickle.dumps(result, pickle.HIGHEST_PROTOCOL)) )
+            self._setFileDigest(filename, digest)
+            if len(self.pending_entries) >= self.commit_interval:
+                self._commit()
+
+    def updateFile(self, filename, digest):
+        with self.lock:
+            previous_digest = self.file_digests.get(filename)
+            if previous_digest is None:
+                row = self.connection.execute("SELECT digest FROM files WHERE filename = ?",
+                                              (filename, ) ).fetchone()
+                if row is not None:
+                    previous_digest = row[0]
+            if previous_digest != digest:
+                self._setFileDigest(filename, digest)
+            return previous_digest is not None and previous_digest != digest
+
+    def save(self):
+        with self.lock:
+            self._commit()
+
+    def compact(self):
+        """Removes entries of files that are no longer present under any file name."""
+        with self.lock:
+            self._commit()
+            self.connection.execute("DELETE FROM entries WHERE digest NOT IN"
+                                    " (SELECT DISTINCT digest FROM files)")
+            self.connection.commit()
+            self.connection.execute("VACUUM")
+
+    def close(self):
+        with self.lock:
+            self._commit()
+            self.connection.close()
+
+    def _setFileDigest(self, filename, digest):
+        if self.file_digests.get(filename) != digest:
+            self.file_digests[filename] = digest
+            self.pending_files[filename] = digest
+
+    def _commit(self):
+        if not ( self.pending_entries or self.pending_files ):
+            return
+        self.connection.executemany("INSERT OR REPLACE INTO entries (digest, line, result) VALUES (?, ?, ?)",
+                                    self.pending_entries)
+        self.connection.executemany("INSERT OR REPLACE INTO files (filename, digest) VALUES (?, ?)",
+                                    self.pending_files.items())
+        self.connection.commit()
+        self.pending_entries = []
+        self.pending_files = {}
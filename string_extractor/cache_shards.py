@@ -0,0 +1,424 @@
+""" Binary cache file format that can be memory-mapped, and merged without loading
+    whole caches into memory, for combining the caches of many extraction processes
+    or nodes.
+
+    A cache file (shard) consists of:
+      header   : magic bytes, format version, and the number and offsets of the other
+                 sections
+      results  : encoded results. Identical results are stored once. A list of strings
+                 is stored as string ids, referring to the string table.
+      index    : fixed-size records (digest, line number, result offset), sorted by digest
+                 and line number, so that entries can be looked up by binary search
+      strings  : string table, with the offset of each string followed by the UTF-8
+                 encoded strings, so that each distinct string is stored once
+      files    : records (file name string id, digest) with the last known digest of
+                 each file name
+
+    Shards are read through mmap, so opening a shard doesn't depend on its size, and
+    only the parts of the file that are used are read. Shards are written from sorted
+    entries, and merged with a streaming k-way merge.
+
+    Usage as a tool:
+      python -m string_extractor.cache_shards merge OUTPUT SHARD [SHARD ...]
+      python -m string_extractor.cache_shards convert PICKLE_CACHE OUTPUT
+"""
+
+import argparse
+import heapq
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+
+from string_extractor.cache_backends import PickleCacheBackend
+
+SHARD_MAGIC = b"SXSHARD\0"
+SHARD_FORMAT_VERSION = 1
+
+# Magic, version, number of entries, strings and files, and offsets of the
+# results, index, strings and files sections
+_header = struct.Struct("<8sIIQQQQQQQ")
+# Key (20-byte digest + big-endian line number, so that keys sort as bytes) and result offset
+_indexRecord = struct.Struct("<24sQ")
+_keySize = 24
+_fileRecord = struct.Struct("<I20s")
+_uint32 = struct.Struct("<I")
+_uint64 = struct.Struct("<Q")
+
+# Result kinds
+_LIST = 0
+_ERROR = 1
+_IGNORE = 2
+_PICKLED = 3
+
+_stringTypes = [ "FULL", "PREFIX", "SUFFIX", "FRAGMENT" ]
+_stringTypeCodes = { stringtype : code for code, stringtype in enumerate(_stringTypes) }
+
+
+def _encodeKey(digest, lineNumber):
+    return bytes.fromhex(digest) + lineNumber.to_bytes(4, "big")
+
+def _decodeKey(key):
+    return (key[:20].hex(), int.from_bytes(key[20:], "big"))
+
+
+class ShardReader:
+    """Read-only access to a shard through mmap."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            self.file.close()
+            raise ValueError("Not a cache shard: {}".format(filename))
+        if len(self.data) < _header.size:
+            self.close()
+            raise ValueError("Not a cache shard: {}".format(filename))
+        ( magic, version, reserved, self.number_of_entries, self.number_of_strings,
+          self.number_of_files, self.results_offset, self.index_offset, self.strings_offset,
+          self.files_offset ) = _header.unpack_from(self.data, 0)
+        if magic != SHARD_MAGIC:
+            self.close()
+            raise ValueError("Not a cache shard: {}".format(filename))
+        if version != SHARD_FORMAT_VERSION:
+            self.close()
+            raise ValueError("Unsupported cache shard version {}: {}".format(version, filename))
+        self.string_cache = {}
+
+    def lookup(self, digest, lineNumber):
+        """Returns the result for a line in a file with a particular digest, or None."""
+        key = _encodeKey(digest, lineNumber)
+        low = 0
+        high = self.number_of_entries
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.index_offset + middle * _indexRecord.size
+            middle_key = self.data[offset:offset + _keySize]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return self._readResult(_uint64.unpack_from(self.data, offset + _keySize)[0])
+        return None
+
+    def iterEntries(self):
+        """Yields 2-tuples (key, result) in key order. Keys are 24-byte encoded
+           (digest, line number) pairs."""
+        for index in range(self.number_of_entries):
+            (key, result_offset) = _indexRecord.unpack_from(self.data,
+                                                           self.index_offset + index * _indexRecord.size)
+            yield (key, self._readResult(result_offset))
+
+    def getFiles(self):
+        """Returns a dictionary with the digest of each file name."""
+        files = {}
+        for index in range(self.number_of_files):
+            (string_id, digest) = _fileRecord.unpack_from(self.data,
+                                                          self.files_offset + index * _fileRecord.size)
+            files[self._readString(string_id)] = digest.hex()
+        return files
+
+    def close(self):
+        if getattr(self, "data", None) is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+    def _readResult(self, offset):
+        kind = self.data[offset]
+        if kind == _ERROR:
+            return "ERROR"
+        elif kind == _IGNORE:
+            return "IGNORE"
+        elif kind == _PICKLED:
+            length = _uint32.unpack_from(self.data, offset + 1)[0]
+            return pickle.loads(self.data[offset + 5:offset + 5 + length])
+        length = _uint32.unpack_from(self.data, offset + 1)[0]
+        result = []
+        position = offset + 5
+        for i in range(length):
+            code = self.data[position]
+            string_id = _uint32.unpack_from(self.data, position + 1)[0]
+            result.append( (_stringTypes[code], self._readString(string_id)) )
+            position += 5
+        return result
+
+    def _readString(self, string_id):
+        string = self.string_cache.get(string_id)
+        if string is None:
+            (start, end) = struct.unpack_from("<QQ", self.data, self.strings_offset + string_id * 8)
+            base = self.strings_offset + (self.number_of_strings + 1) * 8
+            string = self.data[base + start:base + end].decode("utf-8", "surrogatepass")
+            self.string_cache[string_id] = string
+        return string
+
+
+def write_shard(filename, entries, files):
+    """Writes a shard. Entries is an iterable of 2-tuples (key, result) in key order,
+       where keys are (digest, line number) 2-tuples or encoded keys, and files is a
+       dictionary with the digest of each file name. The file is replaced atomically.
+       Returns the number of written entries."""
+    strings = {}
+    results = {}
+    directory = os.path.dirname(os.path.abspath(filename))
+    (handle, temp_filename) = tempfile.mkstemp(dir=directory, prefix=".shard-")
+    try:
+        with os.fdopen(handle, "w+b") as output, tempfile.TemporaryFile() as index:
+            output.write(b"\0" * _header.size)
+            results_offset = output.tell()
+            number_of_entries = 0
+            previous_key = None
+            for key, result in entries:
+                if type(key) is tuple:
+                    key = _encodeKey(key[0], key[1])
+                if previous_key is not None and key <= previous_key:
+                    raise ValueError("Entries are not sorted by key")
+                previous_key = key
+                encoded = _encodeResult(result, strings)
+                result_offset = results.get(encoded)
+                if result_offset is None:
+                    result_offset = output.tell()
+                    output.write(encoded)
+                    results[encoded] = result_offset
+                index.write(_indexRecord.pack(key, result_offset))
+                number_of_entries += 1
+
+            index_offset = output.tell()
+            index.seek(0)
+            while True:
+                block = index.read(1024 * 1024)
+                if not block:
+                    break
+                output.write(block)
+
+            file_records = []
+            for name, digest in sorted(files.items()):
+                file_records.append(_fileRecord.pack(_getStringId(name, strings), bytes.fromhex(digest)))
+
+            strings_offset = output.tell()
+            encoded_strings = [ string.encode("utf-8", "surrogatepass") for string in strings ]
+            position = 0
+            output.write(_uint64.pack(0))
+            for encoded_string in encoded_strings:
+                position += len(encoded_string)
+                output.write(_uint64.pack(position))
+            for encoded_string in encoded_strings:
+                output.write(encoded_string)
+
+            files_offset = output.tell()
+            for record in file_records:
+                output.write(record)
+
+            output.seek(0)
+            output.write(_header.pack(SHARD_MAGIC, SHARD_FORMAT_VERSION, 0, number_of_entries,
+                                      len(strings), len(file_records), results_offset,
+                                      index_offset, strings_offset, files_offset))
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
+    return number_of_entries
+
+
+def _getStringId(string, strings):
+    string_id = strings.get(string)
+    if string_id is None:
+        string_id = strings[string] = len(strings)
+    return string_id
+
+def _encodeResult(result, strings):
+    if result == "ERROR":
+        return bytes( [ _ERROR ] )
+    elif result == "IGNORE":
+        return bytes( [ _IGNORE ] )
+    if ( isinstance(result, list) and
+         all( [ type(item[1]) is str and item[0] in _stringTypeCodes for item in result ] ) ):
+        parts = [ bytes( [ _LIST ] ), _uint32.pack(len(result)) ]
+        for (stringtype, string) in result:
+            parts.append(bytes( [ _stringTypeCodes[stringtype] ] ))
+            parts.append(_uint32.pack(_getStringId(string, strings)))
+        return b"".join(parts)
+    # Results with values that aren't strings
+    data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    return bytes( [ _PICKLED ] ) + _uint32.pack(len(data)) + data
+
+
+class MergeStatistics:
+    """Outcome of merging shards: the number of written entries, the number of entries
+       that occurred in more than one shard with the same result (duplicates), and the
+       conflicts: 3-tuples (digest, line number, list of different results) for entries
+       that occurred with different results."""
+
+    def __init__(self):
+        self.entries = 0
+        self.duplicates = 0
+        self.conflicts = []
+
+
+def merge_shards(output_filename, input_filenames, on_conflict = "first"):
+    """Merges shards into a new shard, using a streaming k-way merge. If an entry has
+       different results in different shards, the result of the first shard (in order of
+       input_filenames) is used if on_conflict is "first", the result of the last shard if
+       it is "last", and a ValueError is raised if it is "error". The digests of file names
+       are taken from the last shard that contains the file name. Returns MergeStatistics."""
+    if on_conflict not in [ "first", "last", "error" ]:
+        raise ValueError("Unknown conflict policy: {}".format(on_conflict))
+    readers = [ ShardReader(filename) for filename in input_filenames ]
+    try:
+        files = {}
+        for reader in readers:
+            files.update(reader.getFiles())
+        statistics = MergeStatistics()
+        streams = [ _tagEntries(reader.iterEntries(), index) for index, reader in enumerate(readers) ]
+        write_shard(output_filename,
+                    _mergeEntries(heapq.merge(*streams), on_conflict, statistics), files)
+        return statistics
+    finally:
+        for reader in readers:
+            reader.close()
+
+def _tagEntries(entries, shard_index):
+    for key, result in entries:
+        yield (key, shard_index, result)
+
+def _mergeEntries(tagged_entries, on_conflict, statistics):
+    """Yields one (key, result) 2-tuple per key from entries that are sorted by key and
+       shard index."""
+    current_key = None
+    results = []
+    for key, shard_index, result in tagged_entries:
+        if key != current_key and current_key is not None:
+            yield (current_key, _resolve(current_key, results, on_conflict, statistics))
+            results = []
+        current_key = key
+        results.append(result)
+    if current_key is not None:
+        yield (current_key, _resolve(current_key, results, on_conflict, statistics))
+
+def _resolve(key, results, on_conflict, statistics):
+    statistics.entries += 1
+    if len(results) == 1:
+        return results[0]
+    distinct_results = []
+    for result in results:
+        if not any( [ _sameResult(result, other) for other in distinct_results ] ):
+            distinct_results.append(result)
+    if len(distinct_results) == 1:
+        statistics.duplicates += 1
+        return results[0]
+    (digest, lineNumber) = _decodeKey(key)
+    statistics.conflicts.append( (digest, lineNumber, distinct_results) )
+    if on_conflict == "error":
+        raise ValueError("Conflicting results for line {} of file with digest {}: {}".format(
+                         lineNumber, digest, distinct_results))
+    return results[0] if on_conflict == "first" else results[-1]
+
+def _sameResult(first, second):
+    # The order of strings within a line isn't significant
+    if isinstance(first, list) and isinstance(second, list):
+        return sorted(first, key=repr) == sorted(second, key=repr)
+    return first == second
+
+
+def convert_pickle_cache(pickle_filename, output_filename):
+    """Converts a pickle cache file (see cache_backends.PickleCacheBackend) into a shard.
+       Caches in the original format, which aren't keyed by digests, can't be converted.
+       Returns the number of written entries."""
+    backend = PickleCacheBackend(pickle_filename)
+    if backend.legacy_entries:
+        raise ValueError("Caches in the original format can't be converted: {}".format(pickle_filename))
+    entries = sorted( [ (_encodeKey(digest, lineNumber), result)
+                        for (digest, lineNumber), result in backend.entries.items() ] )
+    return write_shard(output_filename, entries, backend.files)
+
+
+class ShardCacheBackend:
+    """Persistent cache backend that stores the cache as a shard. The shard is memory-mapped
+       for lookups, so opening a large cache is fast. Stored entries are kept in memory until
+       save() merges them with the shard into a new version of the file.
+       Like the pickle backend, this backend is not suitable for sharing a cache file between
+       processes that run at the same time; each process should write its own shard, and
+       shards can be combined with merge_shards."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.legacy_entries = {}
+        self.pending_entries = {}
+        self.reader = ShardReader(filename) if os.path.exists(filename) else None
+        self.files = self.reader.getFiles() if self.reader is not None else {}
+
+    def lookup(self, digest, lineNumber):
+        result = self.pending_entries.get( (digest, lineNumber) )
+        if result is None and self.reader is not None:
+            result = self.reader.lookup(digest, lineNumber)
+        return result
+
+    def store(self, filename, digest, lineNumber, result):
+        self.pending_entries[(digest, lineNumber)] = result
+        self.files[filename] = digest
+
+    def updateFile(self, filename, digest):
+        previous_digest = self.files.get(filename)
+        self.files[filename] = digest
+        return previous_digest is not None and previous_digest != digest
+
+    def save(self):
+        """Writes a new version of the shard with the stored entries. Entries of files that
+           are no longer present under any file name are removed."""
+        digests = set( [ bytes.fromhex(digest) for digest in self.files.values() ] )
+        pending = sorted( [ (_encodeKey(digest, lineNumber), 0, result)
+                            for (digest, lineNumber), result in self.pending_entries.items() ] )
+        streams = [ pending ]
+        if self.reader is not None:
+            streams.append(_tagEntries(self.reader.iterEntries(), 1))
+        # Stored entries replace entries of the shard with the same key
+        entries = ( (key, result) for (key, result) in
+                    _mergeEntries(heapq.merge(*streams), "first", MergeStatistics())
+                    if key[:20] in digests )
+        temp_filename = self.filename + ".new"
+        write_shard(temp_filename, entries, self.files)
+        if self.reader is not None:
+            self.reader.close()
+        os.replace(temp_filename, self.filename)
+        self.reader = ShardReader(self.filename)
+        self.pending_entries = {}
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Merges and converts cache shards.")
+    subparsers = parser.add_subparsers(dest="command")
+    # The required argument of add_subparsers was added in Python 3.7
+    subparsers.required = True
+    merge_parser = subparsers.add_parser("merge", help="merge shards into a new shard")
+    merge_parser.add_argument("output")
+    merge_parser.add_argument("shards", nargs="+")
+    merge_parser.add_argument("--on-conflict", choices=[ "first", "last", "error" ], default="first",
+                              help="result to use for entries with different results in different shards")
+    convert_parser = subparsers.add_parser("convert", help="convert a pickle cache file into a shard")
+    convert_parser.add_argument("pickle_cache")
+    convert_parser.add_argument("output")
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        statistics = merge_shards(args.output, args.shards, args.on_conflict)
+        print("Merged {} entries ({} duplicates, {} conflicts)".format(
+              statistics.entries, statistics.duplicates, len(statistics.conflicts)), file=sys.stderr)
+        for (digest, lineNumber, results) in statistics.conflicts:
+            print("  conflict: {}:{}: {}".format(digest, lineNumber, results), file=sys.stderr)
+    else:
+        number_of_entries = convert_pickle_cache(args.pickle_cache, args.output)
+        print("Converted {} entries".format(number_of_entries), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
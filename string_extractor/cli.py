@@ -0,0 +1,194 @@
+""" Command-line tool for extracting strings from execution trace files.
+
+    Example:
+
+        $ string-extractor --workers 4 --cache-file cache.dat --collapse trace.txt > strings.jsonl
+        $ string-extractor --index mypackage --cache-file cache.dat
+
+    Trace files are read as streams (see trace.read_trace for the supported formats). The
+    output is written as JSON lines: one object per line, or one object per string if
+    the output is collapsed. Strings that are bytes values are written as an object
+    with their hexadecimal representation (see json_encoding). A timing summary is
+    printed to standard error.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from string_extractor import StringExtractor
+from string_extractor.cache_backends import SQLiteCacheBackend
+from string_extractor.cache_shards import ShardCacheBackend
+from string_extractor.json_encoding import encode_json_value
+from string_extractor.trace import TRACE_FORMATS, count_lines, guess_trace_format, read_trace
+
+class _Timer:
+    """Accumulates the time spent in each stage of processing a trace."""
+
+    def __init__(self):
+        self.times = {}
+
+    def add(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def timeIterator(self, stage, iterable):
+        """Yields the items of an iterable, adding the time spent retrieving them
+           to a stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description="Extracts strings relevant to control flow from the lines in execution traces.")
+    parser.add_argument("traces", nargs="*", metavar="TRACE",
+                        help="trace file to process (- for standard input)")
+    parser.add_argument("--index", action="append", default=[], metavar="PACKAGE",
+                        help="extract strings from all lines of a package (name or directory) ahead "
+                             "of time, e.g. to build a persistent cache (can be used multiple times)")
+    parser.add_argument("--format", choices=TRACE_FORMATS,
+                        help="format of the trace files (default: based on the file extension)")
+    parser.add_argument("--context", help="only process lines executed in this Coverage.py context")
+    parser.add_argument("-o", "--output", default="-", help="output file (default: standard output)")
+    parser.add_argument("--collapse", action="store_true",
+                        help="output the distinct strings of all lines, instead of the strings per line")
+    parser.add_argument("--count", action="store_true",
+                        help="output each distinct line once, with its number of occurrences")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="number of lines per chunk when using worker processes")
+    parser.add_argument("--cache-file", help="pickle file to load the cache from and save it to")
+    parser.add_argument("--sqlite-cache", help="SQLite database to use as persistent cache")
+    parser.add_argument("--shard-cache", help="cache shard to use as persistent cache")
+    parser.add_argument("--no-cache", action="store_true", help="don't cache extracted strings")
+    parser.add_argument("--analyze-files", action="store_true", help="enable whole file analysis")
+    parser.add_argument("--prefilter", action="store_true", help="enable the prefilter")
+    parser.add_argument("--quiet", action="store_true", help="don't print a timing summary")
+    args = parser.parse_args(argv)
+    if not args.traces and not args.index:
+        parser.error("no trace files or packages to index")
+
+    timer = _Timer()
+    start = time.perf_counter()
+
+    cache_backend = None
+    if args.sqlite_cache:
+        cache_backend = SQLiteCacheBackend(args.sqlite_cache)
+    elif args.shard_cache:
+        cache_backend = ShardCacheBackend(args.shard_cache)
+    extractor = StringExtractor(not args.no_cache, args.cache_file, args.analyze_files,
+                                cache_backend, args.workers, args.prefilter,
+                                statistics = not args.quiet)
+    timer.add("cache", time.perf_counter() - start)
+
+    if args.index:
+        index_start = time.perf_counter()
+        indexed_lines = extractor.index_packages(args.index, args.chunk_size)
+        timer.add("index", time.perf_counter() - index_start)
+        if not args.quiet:
+            print("Indexed {} lines".format(indexed_lines), file=sys.stderr)
+
+    lines = timer.timeIterator("read", _readTraces(args.traces, args.format, args.context))
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        number_of_lines = _processLines(extractor, lines, output, args, timer)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    save_start = time.perf_counter()
+    if not args.no_cache:
+        extractor.save()
+    extractor.close()
+    timer.add("cache", time.perf_counter() - save_start)
+
+    if not args.quiet:
+        _printSummary(extractor, number_of_lines, time.perf_counter() - start, timer)
+
+def _processLines(extractor, lines, output, args, timer):
+    """Extracts strings from the lines of the traces and writes the output. Returns
+       the number of processed lines."""
+    process_start = time.perf_counter()
+    counted_lines = _CountingIterator(lines)
+    if args.collapse:
+        strings = extractor.collect_batch(counted_lines, args.chunk_size).get_strings()
+        write_start = time.perf_counter()
+        for (stringtype, string) in strings:
+            output.write(json.dumps( { "type" : stringtype, "string" : string },
+                                     default=encode_json_value) + "\n")
+        timer.add("write", time.perf_counter() - write_start)
+    else:
+        if args.count:
+            counts = count_lines(counted_lines)
+            results = extractor.iter_batch(counts.keys(), args.chunk_size)
+        else:
+            counts = None
+            results = extractor.iter_batch(counted_lines, args.chunk_size)
+        for (filename, line_number, result) in results:
+            write_start = time.perf_counter()
+            line_output = { "filename" : filename, "line" : line_number, "result" : result }
+            if counts != None:
+                line_output["count"] = counts[(filename, line_number)]
+            output.write(json.dumps(line_output, default=encode_json_value) + "\n")
+            timer.add("write", time.perf_counter() - write_start)
+    # Reading traces and writing output are interleaved with extracting strings
+    timer.add("extract", time.perf_counter() - process_start -
+                         timer.times.get("read", 0.0) - timer.times.get("write", 0.0))
+    return counted_lines.count
+
+class _CountingIterator:
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self.iterator)
+        self.count += 1
+        return item
+
+def _readTraces(filenames, trace_format, context):
+    for filename in filenames:
+        file_format = trace_format if trace_format != None else guess_trace_format(filename)
+        if filename == "-":
+            yield from read_trace(sys.stdin, file_format, context)
+        else:
+            with open(filename, "r", newline="") as file:
+                yield from read_trace(file, file_format, context)
+
+def _printSummary(extractor, number_of_lines, total_time, timer):
+    statistics = extractor.get_cache_statistics()
+    rate = number_of_lines / total_time if total_time > 0 else 0.0
+    print("Processed {} lines in {:.3f} s ({:.0f} lines/s)".format(number_of_lines, total_time, rate),
+          file=sys.stderr)
+    for stage, description in [ ("index", "indexing packages"),
+                                ("read", "reading traces"),
+                                ("extract", "extracting strings"),
+                                ("cache", "loading and saving cache"),
+                                ("write", "writing output") ]:
+        if stage == "index" and stage not in timer.times:
+            continue
+        print("  {:<26}{:>9.3f} s".format(description, timer.times.get(stage, 0.0)), file=sys.stderr)
+    print("  cache hits: {}, misses: {}, persistent hits: {}".format(
+          statistics["hits"], statistics["misses"], statistics["persistent_hits"]), file=sys.stderr)
+    stages = extractor.get_statistics()["stages"]
+    if stages:
+        print("  extraction stages (in the main process):", file=sys.stderr)
+        for stage in sorted(stages):
+            print("    {:<24}{:>9.3f} s {:>10} times".format(stage, stages[stage]["time"],
+                                                          stages[stage]["count"]), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
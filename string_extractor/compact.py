@@ -0,0 +1,94 @@
+""" Compact representation of the results of lines, for keeping large caches in memory.
+
+    Results are lists of 2-tuples (string type, string), and the same strings usually
+    occur in the results of many lines. In the compact representation, each distinct
+    2-tuple is stored once in a table, and the result of a line is a tuple of the ids of
+    its 2-tuples. Identical results share a single tuple, so lines without any strings,
+    or with the same strings, don't take up additional memory. The ERROR and IGNORE
+    results are kept as they are."""
+
+import sys
+
+class CompactResultTable:
+    """Table of interned 2-tuples (string type, string), for encoding results in the
+       compact representation and decoding them back into lists of 2-tuples.
+
+       Each call of encode adds a reference to the result, which is removed by release,
+       e.g. when the entry of the result is removed from a cache. Results without
+       references are removed, and so are the 2-tuples that are no longer used by
+       any result. Their ids are reused for new 2-tuples."""
+
+    def __init__(self):
+        # 2-tuples by id (None for ids that aren't used), and the number of
+        # distinct results that contain each 2-tuple
+        self.items = []
+        self.item_references = []
+        self.item_ids = {}
+        self.free_item_ids = []
+        # Distinct results, and the number of references to each result
+        self.results = {}
+        self.result_references = {}
+
+    def encode(self, result):
+        """Returns the compact representation of a result, and adds a reference to it."""
+        if result == "ERROR" or result == "IGNORE":
+            return result
+        ids = []
+        for item in result:
+            item_id = self.item_ids.get(item)
+            if item_id is None:
+                item_id = self._addItem(item)
+            ids.append(item_id)
+        ids = tuple(ids)
+        compact_result = self.results.get(ids)
+        if compact_result is None:
+            compact_result = self.results[ids] = ids
+            self.result_references[ids] = 1
+            for item_id in ids:
+                self.item_references[item_id] += 1
+        else:
+            self.result_references[compact_result] += 1
+        return compact_result
+
+    def decode(self, compact_result):
+        """Returns a result in the format of StringExtractor.get_batch (a new list, with
+           2-tuples that are shared with other results)."""
+        if compact_result == "ERROR" or compact_result == "IGNORE":
+            return compact_result
+        items = self.items
+        return [ items[item_id] for item_id in compact_result ]
+
+    def release(self, compact_result):
+        """Removes a reference to a result that was returned by encode."""
+        if compact_result == "ERROR" or compact_result == "IGNORE":
+            return
+        references = self.result_references[compact_result] - 1
+        if references > 0:
+            self.result_references[compact_result] = references
+            return
+        del self.result_references[compact_result]
+        del self.results[compact_result]
+        for item_id in compact_result:
+            self.item_references[item_id] -= 1
+            if self.item_references[item_id] == 0:
+                del self.item_ids[self.items[item_id]]
+                self.items[item_id] = None
+                self.free_item_ids.append(item_id)
+
+    def getStatistics(self):
+        """Returns the number of distinct 2-tuples (string type, string) and distinct results."""
+        return { "strings" : len(self.item_ids),
+                 "results" : len(self.results) }
+
+    def _addItem(self, item):
+        # Store the strings in the table once
+        item = ( sys.intern(item[0]), item[1] )
+        if self.free_item_ids:
+            item_id = self.free_item_ids.pop()
+            self.items[item_id] = item
+        else:
+            item_id = len(self.items)
+            self.items.append(item)
+            self.item_references.append(0)
+        self.item_ids[item] = item_id
+        return item_id
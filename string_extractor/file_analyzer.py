@@ -0,0 +1,106 @@
+""" Internal classes for analyzing a complete source file in a single pass,
+    so that interesting strings can be looked up per line without parsing
+    individual statements again."""
+
+import ast
+
+from string_extractor.string_collector import InterestingStringCollector
+
+class FileAnalysis:
+    """Per-line index of a parsed source file. Maps the first line of every
+       statement to the last line of the statement (if known) and to the
+       interesting strings in that statement."""
+
+    def __init__(self):
+        self.spans = {}
+        self.results = {}
+
+    def getResult(self, lineNumber):
+        """Returns the result for a line ("IGNORE" or a list of 2-tuples with
+           interesting strings), or None if no statement starts on this line."""
+        return self.results.get(lineNumber)
+
+    def getSpan(self, lineNumber):
+        """Returns a 2-tuple with the first and last line of the statement that
+           starts on this line, or None if no statement starts on this line or
+           its last line isn't known."""
+        endLineNumber = self.spans.get(lineNumber)
+        if endLineNumber is None:
+            return None
+        return (lineNumber, endLineNumber)
+
+
+class FileAnalyzer:
+    """Parses a source file once and collects interesting strings for every
+       statement. For compound statements only the statement header (e.g. the
+       condition of an if statement) is used, the same way the line-by-line
+       preprocessor handles these statements."""
+
+    # Fields of statement nodes that contain other statements, or that are
+    # located on different lines than the statement itself.
+    _nestedFields = frozenset( [ "body", "orelse", "finalbody", "handlers",
+                                 "cases", "decorator_list" ] )
+
+    _ignoredStatements = tuple( getattr(ast, name) for name in [ "Try", "TryStar" ]
+                                if hasattr(ast, name) )
+
+    def analyzeSource(self, source):
+        """Analyzes the source code of a file. Returns a FileAnalysis object, or
+           None if the source can't be parsed as a whole."""
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return None
+
+        lines = source.split("\n")
+        collectors = {}
+        analysis = FileAnalysis()
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ExceptHandler):
+                analysis.results[node.lineno] = "IGNORE"
+                continue
+            elif not isinstance(node, ast.stmt):
+                continue
+
+            for decorator in getattr(node, "decorator_list", []):
+                analysis.results[decorator.lineno] = "IGNORE"
+
+            lineNumber = node.lineno
+            endLineNumber = getattr(node, "end_lineno", None)
+            if endLineNumber is not None:
+                analysis.spans[lineNumber] = max(endLineNumber,
+                                                 analysis.spans.get(lineNumber, endLineNumber))
+
+            if isinstance(node, self._ignoredStatements):
+                analysis.results[lineNumber] = "IGNORE"
+                continue
+            elif lineNumber <= len(lines) and lines[lineNumber - 1].strip().startswith("@"):
+                # Python < 3.8 reports the line of the first decorator as the
+                # line number of a decorated definition.
+                analysis.results[lineNumber] = "IGNORE"
+                continue
+
+            collector = collectors.get(lineNumber)
+            if collector is None:
+                collector = InterestingStringCollector()
+                collectors[lineNumber] = collector
+            self._visitStatementHeader(collector, node)
+
+        for lineNumber, collector in collectors.items():
+            if analysis.results.get(lineNumber) != "IGNORE":
+                analysis.results[lineNumber] = collector.getCollectedStrings()
+
+        return analysis
+
+    def _visitStatementHeader(self, collector, node):
+        """Visits all parts of a statement, except nested statements."""
+        for field, value in ast.iter_fields(node):
+            if field in self._nestedFields:
+                continue
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        collector.visit(item)
+            elif isinstance(value, ast.AST):
+                collector.visit(value)
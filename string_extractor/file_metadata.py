@@ -0,0 +1,107 @@
+""" Internal classes for reading source files and keeping per-file metadata
+    (line count, line offsets and stripped line text) in memory, so that
+    a file doesn't have to be read again for every line that is processed."""
+
+import collections
+import hashlib
+import os
+import tokenize
+
+class FileMetadata:
+    """Source text and line information of a single file."""
+
+    def __init__(self, filename, mtime, size, source):
+        self.filename = filename
+        self.mtime = mtime
+        self.size = size
+        self.source = source
+        self._digest = None
+
+        lines = source.split("\n")
+        if lines[-1] == "":
+            # The file ends with a newline, or is empty
+            lines.pop()
+
+        self.number_of_lines = len(lines)
+        self.lines = [ line.strip() for line in lines ]
+        self.line_offsets = []
+        offset = 0
+        for line in lines:
+            self.line_offsets.append(offset)
+            offset += len(line) + 1
+
+    @property
+    def digest(self):
+        """SHA-1 digest of the source text (computed on first use)."""
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.source.encode("utf-8", "surrogateescape")).hexdigest()
+        return self._digest
+
+    def getLine(self, lineNumber):
+        """Returns the stripped text of a line, or an empty string if the
+           line number is out of range (like linecache.getline)."""
+        if 1 <= lineNumber <= self.number_of_lines:
+            return self.lines[lineNumber - 1]
+        else:
+            return ""
+
+    def getLineOffset(self, lineNumber):
+        """Returns the offset of the first character of a line in the source text."""
+        return self.line_offsets[lineNumber - 1]
+
+
+class FileMetadataCache:
+    """Bounded cache of FileMetadata objects. Entries are validated against the
+       modification time and size of the file, and the least recently used
+       entries are evicted if the cache contains more than max_files files, or
+       more than max_bytes characters of source text."""
+
+    def __init__(self, max_files = 256, max_bytes = 64 * 1024 * 1024):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+
+    def get(self, filename):
+        """Returns the metadata of a file, reading the file if it isn't cached
+           or has been modified. Raises OSError if the file can't be read."""
+        stat = os.stat(filename)
+        metadata = self.entries.get(filename)
+        if metadata is not None:
+            if metadata.mtime == stat.st_mtime and metadata.size == stat.st_size:
+                self.entries.move_to_end(filename)
+                return metadata
+            self.invalidate(filename)
+
+        metadata = FileMetadata(filename, stat.st_mtime, stat.st_size, self._readSource(filename))
+        self.entries[filename] = metadata
+        self.total_bytes += len(metadata.source)
+        self._evict()
+        return metadata
+
+    def invalidate(self, filename):
+        """Removes a file from the cache."""
+        metadata = self.entries.pop(filename, None)
+        if metadata is not None:
+            self.total_bytes -= len(metadata.source)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def _evict(self):
+        # Always keep the most recently used file, even if it is larger than max_bytes.
+        while len(self.entries) > 1 and ( len(self.entries) > self.max_files or
+                                          self.total_bytes > self.max_bytes ):
+            filename, metadata = self.entries.popitem(last=False)
+            self.total_bytes -= len(metadata.source)
+
+    def _readSource(self, filename):
+        """Reads a source file, using the encoding declaration of the file if
+           present (like linecache)."""
+        try:
+            with tokenize.open(filename) as file:
+                return file.read()
+        except (SyntaxError, UnicodeDecodeError):
+            with open(filename, "r", errors="replace") as file:
+                return file.read()
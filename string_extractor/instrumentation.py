@@ -0,0 +1,119 @@
+""" Optional instrumentation of the stages of extracting strings: counters and cumulative
+    timers per stage, and outcomes per file.
+
+    Instrumentation is enabled per StringExtractor, by replacing the methods of the
+    stages with timed versions on that extractor. Extractors without instrumentation
+    run the original methods, so instrumentation has no overhead when it is disabled.
+
+    Stages:
+      read              : reading source files
+      preprocess        : preprocessing lines (_preprocessLine), including parse attempts
+      parse             : parsing statements with ast.parse, both while preprocessing
+                          (checking whether a statement is complete) and for extracting strings
+      visit             : collecting strings from parse trees
+      analyze           : whole file analysis
+      bytecode          : looking up lines in code objects
+      extract           : extracting strings from lines that aren't cached (all of the above,
+                          except reading files that are only needed for cache lookups)
+      cache_lookup      : looking up lines in the cache, including the persistent cache
+      persistent_lookup : looking up lines in the persistent cache
+      cache_store       : storing lines in the cache and persistent cache
+      load              : loading the persistent cache
+      save              : saving the persistent cache
+
+    Times are inclusive: the time of a stage includes the time of the stages it uses.
+"""
+
+import time
+
+class ExtractionStatistics:
+    """Counters and cumulative timers per stage, and the number of lines with each
+       outcome per file."""
+
+    def __init__(self, callback = None):
+        """ Arguments:
+             - callback: function that is called with the name of the stage and its
+                 duration in seconds each time a stage has been completed, e.g. for
+                 exporting metrics
+        """
+        self.callback = callback
+        # Per stage: [number of times completed, cumulative time in seconds]
+        self.stages = {}
+        # Per file: [lines, lines with ERROR result, lines with IGNORE result]
+        self.files = {}
+
+    def record(self, stage, seconds):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = [ 0, 0.0 ]
+        entry[0] += 1
+        entry[1] += seconds
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def recordLine(self, filename, result):
+        """Records the outcome of extracting strings from a line."""
+        entry = self.files.get(filename)
+        if entry is None:
+            entry = self.files[filename] = [ 0, 0, 0 ]
+        entry[0] += 1
+        if result == "ERROR":
+            entry[1] += 1
+        elif result == "IGNORE":
+            entry[2] += 1
+
+    def timed(self, stage, function):
+        """Returns a version of a function that records its duration as a stage."""
+        perf_counter = time.perf_counter
+        def _timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, perf_counter() - start)
+        return _timed
+
+    def instrument(self, extractor):
+        """Replaces the stage methods of a StringExtractor with timed versions."""
+        for stage, name in [ ("preprocess", "_preprocessLine"),
+                             ("parse", "_isParsable"),
+                             ("parse", "_parseStatement"),
+                             ("visit", "_collectStrings"),
+                             ("analyze", "_getFileAnalysis"),
+                             ("cache_lookup", "_lookupCache"),
+                             ("persistent_lookup", "_lookupPersistentCache"),
+                             ("cache_store", "_storeCache"),
+                             ("save", "save") ]:
+            setattr(extractor, name, self.timed(stage, getattr(extractor, name)))
+
+        extractLine = self.timed("extract", extractor._extractLine)
+        def _extractLine(filename, lineNumber):
+            result = extractLine(filename, lineNumber)
+            self.recordLine(filename, result)
+            return result
+        extractor._extractLine = _extractLine
+
+        extractor.file_metadata._readSource = self.timed("read", extractor.file_metadata._readSource)
+        if extractor.code_extractor != None:
+            extractor.code_extractor.getResult = self.timed("bytecode", extractor.code_extractor.getResult)
+
+    def getStatistics(self):
+        """Returns a dictionary with:
+             - stages: per stage, the number of times it has been completed (count) and
+                 the cumulative time in seconds (time)
+             - parse_attempts_per_statement: average number of times ast.parse was
+                 called per extracted line
+             - files: per file, the number of extracted lines and the fraction of these
+                 lines with an ERROR or IGNORE result
+        """
+        stages = { stage : { "count" : entry[0], "time" : entry[1] }
+                   for stage, entry in self.stages.items() }
+        statements = self.stages.get("extract", [ 0 ])[0]
+        parse_attempts = self.stages.get("parse", [ 0 ])[0]
+        files = { filename : { "lines"       : entry[0],
+                               "error_rate"  : entry[1] / entry[0],
+                               "ignore_rate" : entry[2] / entry[0] }
+                  for filename, entry in self.files.items() }
+        return { "stages"                       : stages,
+                 "parse_attempts_per_statement" : parse_attempts / statements if statements > 0 else 0.0,
+                 "files"                        : files }
@@ -0,0 +1,22 @@
+""" Encoding of extracted strings in JSON, as used by the extraction server and the
+    command-line tool.
+
+    Most extracted strings are str values, which are encoded as JSON strings. Prefixes and
+    suffixes can also be bytes values, e.g. for b"..".startswith( (b"\\xfd7zXZ", ) ). These
+    are encoded as an object with the hexadecimal representation of the bytes:
+
+        ["PREFIX", {"bytes": "fd377a585a"}]
+"""
+
+def encode_json_value(value):
+    """Encodes values that aren't supported by the json module. Can be used as the
+       default argument of json.dumps. Raises TypeError for unsupported values."""
+    if isinstance(value, (bytes, bytearray)):
+        return { "bytes" : bytes(value).hex() }
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
+
+def decode_string(value):
+    """Decodes an extracted string that was encoded with encode_json_value."""
+    if isinstance(value, dict) and "bytes" in value:
+        return bytes.fromhex(value["bytes"])
+    return value
@@ -0,0 +1,143 @@
+""" Bounded in-memory cache for extracted strings.
+
+    BoundedCache can be used instead of the unbounded dictionary that a
+    StringExtractor uses as its cache by default. It evicts the least recently
+    used entries if the cache exceeds a maximum number of entries or a maximum
+    (estimated) size in bytes, and can expire entries after a fixed time."""
+
+import collections
+import sys
+import time
+
+from collections.abc import MutableMapping
+
+class BoundedCache(MutableMapping):
+    """Cache of extracted strings, keyed by 2-tuples (file name, line number).
+
+       Arguments:
+        - max_entries: maximum number of entries (None for no limit)
+        - max_bytes: maximum estimated size of the entries in bytes (None for no limit)
+        - ttl: time in seconds after which entries expire (None for no expiry)
+        - on_evict: function that is called with the key of each entry that is
+            evicted, expired, invalidated or deleted
+        - on_remove: function that is called with the key and result of each entry that
+            is removed, including entries that are replaced by a new result
+    """
+
+    def __init__(self, max_entries = None, max_bytes = None, ttl = None, on_evict = None,
+                 on_remove = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.on_remove = on_remove
+        # Values are 3-tuples (result, estimated size, expiry time)
+        self.entries = collections.OrderedDict()
+        self.files = {}
+        self.total_bytes = 0
+        self.statistics = { "evictions"     : 0,
+                            "expirations"   : 0,
+                            "invalidations" : 0 }
+
+    def get(self, key, default = None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        if entry[2] is not None and entry[2] <= time.monotonic():
+            self._remove(key)
+            self.statistics["expirations"] += 1
+            return default
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def __getitem__(self, key):
+        result = self.get(key, self)
+        if result is self:
+            raise KeyError(key)
+        return result
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __setitem__(self, key, result):
+        if key in self.entries:
+            self._remove(key, False)
+        size = self._estimateSize(key, result)
+        expiry = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.entries[key] = (result, size, expiry)
+        self.files.setdefault(key[0], set()).add(key)
+        self.total_bytes += size
+        self._evict()
+
+    def __delitem__(self, key):
+        if key not in self.entries:
+            raise KeyError(key)
+        self._remove(key)
+
+    def items(self):
+        """Returns a list of 2-tuples (key, result) with the entries that haven't expired,
+           e.g. for saving the cache. Unlike get, this doesn't remove expired entries or
+           change the order of eviction."""
+        now = time.monotonic()
+        return [ (key, entry[0]) for key, entry in self.entries.items()
+                 if entry[2] is None or entry[2] > now ]
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def invalidate(self, filename):
+        """Removes all entries of a file. Returns the number of removed entries."""
+        keys = list(self.files.get(filename, []))
+        for key in keys:
+            self._remove(key)
+        self.statistics["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        for key in list(self.entries):
+            self._remove(key)
+
+    def getStatistics(self):
+        """Returns the number of entries and files, the estimated size of the
+           entries in bytes, the limits of the cache and the number of evicted,
+           expired and invalidated entries."""
+        statistics = { "entries"     : len(self.entries),
+                       "files"       : len(self.files),
+                       "bytes"       : self.total_bytes,
+                       "max_entries" : self.max_entries,
+                       "max_bytes"   : self.max_bytes,
+                       "ttl"         : self.ttl }
+        statistics.update(self.statistics)
+        return statistics
+
+    def _evict(self):
+        while len(self.entries) > 0 and (
+                ( self.max_entries is not None and len(self.entries) > self.max_entries ) or
+                ( self.max_bytes is not None and self.total_bytes > self.max_bytes ) ):
+            self._remove(next(iter(self.entries)))
+            self.statistics["evictions"] += 1
+
+    def _remove(self, key, notify = True):
+        (result, size, expiry) = self.entries.pop(key)
+        self.total_bytes -= size
+        keys = self.files[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.files[key[0]]
+        if notify and self.on_evict is not None:
+            self.on_evict(key)
+        if self.on_remove is not None:
+            self.on_remove(key, result)
+
+    def _estimateSize(self, key, result):
+        """Estimates the memory used by an entry. Strings that are shared with other
+           entries are counted for each entry."""
+        size = sys.getsizeof(key) + sys.getsizeof(key[1])
+        size += sys.getsizeof(result)
+        if isinstance(result, list):
+            for item in result:
+                size += sys.getsizeof(item) + sys.getsizeof(item[1])
+        return size
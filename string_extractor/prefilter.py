@@ -0,0 +1,91 @@
+""" Internal class for cheaply determining whether a statement could contain
+    interesting strings, so that statements that can't contain any don't need to
+    be parsed.
+
+    A statement can only contain interesting strings if it contains a quote
+    character as well as an operator or name that the InterestingStringCollector
+    looks for. For each file, the prefilter records which lines contain quotes and
+    which lines contain these operators, using a single regular expression search
+    over the source text."""
+
+import bisect
+import re
+
+_quotePattern = re.compile(r"['\"]")
+_operatorPattern = re.compile(r"==|!=|\b(?:in|startswith|endswith|find|index)\b")
+
+class LineMap:
+    """Sorted line numbers of the lines of a file that contain quotes and
+       interesting operators."""
+
+    def __init__(self, metadata):
+        self.quote_lines = self._findLines(_quotePattern, metadata)
+        self.operator_lines = self._findLines(_operatorPattern, metadata)
+
+    def mayContainStrings(self, firstLineNumber, lastLineNumber):
+        """Determines whether a statement on lines firstLineNumber through
+           lastLineNumber could contain interesting strings."""
+        return ( self._containsLine(self.quote_lines, firstLineNumber, lastLineNumber) and
+                 self._containsLine(self.operator_lines, firstLineNumber, lastLineNumber) )
+
+    def _containsLine(self, lines, firstLineNumber, lastLineNumber):
+        index = bisect.bisect_left(lines, firstLineNumber)
+        return index < len(lines) and lines[index] <= lastLineNumber
+
+    def _findLines(self, pattern, metadata):
+        lines = []
+        offsets = metadata.line_offsets
+        for match in pattern.finditer(metadata.source):
+            lineNumber = bisect.bisect_right(offsets, match.start())
+            if not lines or lines[-1] != lineNumber:
+                lines.append(lineNumber)
+        return lines
+
+
+class LinePrefilter:
+
+    def __init__(self, max_files = 256):
+        self.max_files = max_files
+        self.line_maps = {}
+        self.statistics = { "checked"         : 0,
+                            "skipped_parse"   : 0,
+                            "skipped_visit"   : 0 }
+
+    def canSkipLines(self, metadata, firstLineNumber, lastLineNumber):
+        """Determines whether a statement that starts on firstLineNumber and ends
+           no later than lastLineNumber certainly doesn't contain interesting strings,
+           so that it doesn't need to be parsed."""
+        self.statistics["checked"] += 1
+        if self._getLineMap(metadata).mayContainStrings(firstLineNumber, lastLineNumber):
+            return False
+        self.statistics["skipped_parse"] += 1
+        return True
+
+    def canSkipStatement(self, statement):
+        """Determines whether a preprocessed statement certainly doesn't contain
+           interesting strings, so that it doesn't need to be visited."""
+        if _quotePattern.search(statement) and _operatorPattern.search(statement):
+            return False
+        self.statistics["skipped_visit"] += 1
+        return True
+
+    def getStatistics(self):
+        """Returns the number of checked lines, the number of lines that weren't parsed
+           or weren't visited, and the fraction of checked lines that was skipped
+           in either way (skip_rate)."""
+        statistics = dict(self.statistics)
+        checked = statistics["checked"]
+        skipped = statistics["skipped_parse"] + statistics["skipped_visit"]
+        statistics["skip_rate"] = skipped / checked if checked > 0 else 0.0
+        return statistics
+
+    def _getLineMap(self, metadata):
+        entry = self.line_maps.get(metadata.filename)
+        if entry is not None and entry[0] is metadata:
+            return entry[1]
+
+        lineMap = LineMap(metadata)
+        self.line_maps[metadata.filename] = (metadata, lineMap)
+        if len(self.line_maps) > self.max_files:
+            del self.line_maps[next(iter(self.line_maps))]
+        return lineMap
@@ -0,0 +1,304 @@
+""" Extraction server that owns a single warm StringExtractor, and a client with the
+    interface of StringExtractor, so that multiple processes (e.g. test workers) can
+    share one cache instead of each loading, warming up and saving their own.
+
+    Clients connect to the server over a Unix domain socket. The protocol consists of
+    JSON objects, one per line. A request has an id, a method name and parameters:
+
+        {"id": 1, "method": "get_batch", "params": {"lines": [["hello.py", 5]], "collapse_output": true}}
+
+    The server sends a response with the same id for each request, with either a result
+    or an error message:
+
+        {"id": 1, "result": [["FULL", "english"]]}
+        {"id": 2, "error": "Unknown method: foo"}
+
+    Requests on a connection are processed in order, so clients can send multiple
+    requests without waiting for their responses (pipelining). Extracted strings that
+    are bytes values are encoded as described in json_encoding.
+
+    Example:
+
+        $ string-extractor-server --socket /tmp/string-extractor.sock --cache-file /tmp/cache.dat
+
+        client = ExtractionClient("/tmp/string-extractor.sock")
+        strings = client.get_batch([("hello.py", 5), ("hello.py", 7)], True)
+"""
+
+import argparse
+import collections
+import json
+import os
+import select
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+from string_extractor import StringExtractor
+from string_extractor.aggregation import StringSetCollector
+from string_extractor.cache_backends import SQLiteCacheBackend
+from string_extractor.json_encoding import decode_string, encode_json_value
+
+class ExtractionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves requests of ExtractionClients, using a single thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, extractor = None, save_interval = None):
+        """ Arguments:
+             - socket_path: path of the Unix domain socket to listen on. An existing
+                 socket file at this path is removed.
+             - extractor: StringExtractor that processes all requests (a new one if None).
+                 The extractor should be thread-safe, since connections are served on
+                 separate threads.
+             - save_interval: interval (in seconds) at which the cache of the extractor
+                 is saved, or None to only save it when the server is closed
+        """
+        self.socket_path = socket_path
+        self.extractor = extractor if extractor != None else StringExtractor(thread_safe = True)
+        self.save_interval = save_interval
+        self.save_thread = None
+        self.save_stop = threading.Event()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _RequestHandler)
+
+    def serve_forever(self, poll_interval = 0.5):
+        if self.save_interval != None and self.save_thread == None:
+            self.save_thread = threading.Thread(target=self._saveExtractor,
+                                                name="string-extractor-save", daemon=True)
+            self.save_thread.start()
+        super().serve_forever(poll_interval)
+
+    def server_close(self):
+        """Closes the socket and saves the cache of the extractor."""
+        super().server_close()
+        if self.save_thread != None:
+            self.save_stop.set()
+            self.save_thread.join()
+            self.save_thread = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.extractor.save()
+        self.extractor.close()
+
+    def handleRequest(self, request):
+        """Processes a single request. Returns the response."""
+        response = { "id" : request.get("id") if isinstance(request, dict) else None }
+        try:
+            method = request["method"]
+            params = request.get("params", {})
+            if method == "get_batch":
+                response["result"] = self.extractor.get_batch(
+                    [ tuple(line) for line in params["lines"] ],
+                    params.get("collapse_output", False),
+                    params.get("count_occurrences", False))
+            elif method == "get_cache_statistics":
+                response["result"] = self.extractor.get_cache_statistics()
+            elif method == "invalidate":
+                self.extractor.invalidate(params["filename"])
+                response["result"] = None
+            elif method == "save":
+                self.extractor.save()
+                response["result"] = None
+            else:
+                response["error"] = "Unknown method: {}".format(method)
+        except Exception as e:
+            response["error"] = "{}: {}".format(type(e).__name__, e)
+        return response
+
+    def _saveExtractor(self):
+        while not self.save_stop.wait(self.save_interval):
+            self.extractor.save()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = { "id" : None, "error" : "Invalid request: {}".format(e) }
+            else:
+                response = self.server.handleRequest(request)
+            self.wfile.write(self._encodeResponse(response) + b"\n")
+            self.wfile.flush()
+
+    def _encodeResponse(self, response):
+        try:
+            return json.dumps(response, default=encode_json_value).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            # Send an error instead of dropping the connection
+            return json.dumps( { "id"    : response["id"],
+                                 "error" : "{}: {}".format(type(e).__name__, e) } ).encode("utf-8")
+
+
+class ExtractionClient:
+    """Client for an ExtractionServer, with the interface of StringExtractor."""
+
+    def __init__(self, socket_path, timeout = None, pipeline_depth = 8):
+        """ Arguments:
+             - socket_path: path of the Unix domain socket of the server
+             - timeout: timeout (in seconds) for socket operations, or None to wait
+                 indefinitely
+             - pipeline_depth: maximum number of requests that iter_batch sends
+                 before waiting for a response
+        """
+        self.socket_path = socket_path
+        self.pipeline_depth = pipeline_depth
+        self.timeout = timeout
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(socket_path)
+        # Responses are received while requests are sent, so that the server is never
+        # blocked writing a response while the client is blocked sending a request.
+        self.socket.setblocking(False)
+        self.receive_buffer = bytearray()
+        self.responses = collections.deque()
+        self.next_id = 0
+
+    def get_batch(self, lines, collapse_output = False, count_occurrences = False):
+        """See StringExtractor.get_batch."""
+        request_id = self._sendBatch(lines, collapse_output, count_occurrences)
+        return self._convertBatchOutput(self._receive(request_id), collapse_output)
+
+    def iter_batch(self, lines, chunk_size = 10000):
+        """ See StringExtractor.iter_batch. Chunks of lines are sent to the server without
+            waiting for the results of previous chunks, up to pipeline_depth chunks."""
+        chunk_size = chunk_size if chunk_size != None else sys.maxsize
+        pending = collections.deque()
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                pending.append(self._sendBatch(chunk))
+                chunk = []
+                if len(pending) >= self.pipeline_depth:
+                    yield from self._convertBatchOutput(self._receive(pending.popleft()))
+        if chunk:
+            pending.append(self._sendBatch(chunk))
+        while pending:
+            yield from self._convertBatchOutput(self._receive(pending.popleft()))
+
+    def collect_batch(self, lines, chunk_size = 10000, collector = None):
+        """See StringExtractor.collect_batch."""
+        if collector == None:
+            collector = StringSetCollector()
+        for (filename, line_number, line_data) in self.iter_batch(lines, chunk_size):
+            collector.add(line_data)
+        return collector
+
+    def get_cache_statistics(self):
+        return self._call("get_cache_statistics")
+
+    def invalidate(self, filename):
+        self._call("invalidate", { "filename" : filename })
+
+    def save(self):
+        """Saves the cache of the server."""
+        self._call("save")
+
+    def close(self):
+        """Closes the connection to the server."""
+        self.socket.close()
+
+    def _call(self, method, params = None):
+        return self._receive(self._send(method, params if params != None else {}))
+
+    def _sendBatch(self, lines, collapse_output = False, count_occurrences = False):
+        return self._send("get_batch", { "lines"             : [ list(line) for line in lines ],
+                                         "collapse_output"   : collapse_output,
+                                         "count_occurrences" : count_occurrences })
+
+    def _send(self, method, params):
+        self.next_id += 1
+        request = { "id" : self.next_id, "method" : method, "params" : params }
+        data = memoryview(json.dumps(request).encode("utf-8") + b"\n")
+        while data:
+            (readable, writable, exceptional) = select.select( [ self.socket ], [ self.socket ], [],
+                                                               self.timeout )
+            if not readable and not writable:
+                raise socket.timeout("Timeout sending request to extraction server")
+            if readable:
+                self._receiveAvailable()
+            if writable:
+                try:
+                    data = data[self.socket.send(data):]
+                except BlockingIOError:
+                    pass
+        return self.next_id
+
+    def _receiveAvailable(self):
+        """Reads the data that is available on the socket, and adds complete
+           responses to self.responses."""
+        try:
+            data = self.socket.recv(1024 * 1024)
+        except BlockingIOError:
+            return
+        if not data:
+            raise ConnectionError("Connection closed by extraction server")
+        start = len(self.receive_buffer)
+        self.receive_buffer.extend(data)
+        end = self.receive_buffer.find(b"\n", start)
+        while end >= 0:
+            self.responses.append(bytes(self.receive_buffer[:end]))
+            del self.receive_buffer[:end + 1]
+            end = self.receive_buffer.find(b"\n")
+
+    def _receive(self, request_id):
+        """Receives the response to a request, and returns its result. Responses are
+           received in the order in which requests were sent."""
+        while not self.responses:
+            if not select.select( [ self.socket ], [], [], self.timeout )[0]:
+                raise socket.timeout("Timeout waiting for response of extraction server")
+            self._receiveAvailable()
+        response = json.loads(self.responses.popleft())
+        if response.get("id") != request_id:
+            raise RuntimeError("Unexpected response from extraction server: {}".format(response))
+        if "error" in response:
+            raise RuntimeError("Extraction server error: {}".format(response["error"]))
+        return response["result"]
+
+    def _convertBatchOutput(self, output, collapse_output = False):
+        """Converts the lists of a JSON-decoded get_batch output to tuples."""
+        def _convertStrings(strings):
+            if isinstance(strings, str):
+                return strings
+            return [ (item[0], decode_string(item[1])) for item in strings ]
+
+        if collapse_output:
+            return _convertStrings(output)
+        return [ tuple(item[:2]) + (_convertStrings(item[2]),) + tuple(item[3:]) for item in output ]
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description="Serves extracted strings to ExtractionClients over a Unix domain socket.")
+    parser.add_argument("--socket", required=True, help="path of the Unix domain socket")
+    parser.add_argument("--cache-file", help="pickle file to load the cache from and save it to")
+    parser.add_argument("--sqlite-cache", help="SQLite database to use as persistent cache")
+    parser.add_argument("--save-interval", type=float, default=60.0,
+                        help="interval (in seconds) at which the cache is saved")
+    parser.add_argument("--analyze-files", action="store_true", help="enable whole file analysis")
+    parser.add_argument("--prefilter", action="store_true", help="enable the prefilter")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    cache_backend = SQLiteCacheBackend(args.sqlite_cache) if args.sqlite_cache else None
+    extractor = StringExtractor(True, args.cache_file, args.analyze_files, cache_backend,
+                                args.workers, args.prefilter, thread_safe = True)
+    server = ExtractionServer(args.socket, extractor, args.save_interval)
+    # Save the cache when the server is terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
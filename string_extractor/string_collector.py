@@ -2,8 +2,28 @@
     an ast parse tree, as a visitor."""
 
 import ast
+import sys
+
+# Node classes are identified by their exact type. Before Python 3.8, string
+# literals are parsed as Str nodes; later versions use Constant nodes.
+if sys.version_info < (3, 8):
+    _stringClasses = frozenset( [ ast.Str, str ] )
+else:
+    _stringClasses = frozenset( [ str ] )
+_constantClasses = frozenset( [ ast.Constant ] )
+_singleValueClasses = _stringClasses | _constantClasses
+_tupleClasses = frozenset( [ ast.Tuple ] )
+_equalityOperatorClasses = frozenset( [ ast.Eq, ast.NotEq ] )
+_inOperatorClasses = frozenset( [ ast.In ] )
 
 class InterestingStringCollector(ast.NodeVisitor):
+    # Visitor method for each node class, per (sub)class of the collector
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
     def __init__(self):
         self.suffixes = set()
         self.prefixes = set()
@@ -18,23 +38,40 @@ class InterestingStringCollector(ast.NodeVisitor):
                  [ ( "FULL", s ) for s in self.fullStrings ] )
 
 
+    def visit(self, node):
+        method = self._dispatch.get(type(node))
+        if method is None:
+            cls = type(self)
+            name = "visit_" + type(node).__name__
+            method = getattr(cls, name, None)
+            if method is None or method is getattr(ast.NodeVisitor, name, None):
+                # NodeVisitor.visit_Constant only dispatches to deprecated visitor methods
+                method = cls.generic_visit
+            self._dispatch[type(node)] = method
+        return method(self, node)
+
+    def generic_visit(self, node):
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if type(value) is list:
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+
     def _isStringClass(self, c):
-        className = str(type(c))
-        if className in ["<class '_ast.Str'>", "<class 'str'>"]:
-            return True
-        elif ( className in [ "<class '_ast.Constant'>", "<class 'ast.Constant'>" ] and
-               str(type(c.value)) == "<class 'str'>" ):
+        nodeClass = type(c)
+        if nodeClass in _stringClasses:
             return True
-        else:
-            return False
+        return nodeClass in _constantClasses and type(c.value) is str
 
     def _isTupleClass(self, c):
-        className = str(type(c))
-        return className in  ["<class '_ast.Tuple'>", "<class 'ast.Tuple'>"]
+        return type(c) in _tupleClasses
 
     def _getStringValue(self, c):
         """Parses a single string value in the AST tree"""
-        if str(type(c)) in ["<class '_ast.Str'>", "<class 'str'>"]:
+        if type(c) in _stringClasses:
             return c.s
         else:
             return c.value
@@ -43,40 +80,37 @@ class InterestingStringCollector(ast.NodeVisitor):
         """Parses a single string value or tuple of strings in an AST
            tree as a list of strings."""
         def _get_single(c):
-            classname = str(type(c))
-            if classname in ["<class '_ast.Str'>", "<class 'str'>"]:
+            nodeClass = type(c)
+            if nodeClass in _stringClasses:
                 return [c.s]
-            elif classname in [ "<class '_ast.Constant'>", "<class 'ast.Constant'>" ]:
+            elif nodeClass in _constantClasses:
                 return [c.value]
             else:
                 return []
 
-        classname = str(type(c))
-        if classname in ["<class '_ast.Str'>", "<class 'str'>",
-                         "<class '_ast.Constant'>", "<class 'ast.Constant'>"  ]:
+        nodeClass = type(c)
+        if nodeClass in _singleValueClasses:
             return _get_single(c)
-        elif classname in ["<class '_ast.Tuple'>", "<class 'ast.Tuple'>"]:
+        elif nodeClass in _tupleClasses:
             result = []
             for element in c.elts:
                 result.extend(_get_single(element))
             return result
 
     def visit_Compare(self, node):
-        opstype = str(type(node.ops[0]))
-        if opstype in ["<class '_ast.Eq'>","<class '_ast.NotEq'>",
-                       "<class 'ast.Eq'>"  ,"<class 'ast.NotEq'>" ]:
+        opsClass = type(node.ops[0])
+        if opsClass in _equalityOperatorClasses:
             left = node.left
             right = node.comparators[0]
             if self._isStringClass(left) and not self._isStringClass(right):
                 self.fullStrings.add(self._getStringValue(left))
             elif (not self._isStringClass(left)) and self._isStringClass(right):
                 self.fullStrings.add(self._getStringValue(right))
-        elif opstype in ["<class '_ast.In'>", "<class 'ast.In'>"]:
+        elif opsClass in _inOperatorClasses:
             left = node.left
-            comparators = node.comparators
             if self._isStringClass(left):
                 self.fragments.add(self._getStringValue(left))
-            elif str(type(comparators)) == "<class 'list'>":
+            else:
                 try:
                     elements = node.comparators[0].elts
                 except AttributeError:
@@ -0,0 +1,95 @@
+""" Functions for reading execution traces and compacting them before extracting strings.
+
+    Execution traces are dominated by loops, so the same lines usually occur
+    many times. Since the strings of a line don't depend on how often it has been
+    executed, each distinct line only needs to be processed once."""
+
+import collections
+import csv
+import json
+import os
+
+TRACE_FORMATS = [ "text", "csv", "jsonl", "coverage" ]
+
+def count_lines(lines):
+    """Counts the occurrences of each line in an iterable of 2-tuples (file name +
+       line number). Returns a Counter with the distinct lines as 2-tuples, in order
+       of first occurrence. Lines can also be lists, e.g. when decoded from JSON."""
+    return collections.Counter(map(tuple, lines))
+
+def read_trace(file, trace_format, context = None):
+    """Reads an execution trace from a text file object. Yields 2-tuples (file name,
+       line number) in order, reading the file as a stream (except for Coverage.py
+       JSON reports, which are read as a whole).
+
+       Trace formats:
+         text     : one line per executed line, as file name and line number separated
+                    by a colon (e.g. hello.py:5). Empty lines and lines starting with #
+                    are skipped.
+         csv      : rows with a file name and line number, with an optional header row
+         jsonl    : one JSON value per line, either a list [file name, line number] or an
+                    object with "filename" and "line" keys
+         coverage : Coverage.py JSON report (coverage json). If context is set, only lines
+                    executed in that context are included, which requires a report with
+                    contexts (coverage json --show-contexts).
+    """
+    if trace_format == "text":
+        return _readTextTrace(file)
+    elif trace_format == "csv":
+        return _readCsvTrace(file)
+    elif trace_format == "jsonl":
+        return _readJsonlTrace(file)
+    elif trace_format == "coverage":
+        return _readCoverageReport(file, context)
+    else:
+        raise ValueError("Unknown trace format: {}".format(trace_format))
+
+def guess_trace_format(filename):
+    """Guesses the format of a trace file from its extension (text by default)."""
+    extension = os.path.splitext(filename)[1].lower()
+    return { ".csv"   : "csv",
+             ".jsonl" : "jsonl",
+             ".json"  : "coverage" }.get(extension, "text")
+
+def _readTextTrace(file):
+    for line in file:
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        (filename, line_number) = line.rsplit(":", 1)
+        yield (filename, int(line_number))
+
+def _readCsvTrace(file):
+    for index, row in enumerate(csv.reader(file)):
+        if not row:
+            continue
+        try:
+            line_number = int(row[1])
+        except ValueError:
+            if index == 0:
+                # Header row
+                continue
+            raise
+        yield (row[0], line_number)
+
+def _readJsonlTrace(file):
+    for line in file:
+        if line.strip() == "":
+            continue
+        value = json.loads(line)
+        if isinstance(value, dict):
+            yield (value["filename"], int(value["line"]))
+        else:
+            yield (value[0], int(value[1]))
+
+def _readCoverageReport(file, context):
+    report = json.load(file)
+    for filename, data in report["files"].items():
+        if context == None:
+            line_numbers = data["executed_lines"]
+        else:
+            contexts = data.get("contexts", {})
+            line_numbers = sorted( [ int(line_number) for line_number, line_contexts in contexts.items()
+                                     if context in line_contexts ] )
+        for line_number in line_numbers:
+            yield (filename, line_number)
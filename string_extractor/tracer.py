@@ -0,0 +1,246 @@
+""" Lightweight line tracer that records the distinct lines executed in each log
+    context, and passes them to a StringExtractor.
+
+    On Python 3.12 and later, the tracer uses sys.monitoring. Each line is only
+    reported once, after which monitoring of that line is disabled until the log
+    context is switched. On earlier versions, sys.settrace is used.
+
+    Example:
+
+        tracer = LineTracer(StringExtractor())
+        tracer.start()
+        tracer.switch_log_context("first_run")
+        hello()
+        tracer.stop()
+        strings = tracer.get_strings("first_run")
+"""
+
+import collections
+import os
+import sys
+import threading
+
+_PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+class _ExtractionState(threading.local):
+    """Per thread: whether the tracer is passing lines to the extractor. Lines that are
+       executed meanwhile (e.g. of ast, re and tokenize) are not recorded."""
+    active = False
+
+class LineTracer:
+
+    def __init__(self, extractor = None, background = False, interval = 0.1,
+                 include_paths = None, exclude_paths = None):
+        """ Arguments:
+             - extractor: StringExtractor to pass recorded lines to
+             - background: pass newly recorded lines to the extractor on a background
+                 thread while tracing, so that strings have already been extracted when
+                 they are retrieved
+             - interval: interval (in seconds) at which the background thread checks
+                 for new lines
+             - include_paths: if set, only record lines of files in these directories
+             - exclude_paths: don't record lines of files in these directories. Lines of
+                 the string extractor itself are never recorded.
+        """
+        self.extractor = extractor
+        self.background = background
+        self.interval = interval
+        self.include_paths = self._normalizePaths(include_paths)
+        self.exclude_paths = self._normalizePaths(exclude_paths) + [ _PACKAGE_DIRECTORY ]
+
+        self.contexts = { None : {} }
+        self.current_lines = self.contexts[None]
+        self.current_context = None
+        # Lines recorded since they were last passed to the extractor
+        self.pending_lines = collections.deque()
+        # Code objects of traced functions, for extractors that extract strings from code
+        # objects (see StringExtractor's bytecode argument)
+        self.record_code = extractor != None and getattr(extractor, "code_extractor", None) != None
+        self.pending_codes = collections.deque()
+        self.recorded_codes = set()
+        self.included_files = {}
+        self.extractor_lock = threading.Lock()
+        self.extraction_state = _ExtractionState()
+
+        self.started = False
+        self.tool_id = None
+        self.feeder_thread = None
+        self.feeder_stop = threading.Event()
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        if self.background and self.extractor != None:
+            # Start the background thread before installing the trace function, so
+            # that lines executed by the background thread are not traced.
+            self.feeder_stop.clear()
+            self.feeder_thread = threading.Thread(target=self._feedExtractor,
+                                                  name="string-extractor-feeder", daemon=True)
+            self.feeder_thread.start()
+
+        if hasattr(sys, "monitoring"):
+            self._startMonitoring()
+        else:
+            self._startSettrace()
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+        if self.tool_id != None:
+            sys.monitoring.set_events(self.tool_id, 0)
+            sys.monitoring.register_callback(self.tool_id, sys.monitoring.events.LINE, None)
+            sys.monitoring.free_tool_id(self.tool_id)
+            self.tool_id = None
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+
+        if self.feeder_thread != None:
+            self.feeder_stop.set()
+            self.feeder_thread.join()
+            self.feeder_thread = None
+
+    def switch_log_context(self, context):
+        """Labels all lines that are subsequently executed with a log context."""
+        self.current_context = context
+        self.current_lines = self.contexts.setdefault(context, {})
+        if self.tool_id != None:
+            # Lines that have been reported in the previous context are disabled.
+            sys.monitoring.restart_events()
+
+    def get_lines(self, context = None):
+        """Returns the distinct lines executed in a log context, as a list of 2-tuples
+           (file name, line number) in order of first execution."""
+        return list(self.contexts.get(context, {}))
+
+    def get_strings(self, context = None, collapse_output = True):
+        """Returns the interesting strings of the lines executed in a log context, in
+           the format of StringExtractor.get_batch."""
+        self.process_pending_lines()
+        lines = self.get_lines(context)
+        with self.extractor_lock:
+            self.extraction_state.active = True
+            try:
+                return self.extractor.get_batch(lines, collapse_output)
+            finally:
+                self.extraction_state.active = False
+
+    def process_pending_lines(self):
+        """Passes lines that have been recorded since the last call to the extractor,
+           so that their strings are extracted and cached."""
+        lines = []
+        while self.pending_lines:
+            lines.append(self.pending_lines.popleft())
+        codes = []
+        while self.pending_codes:
+            codes.append(self.pending_codes.popleft())
+        if codes or lines:
+            with self.extractor_lock:
+                self.extraction_state.active = True
+                try:
+                    for code in codes:
+                        self.extractor.code_extractor.addCode(code)
+                    for line in self.extractor.iter_batch(lines):
+                        pass
+                finally:
+                    self.extraction_state.active = False
+
+    def _feedExtractor(self):
+        while not self.feeder_stop.wait(self.interval):
+            self.process_pending_lines()
+        self.process_pending_lines()
+
+    def _recordCode(self, code):
+        if code not in self.recorded_codes:
+            self.recorded_codes.add(code)
+            self.pending_codes.append(code)
+
+    def _recordLine(self, filename, line_number):
+        """Records a line. Returns False if the file of the line is not traced."""
+        included = self.included_files.get(filename)
+        if included is None:
+            included = self._isIncluded(filename)
+            self.included_files[filename] = included
+        if not included:
+            return False
+        key = (filename, line_number)
+        if key not in self.current_lines:
+            self.current_lines[key] = None
+            if self.extractor != None:
+                self.pending_lines.append(key)
+        return True
+
+    def _isIncluded(self, filename):
+        if filename.startswith("<"):
+            # Code without a source file, e.g. <string> or <frozen ...>
+            return False
+        path = os.path.abspath(filename)
+        if any( [ path.startswith(prefix) for prefix in self.exclude_paths ] ):
+            return False
+        if self.include_paths:
+            return any( [ path.startswith(prefix) for prefix in self.include_paths ] )
+        return True
+
+    def _normalizePaths(self, paths):
+        return [ os.path.join(os.path.abspath(path), "") for path in (paths or []) ]
+
+    # sys.monitoring (Python 3.12+)
+
+    def _startMonitoring(self):
+        for tool_id in [ sys.monitoring.COVERAGE_ID, sys.monitoring.PROFILER_ID,
+                         sys.monitoring.OPTIMIZER_ID, sys.monitoring.DEBUGGER_ID ]:
+            if sys.monitoring.get_tool(tool_id) is None:
+                break
+        else:
+            raise RuntimeError("No sys.monitoring tool id available for tracing")
+        sys.monitoring.use_tool_id(tool_id, "string_extractor")
+        self.tool_id = tool_id
+        sys.monitoring.register_callback(tool_id, sys.monitoring.events.LINE, self._monitorLine)
+        sys.monitoring.set_events(tool_id, sys.monitoring.events.LINE)
+        sys.monitoring.restart_events()
+
+    def _monitorLine(self, code, line_number):
+        if self.feeder_thread != None and threading.current_thread() is self.feeder_thread:
+            return None
+        if self.extraction_state.active:
+            # Keep the line enabled, since it may also be executed by traced code
+            return None
+        if self._recordLine(code.co_filename, line_number) and self.record_code:
+            self._recordCode(code)
+        # Each line only needs to be reported once per log context.
+        return sys.monitoring.DISABLE
+
+    # sys.settrace (earlier versions)
+
+    def _startSettrace(self):
+        threading.settrace(self._traceCall)
+        sys.settrace(self._traceCall)
+        # Also trace the function that started the tracer.
+        frame = sys._getframe(2)
+        if frame.f_trace is None:
+            frame.f_trace = self._traceLine
+
+    def _traceCall(self, frame, event, arg):
+        if self.extraction_state.active:
+            return None
+        filename = frame.f_code.co_filename
+        included = self.included_files.get(filename)
+        if included is None:
+            included = self._isIncluded(filename)
+            self.included_files[filename] = included
+        if not included:
+            return None
+        if self.record_code:
+            self._recordCode(frame.f_code)
+        return self._traceLine
+
+    def _traceLine(self, frame, event, arg):
+        if not self.started:
+            # Threads other than the one that stopped the tracer keep calling
+            # the trace function.
+            return None
+        if event == "line" and not self.extraction_state.active:
+            self._recordLine(frame.f_code.co_filename, frame.f_lineno)
+        return self._traceLine
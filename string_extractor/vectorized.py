@@ -0,0 +1,234 @@
+""" Bulk lookup of traces as integer arrays, using NumPy (pip install numpy).
+
+    For traces with millions of lines, building a 2-tuple and looking it up in the cache
+    for each line takes more time than extracting the strings of the distinct lines.
+    A VectorizedLookup processes a trace as two integer arrays instead: a column with
+    file ids, which are assigned by a FileRegistry, and a column with line numbers.
+    Lines are resolved with a single gather from an array per file that maps line numbers
+    to result ids, so the time per line doesn't depend on the number of distinct lines.
+    Only distinct lines that haven't been resolved before are passed to the
+    StringExtractor. The collapsed output is computed from the result ids with array
+    operations as well.
+
+    Example:
+
+        registry = FileRegistry()
+        lookup = VectorizedLookup(StringExtractor(), registry)
+        (file_ids, line_numbers) = registry.encode_lines(read_trace("trace.txt"))
+        strings = lookup.collapse(file_ids, line_numbers)
+"""
+
+import numpy
+
+from string_extractor.compact import CompactResultTable
+
+class FileRegistry:
+    """Assigns integer ids to file names, in order of first occurrence."""
+
+    def __init__(self):
+        self.filenames = []
+        self.ids = {}
+
+    def get_id(self, filename):
+        """Returns the id of a file name, assigning a new id if needed."""
+        file_id = self.ids.get(filename)
+        if file_id is None:
+            file_id = len(self.filenames)
+            self.filenames.append(filename)
+            self.ids[filename] = file_id
+        return file_id
+
+    def get_filename(self, file_id):
+        return self.filenames[file_id]
+
+    def encode_lines(self, lines):
+        """Converts an iterable of 2-tuples (file name, line number) to a 2-tuple
+           of arrays (file ids, line numbers)."""
+        file_ids = []
+        line_numbers = []
+        get_id = self.get_id
+        for (filename, line_number) in lines:
+            file_ids.append(get_id(filename))
+            line_numbers.append(line_number)
+        return ( numpy.array(file_ids, dtype=numpy.int64),
+                 numpy.array(line_numbers, dtype=numpy.int64) )
+
+    def __len__(self):
+        return len(self.filenames)
+
+
+class VectorizedLookup:
+    """Looks up the results of traces that are given as arrays of file ids and line
+       numbers. Results of distinct lines are retrieved from a StringExtractor (using
+       its cache and worker processes, if any) the first time they are needed, and are
+       then kept in an array per file, indexed by line number. Lines that are resolved
+       from these arrays aren't counted in the cache statistics of the extractor.
+       Call invalidate() if a file has been modified."""
+
+    _stringTypeCodes = { "FULL" : 0, "PREFIX" : 1, "SUFFIX" : 2, "FRAGMENT" : 3 }
+
+    def __init__(self, extractor, registry = None):
+        """ Arguments:
+             - extractor: StringExtractor for extracting the strings of lines
+             - registry: FileRegistry that assigns the file ids of traces (a new
+                 one if None)
+        """
+        self.extractor = extractor
+        self.registry = registry if registry != None else FileRegistry()
+        self.table = CompactResultTable()
+        # Distinct results in the compact representation, and their result id
+        self.results = []
+        self.result_ids = {}
+        # Result id of each line of each file, or -1 if the line hasn't been resolved
+        # yet. The arrays of all files are stored in line_results, with the array of
+        # file id f at file_offsets[f] and file_sizes[f] elements long, so that a trace
+        # can be resolved with a single gather. The last element is always -1, and is
+        # used for lines beyond the end of the array of their file.
+        self.line_results = numpy.full(1, -1, dtype=numpy.int32)
+        self.file_offsets = numpy.zeros(0, dtype=numpy.int64)
+        self.file_sizes = numpy.zeros(0, dtype=numpy.int64)
+        # Arrays for collapsing results (see _getItemArrays), and the number of
+        # results they include
+        self.item_arrays = None
+        self.item_arrays_results = 0
+
+    def lookup(self, file_ids, line_numbers):
+        """Returns an array with the result id of each line of a trace. The result of
+           a result id can be retrieved with get_result."""
+        file_ids = numpy.asarray(file_ids, dtype=numpy.int64)
+        line_numbers = numpy.asarray(line_numbers, dtype=numpy.int64)
+        if file_ids.shape != line_numbers.shape or file_ids.ndim != 1:
+            raise ValueError("file_ids and line_numbers must be 1-dimensional arrays of the same length")
+        if len(line_numbers) == 0:
+            return numpy.empty(0, dtype=numpy.int32)
+        if line_numbers.min() < 0:
+            raise ValueError("line numbers can't be negative")
+        if file_ids.min() < 0 or file_ids.max() >= len(self.registry):
+            raise ValueError("unknown file id")
+
+        result_ids = self._gather(file_ids, line_numbers)
+        missing = numpy.flatnonzero(result_ids < 0)
+        if len(missing) > 0:
+            self._resolve(file_ids[missing], line_numbers[missing])
+            result_ids[missing] = self._gather(file_ids[missing], line_numbers[missing])
+        return result_ids
+
+    def collapse(self, file_ids, line_numbers):
+        """Returns the interesting strings of all lines of a trace, in the format (and order)
+           of the collapsed output of StringExtractor.get_batch."""
+        row_results = self.lookup(file_ids, line_numbers)
+        if len(row_results) == 0:
+            return []
+        # Distinct results, in order of first occurrence
+        first_rows = numpy.full(len(self.results), len(row_results), dtype=numpy.int64)
+        numpy.minimum.at(first_rows, row_results, numpy.arange(len(row_results)))
+        distinct = numpy.flatnonzero(first_rows < len(row_results))
+        distinct = distinct[numpy.argsort(first_rows[distinct], kind="stable")]
+
+        # Concatenate the item ids of the distinct results
+        (offsets, items, item_kinds) = self._getItemArrays()
+        starts = offsets[distinct]
+        lengths = offsets[distinct + 1] - starts
+        ends = numpy.cumsum(lengths)
+        positions = numpy.arange(ends[-1]) + numpy.repeat(starts - (ends - lengths), lengths)
+        item_ids = items[positions]
+
+        # Distinct items, ordered by string type and then by first occurrence
+        (unique_items, first_positions) = numpy.unique(item_ids, return_index=True)
+        order = numpy.lexsort( (first_positions, item_kinds[unique_items]) )
+        table_items = self.table.items
+        return [ table_items[item_id] for item_id in unique_items[order].tolist() ]
+
+    def get_result(self, result_id):
+        """Returns the result of a result id, in the format of StringExtractor.get_batch."""
+        return self.table.decode(self.results[result_id])
+
+    def invalidate(self, filename):
+        """Removes the results of a file, and invalidates the file in the extractor."""
+        file_id = self.registry.ids.get(filename)
+        if file_id is not None and file_id < len(self.file_offsets):
+            offset = self.file_offsets[file_id]
+            self.line_results[offset:offset + self.file_sizes[file_id]] = -1
+        self.extractor.invalidate(filename)
+
+    def _gather(self, file_ids, line_numbers):
+        """Returns the result ids of lines from the arrays of their files (-1 for
+           lines that haven't been resolved)."""
+        number_of_files = len(self.file_sizes)
+        if number_of_files == 0:
+            return numpy.full(len(line_numbers), -1, dtype=numpy.int32)
+        # Files that were registered after the arrays were last enlarged have no array
+        known_file_ids = numpy.minimum(file_ids, number_of_files - 1)
+        in_range = (file_ids < number_of_files) & (line_numbers < self.file_sizes[known_file_ids])
+        indexes = numpy.where(in_range, self.file_offsets[known_file_ids] + line_numbers,
+                              len(self.line_results) - 1)
+        return self.line_results[indexes]
+
+    def _resolve(self, file_ids, line_numbers):
+        """Extracts the results of lines that haven't been resolved yet, in a single
+           batch, and stores their result ids in the arrays of their files."""
+        keys = numpy.unique( (file_ids << 32) | line_numbers )
+        (file_ids, line_numbers) = (keys >> 32, keys & 0xffffffff)
+        self._reserve(file_ids, line_numbers)
+
+        filenames = self.registry.filenames
+        lines = [ (filenames[file_id], line_number)
+                  for file_id, line_number in zip(file_ids.tolist(), line_numbers.tolist()) ]
+        result_ids = numpy.array([ self._getResultId(result) for (filename, line_number, result)
+                                   in self.extractor.iter_batch(lines) ], dtype=numpy.int32)
+        self.line_results[self.file_offsets[file_ids] + line_numbers] = result_ids
+
+    def _reserve(self, file_ids, line_numbers):
+        """Makes the arrays of files large enough for lines, given as arrays of
+           file ids and line numbers that are sorted by file id. Arrays are at least
+           doubled in size when they are enlarged, so that the combined array is
+           rebuilt a limited number of times."""
+        number_of_files = len(self.registry)
+        sizes = numpy.zeros(number_of_files, dtype=numpy.int64)
+        sizes[:len(self.file_sizes)] = self.file_sizes
+        # Largest line number of each file (the last of each group of a sorted file id)
+        last = numpy.flatnonzero(numpy.append(numpy.diff(file_ids), 1))
+        required = numpy.zeros(number_of_files, dtype=numpy.int64)
+        required[file_ids[last]] = line_numbers[last] + 1
+        enlarge = required > sizes
+        if not enlarge.any() and number_of_files == len(self.file_sizes):
+            return
+
+        new_sizes = numpy.where(enlarge, numpy.maximum(required, 2 * sizes), sizes)
+        new_offsets = numpy.zeros(number_of_files, dtype=numpy.int64)
+        numpy.cumsum(new_sizes[:-1], out=new_offsets[1:])
+        line_results = numpy.full(new_sizes.sum() + 1, -1, dtype=numpy.int32)
+        for file_id in numpy.flatnonzero(self.file_sizes).tolist():
+            offset = self.file_offsets[file_id]
+            size = self.file_sizes[file_id]
+            line_results[new_offsets[file_id]:new_offsets[file_id] + size] = self.line_results[offset:offset + size]
+        self.line_results = line_results
+        self.file_offsets = new_offsets
+        self.file_sizes = new_sizes
+
+    def _getResultId(self, result):
+        compact_result = self.table.encode(result)
+        result_id = self.result_ids.get(compact_result)
+        if result_id is None:
+            result_id = len(self.results)
+            self.results.append(compact_result)
+            self.result_ids[compact_result] = result_id
+        return result_id
+
+    def _getItemArrays(self):
+        """ Returns a 3-tuple of arrays for collapsing results:
+             - offsets: the item ids of result id r are items[offsets[r]:offsets[r + 1]]
+             - items: item ids of all results (ids of 2-tuples in self.table)
+             - item_kinds: string type code of each item id, for ordering the output
+            The arrays are rebuilt if results have been added."""
+        if self.item_arrays is None or self.item_arrays_results != len(self.results):
+            lengths = [ len(result) if isinstance(result, tuple) else 0 for result in self.results ]
+            offsets = numpy.zeros(len(self.results) + 1, dtype=numpy.int64)
+            numpy.cumsum(lengths, out=offsets[1:])
+            items = numpy.array([ item_id for result in self.results if isinstance(result, tuple)
+                                  for item_id in result ], dtype=numpy.int64)
+            item_kinds = numpy.array([ self._stringTypeCodes[item[0]] for item in self.table.items ],
+                                     dtype=numpy.int8)
+            self.item_arrays = (offsets, items, item_kinds)
+            self.item_arrays_results = len(self.results)
+        return self.item_arrays
@@ -0,0 +1,288 @@
+""" Watches the source files of a long-running StringExtractor, e.g. in a web application
+    that is reloaded or redeployed while the extractor keeps running, and removes the
+    cached results of files that have been modified.
+
+    Results are cached per line, so without watching, lines of a modified file are
+    retrieved from the cache with the strings of the previous version of the file. When a
+    watched file is modified, the watcher invalidates it in the extractor (so only the
+    entries of that file are removed) and then indexes it again, so that its lines are
+    retrieved from the cache again by the time they are processed.
+
+    On Linux, modifications are detected with inotify, by watching the directories of the
+    files (so that files that are replaced, as most editors and deployment tools do, are
+    detected as well). Elsewhere, or if inotify isn't available, the modification time and
+    size of all watched files are checked at a fixed interval.
+
+    Example:
+
+        extractor = StringExtractor(thread_safe = True)
+        watcher = FileWatcher(extractor)
+        watcher.start()
+        ...
+        watcher.stop()
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+class FileWatcher:
+
+    def __init__(self, extractor, filenames = None, interval = 1.0, watch_cached_files = True,
+                 reindex = True, use_inotify = True, callback = None):
+        """ Arguments:
+             - extractor: StringExtractor whose cached results are invalidated
+             - filenames: files to watch
+             - interval: interval (in seconds) at which files are checked for modifications.
+                 With inotify, this is the maximum time between checking for new files to
+                 watch, and modifications are detected as they happen.
+             - watch_cached_files: also watch all files with lines in the cache of the
+                 extractor
+             - reindex: index modified files again after invalidating them (see
+                 StringExtractor.index_files). Lines of files that have been deleted
+                 are only invalidated.
+             - use_inotify: use inotify if available, instead of checking all files
+                 at every interval
+             - callback: function that is called with the name of each modified file,
+                 after the file has been invalidated, e.g. to invalidate the file in a
+                 VectorizedLookup
+        """
+        self.extractor = extractor
+        self.interval = interval
+        self.watch_cached_files = watch_cached_files
+        self.reindex = reindex
+        self.callback = callback
+        # Per watched file: (modification time, size) when it was last checked, or
+        # None if the file doesn't exist
+        self.files = {}
+        # Watched files by absolute path, for matching inotify events
+        self.paths = {}
+        # Watched files in directories that inotify couldn't watch, which are checked
+        # at every interval
+        self.polled_files = set()
+        self.files_lock = threading.Lock()
+        self.inotify = None
+        if use_inotify:
+            self.inotify = _Inotify.create()
+        self.statistics = { "checks"         : 0,
+                            "modified_files" : 0,
+                            "reindexed_lines": 0 }
+        self.watcher_thread = None
+        self.watcher_stop = threading.Event()
+        self.watch(filenames or [])
+
+    def start(self):
+        """Starts watching files on a background thread. The extractor must be
+           thread-safe."""
+        if self.extractor.lock == None:
+            raise ValueError("Watching files in the background requires a thread-safe extractor")
+        if self.watcher_thread != None:
+            return
+        self.watcher_stop.clear()
+        self.watcher_thread = threading.Thread(target=self._watch, name="string-extractor-watcher",
+                                               daemon=True)
+        self.watcher_thread.start()
+
+    def stop(self):
+        if self.watcher_thread != None:
+            self.watcher_stop.set()
+            self.watcher_thread.join()
+            self.watcher_thread = None
+
+    def close(self):
+        """Stops watching files, and releases the inotify instance, if any."""
+        self.stop()
+        if self.inotify != None:
+            self.inotify.close()
+            self.inotify = None
+
+    def watch(self, filenames):
+        """Adds files to watch. Files are compared with the version of which the
+           extractor has source text in memory, if any, or else with their current
+           version. Returns the names of the files that weren't watched yet."""
+        added = []
+        with self.files_lock:
+            for filename in filenames:
+                if filename in self.files:
+                    continue
+                added.append(filename)
+                metadata = self.extractor.file_metadata.entries.get(filename)
+                if metadata is not None:
+                    self.files[filename] = (metadata.mtime, metadata.size)
+                else:
+                    self.files[filename] = _getSignature(filename)
+                path = os.path.abspath(filename)
+                self.paths.setdefault(path, []).append(filename)
+                if self.inotify != None and not self.inotify.addDirectory(os.path.dirname(path)):
+                    self.polled_files.add(filename)
+        return added
+
+    def check(self, filenames = None):
+        """ Checks watched files for modifications, and invalidates (and indexes) the files
+            that have been modified. If filenames is set, only these files and the cached
+            files that weren't watched yet are checked. Returns the names of the modified
+            files."""
+        added = []
+        if self.watch_cached_files:
+            added = self.watch(self._getCachedFiles())
+        with self.files_lock:
+            self.statistics["checks"] += 1
+            if filenames is None:
+                filenames = list(self.files)
+            else:
+                # Files that are added now may have been modified before their directory
+                # was watched, in which case inotify didn't report the modification
+                filenames = list(filenames) + added
+            modified = []
+            for filename in filenames:
+                if filename not in self.files:
+                    continue
+                signature = _getSignature(filename)
+                if signature != self.files[filename]:
+                    self.files[filename] = signature
+                    modified.append(filename)
+
+        for filename in modified:
+            self.extractor.invalidate(filename)
+            if self.callback != None:
+                self.callback(filename)
+            number_of_lines = 0
+            if self.reindex and self.extractor.use_cache and os.path.isfile(filename):
+                number_of_lines = self.extractor.index_files( [ filename ] )
+            with self.files_lock:
+                self.statistics["modified_files"] += 1
+                self.statistics["reindexed_lines"] += number_of_lines
+        return modified
+
+    def get_statistics(self):
+        """ Returns a dictionary with:
+             - method: "inotify" or "polling"
+             - files: number of watched files
+             - checks: number of times files have been checked for modifications
+             - modified_files: number of modifications of watched files
+             - reindexed_lines: number of lines of modified files that have been indexed
+        """
+        with self.files_lock:
+            statistics = dict(self.statistics)
+            statistics["files"] = len(self.files)
+        statistics["method"] = "inotify" if self.inotify != None else "polling"
+        return statistics
+
+    def _getCachedFiles(self):
+        """Returns the names of the files with lines in the cache of the extractor."""
+        if not self.extractor.use_cache:
+            return set()
+        # The extractor keeps track of these files, so this takes time in proportion
+        # to the number of files rather than the number of cached lines.
+        with self.extractor._locked():
+            return list(self.extractor.cached_files)
+
+    def _watch(self):
+        while not self.watcher_stop.is_set():
+            if self.inotify != None:
+                # Check files with events, or all files if events have been lost
+                changed = self.inotify.read(self.interval)
+                if changed is not None:
+                    with self.files_lock:
+                        filenames = list(self.polled_files)
+                        for path in changed:
+                            filenames.extend(self.paths.get(path, []))
+                    self.check(filenames)
+                else:
+                    self.check()
+            elif not self.watcher_stop.wait(self.interval):
+                self.check()
+
+
+def _getSignature(filename):
+    """Returns the modification time and size of a file (as used by FileMetadataCache),
+       or None if the file doesn't exist."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+class _Inotify:
+    """Minimal inotify interface using ctypes, for watching directories for files that
+       are modified, created, moved or deleted."""
+
+    _IN_MODIFY = 0x2
+    _IN_ATTRIB = 0x4
+    _IN_CLOSE_WRITE = 0x8
+    _IN_MOVED_FROM = 0x40
+    _IN_MOVED_TO = 0x80
+    _IN_CREATE = 0x100
+    _IN_DELETE = 0x200
+    _IN_Q_OVERFLOW = 0x4000
+    _EVENT_MASK = ( _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+                    _IN_MOVED_TO | _IN_CREATE | _IN_DELETE )
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    @classmethod
+    def create(cls):
+        """Returns an _Inotify instance, or None if inotify isn't available."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch
+        except (OSError, AttributeError):
+            return None
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+        # Watched directories by watch descriptor, and the reverse
+        self.directories = {}
+        self.descriptors = {}
+
+    def addDirectory(self, directory):
+        """Watches a directory. Returns False if the directory can't be watched, e.g.
+           because it doesn't exist or the limit on the number of watches was reached."""
+        if directory in self.descriptors:
+            return True
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self._EVENT_MASK)
+        if wd < 0:
+            return False
+        self.directories[wd] = directory
+        self.descriptors[directory] = wd
+        return True
+
+    def read(self, timeout):
+        """ Waits for events for at most timeout seconds, and returns the set of absolute
+            paths of the files with events. Returns None if events have been lost."""
+        changed = set()
+        ready = select.select( [ self.fd ], [], [], timeout )[0]
+        if not ready:
+            return changed
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                (wd, mask, cookie, length) = self._EVENT_HEADER.unpack_from(data, offset)
+                offset += self._EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & self._IN_Q_OVERFLOW:
+                    return None
+                directory = self.directories.get(wd)
+                if directory is not None and name:
+                    changed.add(os.path.join(directory, os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,5 @@
+# Source file that can't be parsed as a whole
+
+if foo == "bar":
+    print("Hello")
+    else:
@@ -1,8 +1,51 @@
 #!/usr/bin/env python3
 
+import ast
+import asyncio
+import concurrent.futures
+import contextlib
+import inspect
+import io
+import json
+import os
+import pickle
+import py_compile
+import sys
+import tarfile
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
 
 from string_extractor import StringExtractor
+from string_extractor import cli
+from string_extractor.aggregation import ContextStringAggregator
+from string_extractor.bytecode_extractor import CodeObjectExtractor
+from string_extractor.cache_backends import SQLiteCacheBackend
+from string_extractor import cache_shards
+from string_extractor.cache_shards import ShardCacheBackend, ShardReader, merge_shards, write_shard
+from string_extractor.compact import CompactResultTable
+from string_extractor.file_metadata import FileMetadataCache
+from string_extractor.memory_cache import BoundedCache
+from string_extractor.server import ExtractionClient, ExtractionServer
+from string_extractor.string_collector import InterestingStringCollector
+from string_extractor.trace import read_trace
+from string_extractor.tracer import LineTracer
+from string_extractor.watcher import FileWatcher
+
+try:
+    import numpy
+    from string_extractor.vectorized import FileRegistry, VectorizedLookup
+except ImportError:
+    numpy = None
+
+def traced_function(value):
+    if value == "first":
+        return 1
+    elif value.startswith("sec"):
+        return 2
+    return 3
 
 class TestStringExtractor(unittest.TestCase):
 
@@ -184,6 +227,22 @@ class TestStringExtractor(unittest.TestCase):
         assert(output[2][0] == "FULL")
         assert(sorted(list(map( lambda x : x[1], output ))) == ["bar", "bat", "foo"])
 
+    def test_collector_subclass_dispatch(self):
+        class CallCounter(InterestingStringCollector):
+            def __init__(self):
+                super().__init__()
+                self.calls = 0
+            def visit_Call(self, node):
+                self.calls += 1
+                super().visit_Call(node)
+
+        # The base class has its own dispatch table
+        self.extractor.getInterestingStrings('a.startswith("foo")')
+        collector = CallCounter()
+        collector.visit(ast.parse('a.startswith("foo") or b.endswith("bar")'))
+        assert(collector.calls == 2)
+        assert(sorted(collector.getCollectedStrings()) == [ ("PREFIX", "foo"), ("SUFFIX", "bar") ])
+
     def test_batch_base(self):
         lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28) ]
         output = self.extractor.get_batch(lines)
@@ -234,5 +293,833 @@ class TestStringExtractor(unittest.TestCase):
         assert(output[1][1] == 28)
         assert(output[1][2] == [ ( "FULL", "retrievedBaz" ) ])
 
+    def test_persistent_cache_invalidation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            cache_filename = os.path.join(directory, "cache.dat")
+            with open(filename, "w") as file:
+                file.write('if a == "foo":\n    pass\n')
+            extractor = StringExtractor(True, cache_filename)
+            assert(extractor.get_batch([ (filename, 1) ]) == [ (filename, 1, [ ("FULL", "foo") ]) ])
+            extractor.save()
+
+            extractor = StringExtractor(True, cache_filename)
+            assert(extractor.get_batch([ (filename, 1) ]) == [ (filename, 1, [ ("FULL", "foo") ]) ])
+            assert(extractor.get_cache_statistics()["persistent_hits"] == 1)
+            assert(extractor.get_cache_statistics()["invalidations"] == 0)
+
+            with open(filename, "w") as file:
+                file.write('if a == "bar":\n    pass\n')
+            extractor = StringExtractor(True, cache_filename)
+            assert(extractor.get_batch([ (filename, 1) ]) == [ (filename, 1, [ ("FULL", "bar") ]) ])
+            assert(extractor.get_cache_statistics() == { "hits" : 0, "persistent_hits" : 0,
+                                                         "misses" : 1, "invalidations" : 1 })
+
+    def test_persistent_cache_relocated_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.dat")
+            extractor = StringExtractor(True, cache_filename)
+            extractor.cache = { ("stringprocessor-testdata.py", 26) : [ ("FULL", "cachedBar" ) ] }
+            extractor.save()
+
+            relocated_filename = os.path.join(directory, "relocated.py")
+            with open("stringprocessor-testdata.py") as source, open(relocated_filename, "w") as target:
+                target.write(source.read())
+            extractor = StringExtractor(True, cache_filename)
+            output = extractor.get_batch([ (relocated_filename, 26) ])
+            assert(output[0][2] == [ ("FULL", "cachedBar") ])
+
+    def test_persistent_cache_legacy_format(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.dat")
+            with open(cache_filename, "wb") as cache_file:
+                pickle.dump({ ("stringprocessor-testdata.py", 26) : [ ("FULL", "legacyBar" ) ] }, cache_file)
+            extractor = StringExtractor(True, cache_filename)
+            output = extractor.get_batch([ ("stringprocessor-testdata.py", 26) ])
+            assert(output[0][2] == [ ("FULL", "legacyBar") ])
+
+            # Legacy entries were extracted line by line, so they aren't used with other settings
+            extractor = StringExtractor(True, cache_filename, True)
+            output = extractor.get_batch([ ("stringprocessor-testdata.py", 26) ])
+            assert(output[0][2] == [ ("FULL", "bar") ])
+
+    def test_persistent_cache_settings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.sqlite")
+            line = ("stringprocessor-testdata.py", 26)
+            extractor = StringExtractor(True, None, False, SQLiteCacheBackend(cache_filename))
+            extractor.cache = { line : [ ("FULL", "cachedBar" ) ] }
+            extractor.save()
+            extractor.save()
+
+            # Results of extractors with other settings aren't used
+            for options in [ { "analyze_files" : True }, { "prefilter" : True }, { "bytecode" : True } ]:
+                extractor = StringExtractor(True, None, cache_backend = SQLiteCacheBackend(cache_filename),
+                                            **options)
+                assert(extractor.get_batch([ line ])[0][2] == [ ("FULL", "bar") ])
+                assert(extractor.get_cache_statistics()["persistent_hits"] == 0)
+                extractor.save()
+
+            # but extractors with the same settings use them
+            extractor = StringExtractor(True, None, False, SQLiteCacheBackend(cache_filename))
+            assert(extractor.get_batch([ line ])[0][2] == [ ("FULL", "cachedBar") ])
+            extractor.save()
+            extractor = StringExtractor(True, None, True, SQLiteCacheBackend(cache_filename))
+            assert(extractor.get_batch([ line ])[0][2] == [ ("FULL", "bar") ])
+            assert(extractor.get_cache_statistics()["persistent_hits"] == 1)
+            extractor.save()
+
+    def test_sqlite_cache_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.sqlite")
+            lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28) ]
+            extractor = StringExtractor(True, None, False, SQLiteCacheBackend(cache_filename))
+            extractor.get_batch(lines)
+            extractor.save()
+
+            extractor = StringExtractor(True, None, False, SQLiteCacheBackend(cache_filename))
+            output = extractor.get_batch(lines)
+            assert(output[0][2] == [ ("FULL", "bar") ])
+            assert(output[1][2] == [ ("FULL", "baz") ])
+            assert(extractor.get_cache_statistics()["persistent_hits"] == 2)
+
+    def test_sqlite_cache_backend_incremental_commit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.sqlite")
+            backend = SQLiteCacheBackend(cache_filename, commit_interval = 2)
+            other_backend = SQLiteCacheBackend(cache_filename)
+            backend.store("module.py", "digest", 1, [ ("FULL", "foo") ])
+            assert(other_backend.lookup("digest", 1) is None)
+            backend.store("module.py", "digest", 2, "IGNORE")
+            # Committed without calling save(), visible to other connections
+            assert(other_backend.lookup("digest", 1) == [ ("FULL", "foo") ])
+            assert(other_backend.lookup("digest", 2) == "IGNORE")
+            assert(other_backend.updateFile("module.py", "new digest"))
+            backend.close()
+            other_backend.close()
+
+    def test_sqlite_cache_backend_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.sqlite")
+            lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28) ]
+            extractor = StringExtractor(True, None, False, SQLiteCacheBackend(cache_filename))
+            extractor.get_batch(lines)
+            # Closing the extractor commits the stored results, without calling save()
+            extractor.close()
+            extractor = StringExtractor(True, None, False, SQLiteCacheBackend(cache_filename))
+            assert(extractor.get_batch(lines, True) == [ ("FULL", "bar"), ("FULL", "baz") ])
+            assert(extractor.get_cache_statistics()["persistent_hits"] == 2)
+            extractor.close()
+
+    def test_shard_cache_backend(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "cache.shard")
+            extractor = StringExtractor(True, None, False, ShardCacheBackend(filename))
+            expected = extractor.get_batch(lines)
+            extractor.save()
+            extractor.persistent_cache.close()
+
+            extractor = StringExtractor(True, None, False, ShardCacheBackend(filename))
+            assert(extractor.get_batch(lines) == expected)
+            assert(extractor.get_cache_statistics()["persistent_hits"] == len(lines))
+            extractor.persistent_cache.close()
+
+            with open(os.path.join(directory, "invalid.shard"), "wb") as file:
+                file.write(b"not a shard" * 10)
+            with self.assertRaises(ValueError):
+                ShardReader(os.path.join(directory, "invalid.shard"))
+
+    def test_merge_shards(self):
+        digest = "00" * 20
+        other_digest = "ff" * 20
+        with tempfile.TemporaryDirectory() as directory:
+            shards = [ os.path.join(directory, name) for name in [ "a.shard", "b.shard" ] ]
+            write_shard(shards[0], [ ( (digest, 1), [ ( "FULL", "foo" ), ( "PREFIX", "x" ) ] ),
+                                     ( (digest, 2), "IGNORE" ) ], { "a.py" : digest })
+            write_shard(shards[1], [ ( (digest, 1), [ ( "PREFIX", "x" ), ( "FULL", "foo" ) ] ),
+                                     ( (digest, 2), "ERROR" ),
+                                     ( (other_digest, 7), [ ( "FULL", 1 ) ] ) ], { "b.py" : other_digest })
+            merged = os.path.join(directory, "merged.shard")
+            statistics = merge_shards(merged, shards, "last")
+            assert(statistics.entries == 3 and statistics.duplicates == 1)
+            assert(statistics.conflicts == [ ( digest, 2, [ "IGNORE", "ERROR" ] ) ])
+            reader = ShardReader(merged)
+            assert(reader.lookup(digest, 1) == [ ( "FULL", "foo" ), ( "PREFIX", "x" ) ])
+            assert(reader.lookup(digest, 2) == "ERROR")
+            assert(reader.lookup(digest, 3) == None)
+            assert(reader.lookup(other_digest, 7) == [ ( "FULL", 1 ) ])
+            assert(reader.getFiles() == { "a.py" : digest, "b.py" : other_digest })
+            reader.close()
+            with self.assertRaises(ValueError):
+                merge_shards(merged, shards, "error")
+
+    def test_cache_shards_tool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.dat")
+            extractor = StringExtractor(True, cache_filename)
+            extractor.get_batch( [ ( "stringprocessor-testdata.py", 26) ] )
+            extractor.save()
+            shard = os.path.join(directory, "cache.shard")
+            merged = os.path.join(directory, "merged.shard")
+            with contextlib.redirect_stderr(io.StringIO()) as output:
+                cache_shards.main( [ "convert", cache_filename, shard ] )
+                cache_shards.main( [ "merge", merged, shard ] )
+                with self.assertRaises(SystemExit):
+                    cache_shards.main( [] )
+            assert("Converted 1 entries" in output.getvalue())
+            readers = [ ShardReader(shard), ShardReader(merged) ]
+            assert(readers[0].getFiles() == readers[1].getFiles())
+            for reader in readers:
+                reader.close()
+
+    def test_batch_parallel(self):
+        lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-partial-testdata.py", 3),
+                  ( "stringprocessor-testdata.py", 28), ( "testfile_jinja.j2", 1),
+                  ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 34) ]
+        extractor = StringExtractor(True, None, False, None, 2)
+        try:
+            sequential_extractor = StringExtractor()
+            assert(extractor.get_batch(lines) == sequential_extractor.get_batch(lines))
+            assert(extractor.get_batch(lines, True) == sequential_extractor.get_batch(lines, True))
+            assert(extractor.get_cache_statistics() == sequential_extractor.get_cache_statistics())
+        finally:
+            extractor.close()
+
+    def test_iter_batch(self):
+        lines = ( ( "stringprocessor-testdata.py", line) for line in [26, 28, 26, 30] )
+        output = self.extractor.iter_batch(lines)
+        assert(next(output) == ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ] ))
+        assert(list(output) == [ ( "stringprocessor-testdata.py", 28, [ ( "FULL", "baz" ) ] ),
+                                 ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ] ),
+                                 ( "stringprocessor-testdata.py", 30, "IGNORE" ) ])
+
+    def test_collect_batch(self):
+        lines = [ ( "stringprocessor-testdata.py", line) for line in [34, 26, 28, 26, 30] ]
+        collector = self.extractor.collect_batch(iter(lines[:2]))
+        self.extractor.collect_batch(iter(lines[2:]), collector = collector)
+        assert(len(collector) == 3)
+        assert(collector.get_strings() == self.extractor.get_batch(lines, True))
+        assert(collector.get_strings() == [ ( "FULL", "bat" ), ( "FULL", "bar" ), ( "FULL", "baz" ) ])
+
+    def test_context_string_aggregator(self):
+        aggregator = ContextStringAggregator()
+        aggregator.add( [ ( "SUFFIX", "x" ), ( "FULL", "foo" ) ], "first")
+        aggregator.add("ERROR", "first")
+        checkpoint = aggregator.checkpoint()
+        first_checkpoint = aggregator.checkpoint("first")
+        aggregator.add( [ ( "FULL", "foo" ), ( "FULL", "bar" ) ], "second")
+        aggregator.add( [ ( "FULL", "baz" ) ], "first")
+        assert(aggregator.new_since(checkpoint) == [ ( "FULL", "bar" ), ( "FULL", "baz" ) ])
+        assert(aggregator.new_since(first_checkpoint, "first") == [ ( "FULL", "baz" ) ])
+        assert(aggregator.new_since(0, "second") == [ ( "FULL", "foo" ), ( "FULL", "bar" ) ])
+        assert(aggregator.get_strings("first") == [ ( "FULL", "foo" ), ( "FULL", "baz" ), ( "SUFFIX", "x" ) ])
+        assert(aggregator.get_contexts() == [ "first", "second" ])
+        assert(len(aggregator) == 4)
+
+    def test_batch_log_context(self):
+        extractor = StringExtractor()
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        collapsed = extractor.get_batch(lines[:20], True, log_context = "first")
+        checkpoint = extractor.context_strings.checkpoint()
+        extractor.get_batch(lines, log_context = "second")
+        assert(extractor.context_strings.get_strings("first") == collapsed)
+        assert(extractor.context_strings.get_strings("second") == self.extractor.get_batch(lines, True))
+        assert(extractor.context_strings.new_since(checkpoint) ==
+               [ item for item in self.extractor.get_batch(lines, True) if item not in collapsed ])
+
+    def test_batch_count_occurrences(self):
+        lines = [ ( "stringprocessor-testdata.py", line) for line in [26, 28, 26, 28, 26, 30] ]
+        extractor = StringExtractor()
+        output = extractor.get_batch(lines, False, True)
+        assert(output == [ ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ], 3 ),
+                           ( "stringprocessor-testdata.py", 28, [ ( "FULL", "baz" ) ], 2 ),
+                           ( "stringprocessor-testdata.py", 30, "IGNORE", 1 ) ])
+        assert(extractor.get_cache_statistics()["hits"] == 3)
+        assert(extractor.get_cache_statistics()["misses"] == 3)
+
+    def test_batch_list_rows(self):
+        # Lines can be lists, e.g. when decoded from JSON
+        lines = [ [ "stringprocessor-testdata.py", 26 ], [ "stringprocessor-testdata.py", 26 ],
+                  [ "stringprocessor-testdata.py", 28 ] ]
+        assert(StringExtractor().get_batch(lines, True) == [ ( "FULL", "bar" ), ( "FULL", "baz" ) ])
+        assert(StringExtractor().get_batch(lines, False, True) ==
+               [ ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ], 2 ),
+                 ( "stringprocessor-testdata.py", 28, [ ( "FULL", "baz" ) ], 1 ) ])
+        extractor = StringExtractor(workers = 2)
+        try:
+            assert(extractor.get_batch(lines) == [ ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ] ),
+                                                   ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ] ),
+                                                   ( "stringprocessor-testdata.py", 28, [ ( "FULL", "baz" ) ] ) ])
+        finally:
+            extractor.close()
+
+    def test_batch_consecutive_repetitions(self):
+        lines = [ ( "stringprocessor-testdata.py", 26 ), ( "stringprocessor-testdata.py", 28 ),
+                  ( "stringprocessor-testdata.py", 28 ), ( "stringprocessor-testdata.py", 28 ),
+                  ( "stringprocessor-testdata.py", 26 ) ]
+        extractor = StringExtractor()
+        output = extractor.get_batch(lines)
+        assert(output == [ ( filename, line_number, [ ( "FULL", "bar" if line_number == 26 else "baz" ) ] )
+                           for ( filename, line_number ) in lines ])
+        # Repetitions reuse the result of the line, and are counted as cache hits
+        assert(extractor.get_cache_statistics()["hits"] == 3)
+        assert(extractor.get_cache_statistics()["misses"] == 2)
+
+    def test_read_trace(self):
+        expected = [ ( "hello.py", 5 ), ( "hello.py", 7 ) ]
+        traces = { "text"     : "# trace\nhello.py:5\n\nhello.py:7\n",
+                   "csv"      : "filename,line\nhello.py,5\nhello.py,7\n",
+                   "jsonl"    : '["hello.py", 5]\n{"filename": "hello.py", "line": 7}\n',
+                   "coverage" : '{"files": {"hello.py": {"executed_lines": [5, 7]}}}' }
+        for trace_format, trace in traces.items():
+            assert(list(read_trace(io.StringIO(trace), trace_format)) == expected)
+        report = '{"files": {"hello.py": {"executed_lines": [5, 7], "contexts": {"5": ["a"], "7": ["b"]}}}}'
+        assert(list(read_trace(io.StringIO(report), "coverage", "b")) == [ ( "hello.py", 7 ) ])
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            trace_file = os.path.join(directory, "trace.txt")
+            output_file = os.path.join(directory, "output.jsonl")
+            with open(trace_file, "w") as file:
+                file.write("stringprocessor-testdata.py:26\nstringprocessor-testdata.py:28\n" * 2)
+            summary = io.StringIO()
+            with contextlib.redirect_stderr(summary):
+                cli.main( [ "--count", "-o", output_file, trace_file ] )
+            with open(output_file) as file:
+                output = [ json.loads(line) for line in file ]
+            assert(output == [ { "filename" : "stringprocessor-testdata.py", "line" : 26,
+                                 "result" : [ [ "FULL", "bar" ] ], "count" : 2 },
+                               { "filename" : "stringprocessor-testdata.py", "line" : 28,
+                                 "result" : [ [ "FULL", "baz" ] ], "count" : 2 } ])
+            assert(summary.getvalue().startswith("Processed 4 lines"))
+            cli.main( [ "--collapse", "--quiet", "-o", output_file, trace_file ] )
+            with open(output_file) as file:
+                output = [ json.loads(line) for line in file ]
+            assert(output == [ { "type" : "FULL", "string" : "bar" }, { "type" : "FULL", "string" : "baz" } ])
+
+    def test_cli_bytes_strings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_file = os.path.join(directory, "module.py")
+            with open(source_file, "w") as file:
+                file.write('if data.startswith( (b"\\xfd7zXZ", ) ):\n    pass\n')
+            trace_file = os.path.join(directory, "trace.txt")
+            with open(trace_file, "w") as file:
+                file.write(source_file + ":1\n")
+            output_file = os.path.join(directory, "output.jsonl")
+            expected_strings = [ [ "PREFIX", { "bytes" : "fd377a585a" } ] ]
+            if sys.version_info < (3, 8):
+                # Bytes literals are parsed as Bytes nodes, which aren't collected
+                expected_strings = []
+            cli.main( [ "--quiet", "-o", output_file, trace_file ] )
+            with open(output_file) as file:
+                output = [ json.loads(line) for line in file ]
+            assert(output == [ { "filename" : source_file, "line" : 1, "result" : expected_strings } ])
+            cli.main( [ "--collapse", "--quiet", "-o", output_file, trace_file ] )
+            with open(output_file) as file:
+                output = [ json.loads(line) for line in file ]
+            assert(output == [ { "type" : item[0], "string" : item[1] } for item in expected_strings ])
+
+    def test_tracer(self):
+        first_line = inspect.getsourcelines(traced_function)[1]
+        for (background, bytecode) in [ (False, False), (True, False), (False, True) ]:
+            tracer = LineTracer(StringExtractor(bytecode = bytecode), background)
+            tracer.start()
+            tracer.switch_log_context("first")
+            traced_function("first")
+            traced_function("first")
+            tracer.switch_log_context("second")
+            traced_function("second")
+            tracer.stop()
+
+            lines = [ line for (filename, line) in tracer.get_lines("first")
+                      if os.path.basename(filename) == "tests.py" and
+                         first_line < line < first_line + 6 ]
+            assert(lines == [ first_line + 1, first_line + 2 ])
+            assert(tracer.get_strings("first") == [ ( "FULL", "first" ) ])
+            assert(sorted(tracer.get_strings("second")) == [ ( "FULL", "first" ), ( "PREFIX", "sec" ) ])
+
+    def test_tracer_get_strings_while_tracing(self):
+        tracer = LineTracer(StringExtractor())
+        tracer.start()
+        tracer.switch_log_context("first")
+        traced_function("first")
+        strings = tracer.get_strings("first")
+        traced_function("second")
+        tracer.stop()
+        assert(strings == [ ( "FULL", "first" ) ])
+        # Lines executed by the extractor (e.g. of ast and re) aren't recorded
+        assert(set( [ os.path.basename(filename) for (filename, line) in tracer.get_lines("first") ] )
+               == { "tests.py" })
+        assert(sorted(tracer.get_strings("first")) == [ ( "FULL", "first" ), ( "PREFIX", "sec" ) ])
+
+    def test_bytecode_extractor(self):
+        first_line = inspect.getsourcelines(traced_function)[1]
+        extractor = CodeObjectExtractor()
+        extractor.addCode(traced_function.__code__)
+        filename = traced_function.__code__.co_filename
+        assert(extractor.getResult(filename, first_line + 1) == [ ( "FULL", "first" ) ])
+        assert(extractor.getResult(filename, first_line + 2) == [])
+        assert(extractor.getResult(filename, first_line + 3) == [ ( "PREFIX", "sec" ) ])
+
+    def test_bytecode_matches_source(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        extractor = StringExtractor(bytecode = True)
+        assert(sorted(extractor.get_batch(lines, True)) == sorted(self.extractor.get_batch(lines, True)))
+
+    def test_bytecode_pyc_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source_filename = os.path.join(directory, "compiled_module.py")
+            with open(source_filename, "w") as source_file:
+                source_file.write("def check(value):\n    return value == 'compiled'\n")
+            # A module without source file, e.g. as distributed in some packages
+            filename = py_compile.compile(source_filename, os.path.join(directory, "compiled_module.pyc"))
+            os.unlink(source_filename)
+            assert(CodeObjectExtractor().getResult(filename, 2) == [ ( "FULL", "compiled" ) ])
+            with open(filename, "wb") as file:
+                file.write(b"not a pyc file")
+            assert(CodeObjectExtractor().getResult(filename, 2) == None)
+
+    def test_bytecode_zip_module(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive = os.path.join(directory, "modules.zip")
+            with zipfile.ZipFile(archive, "w") as file:
+                file.writestr("zipped_module.py", "def check(value):\n    # Comment\n"
+                                                  "    return value == 'zipped'\n")
+            sys.path.insert(0, archive)
+            try:
+                import zipped_module
+                filename = zipped_module.__file__
+                output = StringExtractor(bytecode = True).get_batch( [ ( filename, 2 ), ( filename, 3 ) ] )
+                assert(output == [ ( filename, 2, "ERROR" ), ( filename, 3, [ ( "FULL", "zipped" ) ] ) ])
+            finally:
+                sys.path.remove(archive)
+                sys.modules.pop("zipped_module", None)
+
+    def test_prefilter(self):
+        lines = [ ( "stringprocessor-testdata.py", line) for line in
+                  [5, 8, 12, 17, 21, 26, 28, 30, 34, 38, 42] ]
+        extractor = StringExtractor(False, prefilter = True)
+        assert(extractor.get_batch(lines) == StringExtractor(False).get_batch(lines))
+        statistics = extractor.get_prefilter_statistics()
+        # Lines 30 and 42 are ignored before the prefilter is applied
+        assert(statistics["checked"] == 9)
+        # No operators on lines 5-25, so line 5 isn't parsed. The other statements
+        # without comparisons are parsed to find their end, but not visited.
+        assert(statistics["skipped_parse"] == 1)
+        assert(statistics["skipped_visit"] == 5)
+
+
+    def test_prefilter_line_continuations(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as source_file:
+                # A statement with explicit line continuations that is longer than the
+                # maximum length of other multiline statements
+                source_file.write("a = b \\\n" + "    + c \\\n" * 25 + '    == "foo"\nd = 1\n')
+            lines = [ ( filename, 1 ), ( filename, 2 ) ]
+            output = StringExtractor(False, prefilter = True).get_batch(lines)
+            assert(output == StringExtractor(False).get_batch(lines))
+            assert(output[0][2] == [ ( "FULL", "foo" ) ])
+
+    def test_prefilter_skip_parse(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as file:
+                file.write("a = 1\nb = a + 2\n" + "c = 3\n" * 25 + 'if a == "foo":\n    pass\n')
+            extractor = StringExtractor(False, prefilter = True)
+            output = extractor.get_batch([ (filename, 1), (filename, 2), (filename, 28) ])
+            assert([ result for (_, _, result) in output ] == [ [], [], [ ("FULL", "foo") ] ])
+            assert(extractor.get_prefilter_statistics()["skipped_parse"] == 2)
+            assert(StringExtractor(False).get_prefilter_statistics() is None)
+
+    def test_batch_thread_safe(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        expected = StringExtractor().get_batch(lines)
+        extractor = StringExtractor(thread_safe = True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 4) as executor:
+            outputs = list(executor.map(extractor.get_batch, [ lines ] * 8))
+        assert(all( [ output == expected for output in outputs ] ))
+        # Each line is only extracted once
+        statistics = extractor.get_cache_statistics()
+        assert(statistics["misses"] == len(lines))
+        assert(statistics["hits"] == 7 * len(lines))
+
+    def test_batch_async(self):
+        lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28) ]
+        async def run(extractor):
+            return await asyncio.gather(extractor.get_batch_async(lines, True),
+                                        extractor.get_batch_async(lines))
+        for extractor in [ StringExtractor(), StringExtractor(thread_safe = True) ]:
+            loop = asyncio.new_event_loop()
+            (collapsed, output) = loop.run_until_complete(run(extractor))
+            loop.close()
+            extractor.close()
+            assert(collapsed == [ ( "FULL", "bar" ), ( "FULL", "baz" ) ])
+            assert(output == [ ( "stringprocessor-testdata.py", 26, [ ( "FULL", "bar" ) ] ),
+                               ( "stringprocessor-testdata.py", 28, [ ( "FULL", "baz" ) ] ) ])
+            assert(extractor.get_cache_statistics()["misses"] == 2)
+
+    def test_extraction_server(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        with tempfile.TemporaryDirectory() as directory:
+            server = ExtractionServer(os.path.join(directory, "extractor.sock"))
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                client = ExtractionClient(server.socket_path, timeout = 10, pipeline_depth = 2)
+                assert(client.get_batch(lines) == self.extractor.get_batch(lines))
+                assert(client.get_batch(lines, True) == self.extractor.get_batch(lines, True))
+                assert(list(client.iter_batch(lines, 5)) == self.extractor.get_batch(lines))
+                assert(client.get_cache_statistics()["misses"] == len(lines))
+                with self.assertRaises(RuntimeError):
+                    client.get_batch( [ ( "stringprocessor-testdata.py", ) ] )
+                client.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+    def test_extraction_server_large_batches(self):
+        # Enough lines for responses that don't fit in the socket buffers, with the
+        # default chunk size and pipeline depth, and bytes prefixes (tarfile.py)
+        filename = tarfile.__file__
+        with open(filename) as source_file:
+            number_of_lines = len(source_file.readlines())
+        lines = [ ( filename, line_number ) for line_number in range(1, number_of_lines + 1) ]
+        lines = lines * (60000 // len(lines) + 1)
+        expected = self.extractor.get_batch(lines)
+        if sys.version_info >= (3, 8):
+            # Earlier versions parse bytes literals as Bytes nodes, which aren't collected
+            assert(any( [ isinstance(item[1], bytes) for line in expected if isinstance(line[2], list)
+                          for item in line[2] ] ))
+        with tempfile.TemporaryDirectory() as directory:
+            server = ExtractionServer(os.path.join(directory, "extractor.sock"))
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                client = ExtractionClient(server.socket_path, timeout = 30)
+                assert(list(client.iter_batch(lines)) == expected)
+                assert(client.get_batch(lines, True) == self.extractor.get_batch(lines, True))
+                client.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+    def test_index_files(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        extractor = StringExtractor()
+        assert(extractor.missing_lines(lines + lines) == lines)
+        number_of_lines = extractor._getNumberOfLines("stringprocessor-testdata.py")
+        assert(extractor.index_files( [ "stringprocessor-testdata.py", "nonexistent.py" ] ) == number_of_lines)
+        assert(extractor.missing_lines(lines) == [])
+        misses = extractor.get_cache_statistics()["misses"]
+        assert(extractor.get_batch(lines) == self.extractor.get_batch(lines))
+        assert(extractor.get_cache_statistics()["misses"] == misses)
+
+    def test_index_packages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, "subpackage"))
+            for filename in [ "module.py", os.path.join("subpackage", "module.py") ]:
+                with open(os.path.join(directory, filename), "w") as file:
+                    file.write("if value == 'x':\n    pass\n")
+            with open(os.path.join(directory, "data.txt"), "w") as file:
+                file.write("value == 'y'\n")
+            trace = [ ( os.path.join(directory, "subpackage", "module.py"), 1 ) ]
+            extractor = StringExtractor(thread_safe = True)
+            assert(extractor.index_in_background( [ directory ] ).result() == 4)
+            extractor.close()
+            assert(extractor.missing_lines(trace) == [])
+            assert(extractor.get_batch(trace, True) == [ ( "FULL", "x" ) ])
+            assert(StringExtractor().index_packages( [ "string_extractor.trace" ] ) > 0)
+
+    def test_statistics(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number ) for line_number in range(1, 40) ]
+        events = []
+        extractor = StringExtractor(statistics_callback = lambda stage, seconds: events.append(stage))
+        assert(extractor.get_batch(lines + lines) == self.extractor.get_batch(lines + lines))
+        statistics = extractor.get_statistics()
+        assert(statistics["cache_hit_ratio"] == 0.5)
+        assert(statistics["stages"]["extract"]["count"] == len(lines))
+        assert(statistics["stages"]["cache_lookup"]["count"] == 2 * len(lines))
+        assert(statistics["stages"]["read"]["count"] == 1)
+        assert(statistics["stages"]["parse"]["count"] > statistics["stages"]["visit"]["count"])
+        assert(statistics["parse_attempts_per_statement"] > 1)
+        file_statistics = statistics["files"]["stringprocessor-testdata.py"]
+        assert(file_statistics["lines"] == len(lines))
+        assert(0 < file_statistics["error_rate"] < 1)
+        assert(len(events) == sum( [ stage["count"] for stage in statistics["stages"].values() ] ))
+        assert("stages" not in StringExtractor().get_statistics())
+
+    def test_bounded_cache_eviction(self):
+        cache = BoundedCache(max_entries = 2)
+        cache[("a.py", 1)] = [ ("FULL", "foo") ]
+        cache[("a.py", 2)] = "IGNORE"
+        assert(cache[("a.py", 1)] == [ ("FULL", "foo") ])
+        cache[("b.py", 1)] = []
+        # ("a.py", 2) is the least recently used entry
+        assert(list(cache) == [ ("a.py", 1), ("b.py", 1) ])
+        assert(cache.getStatistics()["evictions"] == 1)
+        assert(cache.invalidate("a.py") == 1)
+        assert(len(cache) == 1 and cache.getStatistics()["files"] == 1)
+
+    def test_bounded_cache_max_bytes_and_ttl(self):
+        cache = BoundedCache(max_bytes = 1000)
+        for line_number in range(100):
+            cache[("a.py", line_number)] = [ ("FULL", "foo") ]
+        assert(0 < cache.total_bytes <= 1000)
+        assert(len(cache) < 100)
+        cache = BoundedCache(ttl = 0)
+        cache[("a.py", 1)] = "IGNORE"
+        assert(("a.py", 1) not in cache)
+        assert(cache.getStatistics()["expirations"] == 1)
+
+    def test_bounded_cache_save_expired(self):
+        cache = BoundedCache(ttl = 0.01)
+        with tempfile.TemporaryDirectory() as directory:
+            cache_filename = os.path.join(directory, "cache.dat")
+            lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28) ]
+            extractor = StringExtractor(True, cache_filename, memory_cache = cache)
+            extractor.get_batch(lines)
+            time.sleep(0.05)
+            # Expired entries are skipped, without being removed while the cache is saved
+            assert(cache.items() == [])
+            extractor.save()
+            assert(len(cache.entries) == 2)
+        # Saving doesn't change the order of eviction
+        cache = BoundedCache(max_entries = 2)
+        cache[("a.py", 1)] = "IGNORE"
+        cache[("a.py", 2)] = "IGNORE"
+        assert(cache.items() == [ (("a.py", 1), "IGNORE"), (("a.py", 2), "IGNORE") ])
+        cache[("a.py", 3)] = "IGNORE"
+        assert(("a.py", 1) not in cache.entries)
+
+    def test_extractor_bounded_cache(self):
+        lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28) ]
+        extractor = StringExtractor(memory_cache = BoundedCache(max_entries = 1))
+        assert(extractor.get_batch(lines + lines, True) == [ ( "FULL", "bar" ), ( "FULL", "baz" ) ])
+        statistics = extractor.get_memory_statistics()
+        assert(statistics["cache"]["entries"] == 1)
+        assert(statistics["source"]["files"] == 1)
+        extractor.invalidate("stringprocessor-testdata.py")
+        statistics = extractor.get_memory_statistics()
+        assert(statistics["cache"]["entries"] == 0)
+        assert(statistics["source"]["files"] == 0)
+        # Callbacks of the cache are still called
+        evicted = []
+        removed = []
+        extractor = StringExtractor(memory_cache = BoundedCache(max_entries = 1, on_evict = evicted.append,
+                                                                on_remove = lambda key, result: removed.append(key)),
+                                    compact_results = True)
+        extractor.get_batch(lines)
+        assert(evicted == [ lines[0] ] and removed == [ lines[0] ])
+        assert(extractor.get_memory_statistics()["compact_results"]["results"] == 1)
+
+    def test_compact_result_table(self):
+        table = CompactResultTable()
+        first = table.encode([ ("FULL", "foo"), ("PREFIX", "bar") ])
+        second = table.encode([ ("FULL", "foo"), ("PREFIX", "bar") ])
+        assert(first == (0, 1) and first is second)
+        assert(table.encode([ ("PREFIX", "bar") ]) == (1, ))
+        assert(table.encode("IGNORE") == "IGNORE" and table.decode("ERROR") == "ERROR")
+        assert(table.decode(first) == [ ("FULL", "foo"), ("PREFIX", "bar") ])
+        assert(table.decode(first)[1] is table.decode( (1, ) )[0])
+        assert(table.getStatistics() == { "strings" : 2, "results" : 2 })
+        # Strings are removed when the last result that contains them is released
+        table.release(first)
+        assert(table.getStatistics() == { "strings" : 2, "results" : 2 })
+        table.release(second)
+        assert(table.getStatistics() == { "strings" : 1, "results" : 1 })
+        table.release("IGNORE")
+        # The ids of removed strings are reused
+        assert(table.encode([ ("FULL", "baz") ]) == (0, ))
+        assert(len(table.items) == 2)
+
+    def test_extractor_compact_results_release(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number) for line_number in range(40) ]
+        expected = StringExtractor(False).get_batch(lines)
+        # Evicted entries release their strings, so the table doesn't outgrow the cache
+        extractor = StringExtractor(memory_cache = BoundedCache(max_entries = 1),
+                                    compact_results = True)
+        assert(extractor.get_batch(lines) == expected)
+        assert(extractor.get_memory_statistics()["compact_results"]["results"] <= 1)
+        extractor.invalidate("stringprocessor-testdata.py")
+        assert(extractor.get_memory_statistics()["compact_results"] == { "strings" : 0, "results" : 0 })
+        # Invalidated entries of a dict release their strings as well
+        extractor = StringExtractor(compact_results = True)
+        assert(extractor.get_batch(lines) == expected)
+        assert(extractor.get_batch(lines) == expected)
+        extractor.invalidate("stringprocessor-testdata.py")
+        assert(extractor.get_memory_statistics()["compact_results"] == { "strings" : 0, "results" : 0 })
+        assert(extractor.get_batch(lines) == expected)
+
+    def test_extractor_compact_results(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number) for line_number in range(40) ]
+        expected = StringExtractor(False).get_batch(lines)
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, "cache.pickle")
+            extractor = StringExtractor(True, cache_file, compact_results = True)
+            assert(extractor.get_batch(lines) == expected)
+            # Results are retrieved from the cache in the original format
+            assert(extractor.get_batch(lines) == expected)
+            assert(extractor.get_cache_statistics()["hits"] == len(lines))
+            assert(extractor.get_memory_statistics()["compact_results"]["strings"] > 0)
+            extractor.save()
+            new_extractor = StringExtractor(True, cache_file, compact_results = True)
+            assert(new_extractor.get_batch(lines) == expected)
+            assert(new_extractor.get_cache_statistics()["persistent_hits"] == len(lines))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_vectorized_lookup(self):
+        lines = [ ( "stringprocessor-testdata.py", line_number) for line_number in range(40) ]
+        trace = lines[10:] + lines + lines[:30]
+        expected = StringExtractor(False).get_batch(trace)
+        registry = FileRegistry()
+        lookup = VectorizedLookup(StringExtractor(), registry)
+        (file_ids, line_numbers) = registry.encode_lines(trace)
+        result_ids = lookup.lookup(file_ids, line_numbers)
+        assert([ lookup.get_result(result_id) for result_id in result_ids.tolist() ]
+               == [ result for (filename, line_number, result) in expected ])
+        assert(lookup.collapse(file_ids, line_numbers) == StringExtractor(False).get_batch(trace, True))
+        # Distinct lines are only extracted once
+        assert(lookup.extractor.get_cache_statistics()["misses"] == len(lines))
+        assert(lookup.collapse(file_ids[:0], line_numbers[:0]) == [])
+        with self.assertRaises(ValueError):
+            lookup.lookup( [ 1 ], [ 0 ] )
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_vectorized_lookup_invalidate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as source_file:
+                source_file.write('a = x == "foo"\nb = 1\n')
+            registry = FileRegistry()
+            lookup = VectorizedLookup(StringExtractor(), registry)
+            file_ids = [ registry.get_id(filename) ]
+            assert(lookup.collapse(file_ids, [ 1 ]) == [ ("FULL", "foo") ])
+            with open(filename, "w") as source_file:
+                source_file.write('a = x.startswith("bar")\nb = 1\n')
+            lookup.invalidate(filename)
+            assert(lookup.collapse(file_ids, [ 1 ]) == [ ("PREFIX", "bar") ])
+
+    def test_file_watcher(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as source_file:
+                source_file.write('a = x == "foo"\nb = 1\n')
+            extractor = StringExtractor()
+            assert(extractor.get_batch( [ (filename, 1) ], True ) == [ ("FULL", "foo") ])
+            invalidated = []
+            watcher = FileWatcher(extractor, use_inotify = False, callback = invalidated.append)
+            assert(watcher.check() == [])
+            # Files with lines in the cache are watched
+            assert(watcher.get_statistics()["files"] == 1)
+            with open(filename, "w") as source_file:
+                source_file.write('a = x.startswith("bar")\nb = 1\nc = 2\n')
+            assert(watcher.check() == [ filename ] and invalidated == [ filename ])
+            # The modified file has been indexed again
+            statistics = watcher.get_statistics()
+            assert(statistics["modified_files"] == 1 and statistics["reindexed_lines"] == 3)
+            misses = extractor.get_cache_statistics()["misses"]
+            assert(extractor.get_batch( [ (filename, 1) ], True ) == [ ("PREFIX", "bar") ])
+            assert(extractor.get_cache_statistics()["misses"] == misses)
+            os.remove(filename)
+            assert(watcher.check() == [ filename ])
+            assert(extractor.get_memory_statistics()["cache"]["entries"] == 0)
+            watcher.close()
+
+    def test_file_watcher_background(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as source_file:
+                source_file.write('a = x == "foo"\nb = 1\n')
+            extractor = StringExtractor(thread_safe = True)
+            assert(extractor.get_batch( [ (filename, 1) ], True ) == [ ("FULL", "foo") ])
+            with self.assertRaises(ValueError):
+                StringExtractor().watch_files()
+            watcher = extractor.watch_files(interval = 0.05)
+            watcher.check()
+            # Replace the file, like editors and deployment tools do
+            with open(filename + ".new", "w") as source_file:
+                source_file.write('a = x.startswith("bar")\nb = 1\nc = 2\n')
+            os.replace(filename + ".new", filename)
+            for attempt in range(100):
+                if watcher.get_statistics()["reindexed_lines"] > 0:
+                    break
+                threading.Event().wait(0.05)
+            assert(extractor.get_batch( [ (filename, 1) ], True ) == [ ("PREFIX", "bar") ])
+            extractor.close()
+            assert(extractor.file_watcher == None)
+
+    def test_file_watcher_inotify_new_cached_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as source_file:
+                source_file.write('a = x == "old"\nb = 1\n')
+            extractor = StringExtractor()
+            watcher = FileWatcher(extractor)
+            if watcher.inotify == None:
+                watcher.close()
+                self.skipTest("inotify is not available")
+            # The file is modified after its lines were cached, but before the watcher
+            # watches it, so inotify doesn't report the modification
+            assert(extractor.get_batch( [ (filename, 1) ], True ) == [ ("FULL", "old") ])
+            with open(filename, "w") as source_file:
+                source_file.write('a = x == "new"\nb = 1\nc = 2\n')
+            # As checked after inotify events
+            assert(watcher.check( [] ) == [ filename ])
+            assert(extractor.get_batch( [ (filename, 1) ], True ) == [ ("FULL", "new") ])
+            watcher.close()
+
+    def test_analyze_files_compound_statements(self):
+        extractor = StringExtractor(True, None, True)
+        lines = [ ( "stringprocessor-testdata.py", 26), ( "stringprocessor-testdata.py", 28),
+                  ( "stringprocessor-testdata.py", 30), ( "stringprocessor-testdata.py", 34) ]
+        output = extractor.get_batch(lines)
+        assert(output[0][2] == [ ( "FULL", "bar" ) ])
+        assert(output[1][2] == [ ( "FULL", "baz" ) ])
+        assert(output[2][2] == "IGNORE")
+        assert(output[3][2] == [ ( "FULL", "bat" ) ])
+
+    def test_analyze_files_matches_preprocessor(self):
+        extractor = StringExtractor(False, None, True)
+        lines = [ ( "stringprocessor-testdata.py", line) for line in
+                  [5, 8, 12, 17, 21, 26, 28, 30, 34, 38, 42, 44, 46] ]
+        assert(extractor.get_batch(lines) == StringExtractor(False).get_batch(lines))
+
+    def test_analyze_files_fallback(self):
+        extractor = StringExtractor(False, None, True)
+        output = extractor.get_batch([ ( "stringprocessor-partial-testdata.py", 3),
+                                       ( "testfile_jinja.j2", 1) ])
+        assert(extractor._getFileAnalysis("stringprocessor-partial-testdata.py") is None)
+        assert(output[0][2] == [ ( "FULL", "bar" ) ])
+        assert(output[1][2] == "IGNORE")
+
+    def test_file_metadata(self):
+        metadata = FileMetadataCache().get("stringprocessor-testdata.py")
+        assert(metadata.number_of_lines == 47)
+        assert(metadata.getLine(26) == 'if foo == "bar":')
+        assert(metadata.getLine(48) == "")
+        assert(metadata.source[metadata.getLineOffset(26):].startswith('if foo == "bar":'))
+
+    def test_file_metadata_modified_file(self):
+        cache = FileMetadataCache()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "module.py")
+            with open(filename, "w") as file:
+                file.write("a = 1\n")
+            assert(cache.get(filename).number_of_lines == 1)
+            with open(filename, "w") as file:
+                file.write("a = 1\nb = 2\n")
+            assert(cache.get(filename).number_of_lines == 2)
+
+    def test_file_metadata_eviction(self):
+        cache = FileMetadataCache(max_files = 1)
+        cache.get("stringprocessor-testdata.py")
+        cache.get("testfile_jinja.j2")
+        assert(list(cache.entries) == ["testfile_jinja.j2"])
+        assert(cache.total_bytes == len(cache.entries["testfile_jinja.j2"].source))
+
 if __name__ == '__main__':
     unittest.main()